@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authApp', '0003_userotp_failed_attempts_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notification_optouts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
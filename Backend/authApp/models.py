@@ -34,6 +34,9 @@ class User(AbstractUser,Common):
    gender = models.CharField(max_length=10, null=True, blank=True)
    address = models.JSONField(null=True, blank=True)
    notifications = models.JSONField(null=True, blank=True)
+   # Opted-out (channel, category) bits derived from notifications["channels"];
+   # see serviceApp.services.notification_preferences
+   notification_optouts = models.PositiveIntegerField(default=0)
    
    class Meta:
       permissions = [
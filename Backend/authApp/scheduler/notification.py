@@ -2,15 +2,15 @@ from celery import shared_task
 
 @shared_task
 def send_notification(receiver_id, title, message):
-    from Backend.api.models import Notification, User
+    from authApp.models import User
+    from serviceApp.services.services import NotificationService
     try:
         receiver = User.objects.get(id=receiver_id)
-        notification = Notification.objects.create(
+        NotificationService.create_notification(
             receiver=receiver,
             title=title,
             message=message
         )
-        notification.save()
         return True
     except User.DoesNotExist:
-        return False
\ No newline at end of file
+        return False
@@ -2,6 +2,7 @@ from celery import shared_task
 from django.utils import timezone
 from authApp.services.translate import perform_translation
 from django.conf import settings
+from multiproduct.mailer import send_email_now, queue_email
 
 @shared_task(name="api.tasks.translate_lang.translate_to_all_languages")
 def update_translations_for_model(translated_text_id, source_lang):
@@ -10,7 +11,6 @@ def update_translations_for_model(translated_text_id, source_lang):
 
 @shared_task(queue='high_priority')
 def send_email_otp(email, otp):
-    from django.core.mail import EmailMultiAlternatives
     from django.template.loader import render_to_string
     from django.utils.html import strip_tags
 
@@ -21,18 +21,13 @@ def send_email_otp(email, otp):
     html_content = render_to_string('emails/otp.html', context)
     text_content = strip_tags(html_content)
     
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [email]
-    
-    msg = EmailMultiAlternatives(subject, text_content, from_email, recipient_list)
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    # Low-latency lane: the user is waiting for the code
+    send_email_now(subject, text_content, [email], html_content=html_content)
 
 
 
 @shared_task
 def send_welcome_email(email, first_name, username=None):
-    from django.core.mail import EmailMultiAlternatives
     from django.template.loader import render_to_string
     from django.utils.html import strip_tags
 
@@ -46,17 +41,12 @@ def send_welcome_email(email, first_name, username=None):
     html_content = render_to_string('emails/welcome.html', context)
     text_content = strip_tags(html_content)
     
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [email]
-    
-    msg = EmailMultiAlternatives(subject, text_content, from_email, recipient_list)
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    # Batched lane: delivered with the next mail queue flush
+    queue_email(subject, text_content, [email], html_content=html_content)
 
 
 @shared_task(queue='high_priority')
 def send_password_reset_email(email, reset_url):
-    from django.core.mail import EmailMultiAlternatives
     from django.template.loader import render_to_string
     from django.utils.html import strip_tags
 
@@ -67,12 +57,8 @@ def send_password_reset_email(email, reset_url):
     html_content = render_to_string('emails/password_reset.html', context)
     text_content = strip_tags(html_content)
     
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [email]
-    
-    msg = EmailMultiAlternatives(subject, text_content, from_email, recipient_list)
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    # Low-latency lane: the user is waiting for the link
+    send_email_now(subject, text_content, [email], html_content=html_content)
 
 
 @shared_task
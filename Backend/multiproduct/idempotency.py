@@ -0,0 +1,111 @@
+import uuid
+import hashlib
+import logging
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Responses that must not be replayed: server errors and lost optimistic-concurrency races
+NON_REPLAYABLE_STATUSES = (status.HTTP_409_CONFLICT,)
+
+# Compare-and-delete: only the request holding the token may release the lock
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def idempotent(view_method):
+    """
+    Idempotency-Key support for mutating APIView handlers.
+
+    1. L1: Redis Hit - a stored response for (user, path, key) is replayed without running the view.
+    2. L2: In-flight Guard (SETNX) - a duplicate arriving while the first request runs gets
+       409 with Retry-After at once, rather than holding a sync worker while it waits.
+       The lock holds a per-request token and is released by compare-and-delete, so a
+       request that outlives IDEMPOTENCY_LOCK_TIMEOUT cannot release a duplicate's lock.
+    3. Payload Fingerprint - reusing a key with a different body is rejected instead of replayed.
+
+    Requests without the header are passed straight through.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'success': False,
+                'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the raw body before DRF consumes the stream
+        fingerprint = hashlib.sha256(request.body or b"").hexdigest()
+        user_part = request.user.pk if request.user.is_authenticated else "anon"
+        scope = hashlib.sha256(f"{user_part}:{request.path}:{key}".encode("utf-8")).hexdigest()
+        response_key = f"idem_resp_{scope}"
+        lock_key = f"idem_lock_{scope}"
+
+        stored = cache.get(response_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return Response({
+                'success': False,
+                'error': 'A request with this Idempotency-Key is still being processed'
+            }, status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
+
+        try:
+            # The first request may have stored its response and released the lock in between
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500 and response.status_code not in NON_REPLAYABLE_STATUSES:
+                cache.set(response_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': getattr(response, 'data', None),
+                }, timeout=settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            _release_lock(lock_key, token)
+
+        return response
+
+    return wrapper
+
+
+def _release_lock(lock_key, token):
+    client = getattr(cache, "client", None)
+    if hasattr(client, "get_client"):
+        # django-redis: atomic on the server
+        client.get_client(write=True).eval(
+            RELEASE_LOCK_SCRIPT, 1, client.make_key(lock_key), client.encode(token)
+        )
+    elif cache.get(lock_key) == token:
+        # Local-memory cache (development, tests): per process only
+        cache.delete(lock_key)
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response({
+            'success': False,
+            'error': 'Idempotency-Key was already used with a different request payload'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    return Response(stored['data'], status=stored['status'], headers={REPLAY_HEADER: "true"})
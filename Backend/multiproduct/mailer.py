@@ -0,0 +1,269 @@
+import json
+import time
+import base64
+import uuid
+import smtplib
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+try:
+    import redis
+except ImportError:  # optional: only needed for the batched lane
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "mail:queue"
+PROCESSING_KEY = "mail:processing:{}"
+PROCESSING_INDEX_KEY = "mail:processing"
+FLUSH_PENDING_KEY = "mail_flush_pending"
+
+
+class PersistentConnection:
+    """
+    One SMTP connection kept open between messages, reopened after
+    MAIL_CONNECTION_IDLE_TIMEOUT as SMTP servers drop idle clients.
+    Callers hold `lock` around deliver() when threads share it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._connection = None
+        self._last_used = 0
+
+    def _open(self):
+        idle = time.monotonic() - self._last_used
+        if self._connection is not None and idle > settings.MAIL_CONNECTION_IDLE_TIMEOUT:
+            self.close()
+        if self._connection is None:
+            self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def deliver(self, message):
+        """Send over the open connection, reconnecting once if the server hung up"""
+        for attempt in (1, 2):
+            connection = self._open()
+            try:
+                connection.send_messages([message])
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+
+class Mailer:
+    """
+    Outgoing mail over two persistent connections per worker process, one per
+    lane, so a long flush never holds up an OTP.
+
+    1. Low-latency Lane - send_now() delivers immediately (OTP, password reset).
+    2. Batched Lane - enqueue() appends to a Redis list; flush() drains it in
+       batches through the lane's open connection, one TLS handshake for many
+       messages. A flush is queued as soon as MAIL_BATCH_SIZE messages wait,
+       and Celery Beat flushes every MAIL_FLUSH_INTERVAL seconds for the rest.
+       A flush moves each batch onto its own processing list and removes a
+       message only once it is handled; lists left by a flush that died are
+       put back on the queue after MAIL_PROCESSING_TIMEOUT.
+
+    Without Redis (MAIL_QUEUE_BACKEND=direct) every message takes the low-latency lane.
+    """
+
+    def __init__(self):
+        self.direct = PersistentConnection()
+        self.batched = PersistentConnection()
+        self._redis = None
+
+    def send_now(self, message):
+        with self.direct.lock:
+            self.direct.deliver(message)
+
+    # Batched lane
+
+    def _queue(self):
+        if self._redis is None:
+            if redis is None:
+                raise RuntimeError("redis is required for the batched mail queue")
+            self._redis = redis.Redis.from_url(settings.MAIL_QUEUE_REDIS_URL)
+        return self._redis
+
+    def enqueue(self, message):
+        if settings.MAIL_QUEUE_BACKEND != "redis":
+            return self.send_now(message)
+
+        payload = json.dumps(serialize_message(message))
+        try:
+            queued = self._queue().rpush(QUEUE_KEY, payload)
+        except Exception as e:
+            # Never lose the email: deliver it on its own
+            logger.warning(f"Mail queue unavailable, sending directly: {e}")
+            return self.send_now(message)
+
+        # Batch full: flush now instead of waiting for the next beat
+        if queued >= settings.MAIL_BATCH_SIZE and cache.add(FLUSH_PENDING_KEY, 1, timeout=settings.MAIL_FLUSH_INTERVAL):
+            from serviceApp.tasks.tasks import flush_mail_queue
+            flush_mail_queue.delay()
+
+    def _claim(self, processing, count):
+        """Move up to count messages from the head of the queue onto a processing list"""
+        pipe = self._queue().pipeline(transaction=True)
+        for _ in range(count):
+            pipe.lmove(QUEUE_KEY, processing, "LEFT", "RIGHT")
+        pipe.zadd(PROCESSING_INDEX_KEY, {processing: time.time()})
+        return [json.loads(item) for item in pipe.execute()[:-1] if item is not None]
+
+    def _done(self, processing, requeue=None):
+        """Drop the oldest message of a processing list, queueing requeue in its place"""
+        pipe = self._queue().pipeline(transaction=True)
+        pipe.lpop(processing)
+        if requeue is not None:
+            pipe.rpush(QUEUE_KEY, requeue)
+        pipe.zadd(PROCESSING_INDEX_KEY, {processing: time.time()})
+        pipe.execute()
+
+    def _release(self, processing):
+        """Put what is left on a processing list back at the head of the queue, in order"""
+        client = self._queue()
+        while client.lmove(processing, QUEUE_KEY, "RIGHT", "LEFT") is not None:
+            pass
+        client.zrem(PROCESSING_INDEX_KEY, processing)
+
+    def _recover(self):
+        """Release processing lists whose flush stopped making progress (worker killed)"""
+        stale_before = time.time() - settings.MAIL_PROCESSING_TIMEOUT
+        for processing in self._queue().zrangebyscore(PROCESSING_INDEX_KEY, "-inf", stale_before):
+            self._release(processing.decode("utf-8"))
+
+    def flush(self):
+        """
+        Drain the messages queued when the flush starts, in MAIL_BATCH_SIZE
+        batches over the batched lane's connection. A message that fails goes
+        back to the end of the queue until MAIL_MAX_ATTEMPTS, for a later flush;
+        if the server cannot be reached at all, the rest of the batch is put
+        back untouched and the flush stops.
+
+        Returns:
+            (sent, failed)
+        """
+        if settings.MAIL_QUEUE_BACKEND != "redis":
+            return 0, 0
+
+        cache.delete(FLUSH_PENDING_KEY)
+        sent = failed = 0
+        processing = PROCESSING_KEY.format(uuid.uuid4().hex)
+        with self.batched.lock:
+            self._recover()
+            # Requeued failures land behind this mark and wait for a later flush
+            remaining = self._queue().llen(QUEUE_KEY)
+            try:
+                while remaining > 0:
+                    batch = self._claim(processing, min(settings.MAIL_BATCH_SIZE, remaining))
+                    if not batch:
+                        break
+                    remaining -= len(batch)
+                    unreachable = False
+                    # One at a time on the open connection, so a failure is
+                    # attributed to its own message rather than the whole batch
+                    for index, data in enumerate(batch):
+                        try:
+                            self.batched.deliver(deserialize_message(data))
+                        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                            # The rest stays on the processing list and is released below
+                            logger.warning(f"Mail server unreachable, {len(batch) - index} email(s) put back: {e}")
+                            unreachable = True
+                            break
+                        except Exception as e:
+                            failed += 1
+                            data["attempts"] = data.get("attempts", 0) + 1
+                            if data["attempts"] < settings.MAIL_MAX_ATTEMPTS:
+                                self._done(processing, requeue=json.dumps(data))
+                            else:
+                                logger.error(f"Dropping email '{data['subject']}' to {data['to']} after {data['attempts']} attempts: {e}")
+                                self._done(processing)
+                        else:
+                            sent += 1
+                            self._done(processing)
+                    if unreachable:
+                        break
+            finally:
+                self._release(processing)
+        return sent, failed
+
+
+def serialize_message(message):
+    """
+    Raises:
+        ValueError: an attachment given as a MIME object, which cannot be queued
+    """
+    return {
+        "subject": message.subject,
+        "body": message.body,
+        "from_email": message.from_email,
+        "to": list(message.to),
+        "cc": list(message.cc),
+        "bcc": list(message.bcc),
+        "reply_to": list(message.reply_to),
+        "headers": dict(message.extra_headers),
+        "alternatives": [[content, mimetype] for content, mimetype in getattr(message, "alternatives", [])],
+        "attachments": [serialize_attachment(attachment) for attachment in message.attachments],
+    }
+
+
+def serialize_attachment(attachment):
+    if not isinstance(attachment, tuple):
+        raise ValueError("MIME attachments cannot be queued; attach (filename, content, mimetype) instead")
+    filename, content, mimetype = attachment
+    if isinstance(content, bytes):
+        return [filename, base64.b64encode(content).decode("ascii"), mimetype, True]
+    return [filename, content, mimetype, False]
+
+
+def deserialize_message(data):
+    message = EmailMultiAlternatives(
+        subject=data["subject"],
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+    )
+    for content, mimetype in data["alternatives"]:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype, encoded in data.get("attachments", []):
+        message.attach(filename, base64.b64decode(content) if encoded else content, mimetype)
+    return message
+
+
+mailer = Mailer()
+
+
+def build_email(subject, text_content, recipient_list, html_content=None, from_email=None):
+    message = EmailMultiAlternatives(subject, text_content, from_email or settings.DEFAULT_FROM_EMAIL, recipient_list)
+    if html_content:
+        message.attach_alternative(html_content, "text/html")
+    return message
+
+
+def send_email_now(subject, text_content, recipient_list, html_content=None, from_email=None):
+    """Low-latency lane: delivered before returning"""
+    mailer.send_now(build_email(subject, text_content, recipient_list, html_content, from_email))
+
+
+def queue_email(subject, text_content, recipient_list, html_content=None, from_email=None):
+    """Batched lane: delivered by the next flush"""
+    mailer.enqueue(build_email(subject, text_content, recipient_list, html_content, from_email))
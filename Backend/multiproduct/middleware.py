@@ -1,6 +1,7 @@
 import json
 import logging
 import hashlib
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.core.cache import cache
 from langdetect import detect, LangDetectException
@@ -22,6 +23,10 @@ class LanguageTranslationMiddleware(MiddlewareMixin):
             if request.method not in ("POST", "PUT", "PATCH"):
                 return None
 
+            # Signed webhooks etc.: rewriting the body would break verification
+            if request.path.startswith(tuple(getattr(settings, "TRANSLATION_EXEMPT_PATHS", ()))):
+                return None
+
             # Only handle JSON
             if "application/json" not in request.META.get("CONTENT_TYPE", ""):
                 return None
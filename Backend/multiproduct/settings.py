@@ -87,6 +87,11 @@ MIDDLEWARE = [
     "multiproduct.middleware.LanguageTranslationMiddleware",
 ]
 
+# Raw bodies must reach these views untouched (signed payloads)
+TRANSLATION_EXEMPT_PATHS = (
+    "/api/v1/services/webhooks/",
+)
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',      # GOOGLE
     'social_core.backends.facebook.FacebookOAuth2',  # FACEBOOK
@@ -213,19 +218,58 @@ CELERY_TASK_QUEUES = {
         'exchange': 'high_priority',
         'routing_key': 'high_priority',
     },
+    'documents': {
+        'exchange': 'documents',
+        'routing_key': 'documents',
+    },
 }
 
 #cronjobs for notification
 CELERY_BEAT_SCHEDULE = {
-    "update": {
-        "task": "authApp.scheduler.notification.send_notification",
-        "schedule": timedelta(hours=5),
-        "args": (12,),
-    },
     "cleanup_otps": {
         "task": "authApp.tasks.send_mail_otp.cleanup_expired_otps",
         "schedule": crontab(minute=0, hour='*'),  # Run every hour
     },
+    "subscription_event_partitions": {
+        "task": "serviceApp.tasks.tasks.ensure_subscription_event_partitions",
+        "schedule": crontab(minute=30, hour=3),  # Daily; creates next months' partitions
+    },
+    "notification_partitions": {
+        "task": "serviceApp.tasks.tasks.maintain_notification_partitions",
+        "schedule": crontab(minute=45, hour=3),  # Daily; creates next months', drops expired ones
+    },
+    "notification_digests": {
+        "task": "serviceApp.tasks.tasks.flush_notification_digests",
+        "schedule": timedelta(minutes=1),  # Sends digests whose window has closed
+    },
+    "invoice_reminders": {
+        "task": "serviceApp.tasks.tasks.send_overdue_invoice_reminders",
+        "schedule": crontab(minute=0, hour=9),  # Daily dunning run
+    },
+    "revenue_rollups": {
+        "task": "serviceApp.tasks.tasks.refresh_revenue_rollups",
+        "schedule": crontab(minute='*/15'),  # Incremental; only touched buckets
+    },
+    "payment_reconciliation": {
+        "task": "serviceApp.tasks.tasks.reconcile_payments_nightly",
+        "schedule": crontab(minute=30, hour=2),  # Nightly, full ledger
+    },
+    "mail_queue": {
+        "task": "serviceApp.tasks.tasks.flush_mail_queue",
+        "schedule": timedelta(seconds=int(os.getenv("MAIL_FLUSH_INTERVAL", 10))),  # Size-triggered flushes cover bursts
+    },
+    "payment_webhooks": {
+        "task": "serviceApp.tasks.tasks.process_payment_webhooks",
+        "schedule": timedelta(minutes=1),  # Safety net; the webhook view queues runs itself
+    },
+    "outbox_relay": {
+        "task": "serviceApp.tasks.tasks.relay_outbox",
+        "schedule": timedelta(minutes=1),  # Safety net; each commit queues a relay run
+    },
+    "outbox_purge": {
+        "task": "serviceApp.tasks.tasks.purge_outbox",
+        "schedule": crontab(minute=15, hour=4),  # Daily; drops dispatched messages past retention
+    },
 }
 
 
@@ -240,6 +284,23 @@ EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Batched delivery over one persistent SMTP connection per worker (multiproduct/mailer.py)
+MAIL_QUEUE_BACKEND = os.getenv("MAIL_QUEUE_BACKEND", "redis" if REDIS_URL else "direct")  # direct: every email sent on its own
+MAIL_QUEUE_REDIS_URL = os.getenv("MAIL_QUEUE_REDIS_URL", REDIS_URL)
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 100))  # Queued emails that trigger an immediate flush
+MAIL_FLUSH_INTERVAL = int(os.getenv("MAIL_FLUSH_INTERVAL", 10))  # Seconds; beat flushes whatever is queued
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))  # Per queued email before it is dropped and logged
+MAIL_CONNECTION_IDLE_TIMEOUT = int(os.getenv("MAIL_CONNECTION_IDLE_TIMEOUT", 30))  # Seconds before an idle connection is reopened
+MAIL_PROCESSING_TIMEOUT = int(os.getenv("MAIL_PROCESSING_TIMEOUT", 300))  # Seconds without progress before a dead flush's batch is requeued
+
+# TRANSACTIONAL OUTBOX (tasks and emails recorded in the caller's transaction)
+
+OUTBOX_RELAY_DELAY = int(os.getenv("OUTBOX_RELAY_DELAY", 1))  # Seconds a burst of commits is collected before a relay run
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", 500))  # Messages dispatched per transaction
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))  # Then the message is marked failed
+OUTBOX_RETRY_BACKOFF = int(os.getenv("OUTBOX_RETRY_BACKOFF", 30))  # Seconds, doubled after each failed attempt
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))  # Dispatched messages kept for dedup and auditing
+
 # DJANGO REST FRAMEWORK CONFIG
 
 REST_FRAMEWORK = {
@@ -264,6 +325,80 @@ REST_FRAMEWORK = {
     },
 }
 
+# IDEMPOTENCY KEYS (replay of retried mutating requests)
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 86400))  # Stored responses live for 24 hours
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 60))  # In-flight marker expiry
+
+# SUBSCRIPTION ENGINE
+
+SUBSCRIPTION_BULK_CHUNK_SIZE = int(os.getenv("SUBSCRIPTION_BULK_CHUNK_SIZE", 1000))  # Rows per bulk UPDATE
+
+# PAYMENT GATEWAY
+
+PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "dummy")  # dummy | http
+PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL", "http://127.0.0.1:8089")  # manage.py run_fake_gateway
+PAYMENT_GATEWAY_API_KEY = os.getenv("PAYMENT_GATEWAY_API_KEY", "")
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_CONNECT_TIMEOUT", 2))  # Seconds
+PAYMENT_GATEWAY_READ_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_READ_TIMEOUT", 10))  # Seconds
+PAYMENT_GATEWAY_MAX_RETRIES = int(os.getenv("PAYMENT_GATEWAY_MAX_RETRIES", 2))  # Safe: requests carry Idempotency-Key
+PAYMENT_GATEWAY_BACKOFF = float(os.getenv("PAYMENT_GATEWAY_BACKOFF", 0.2))  # Exponential backoff factor
+PAYMENT_GATEWAY_POOL_SIZE = int(os.getenv("PAYMENT_GATEWAY_POOL_SIZE", 20))  # Keep-alive connections per process
+PAYMENT_CURRENCY = os.getenv("PAYMENT_CURRENCY", "usd")
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "")  # HMAC key; webhooks are rejected while unset
+PAYMENT_WEBHOOK_TOLERANCE = int(os.getenv("PAYMENT_WEBHOOK_TOLERANCE", 300))  # Max signature age in seconds
+PAYMENT_WEBHOOK_BATCH_SIZE = int(os.getenv("PAYMENT_WEBHOOK_BATCH_SIZE", 500))  # Inbox events applied per transaction
+PAYMENT_WEBHOOK_BATCH_DELAY = int(os.getenv("PAYMENT_WEBHOOK_BATCH_DELAY", 2))  # Seconds a burst is collected before a run
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("PAYMENT_WEBHOOK_MAX_ATTEMPTS", 5))  # Then the event is marked failed
+
+# INVOICE PDFS
+
+INVOICE_PDF_ROOT = os.getenv("INVOICE_PDF_ROOT", os.path.join(MEDIA_ROOT, "invoices", "pdf"))  # Content-addressed cache
+INVOICE_PDF_RENDER_LOCK_TIMEOUT = int(os.getenv("INVOICE_PDF_RENDER_LOCK_TIMEOUT", 300))  # Seconds a render stays claimed
+
+# INVOICE REMINDERS
+
+INVOICE_REMINDER_SCHEDULE = sorted(int(day) for day in os.getenv("INVOICE_REMINDER_SCHEDULE", "-3,0,3,7,14").split(","))  # Days relative to due date
+INVOICE_REMINDER_CHUNK_SIZE = int(os.getenv("INVOICE_REMINDER_CHUNK_SIZE", 500))  # Users per batch
+
+# EXPORTS
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))  # Rows per server-side cursor fetch
+
+# REVENUE ROLLUPS
+
+REVENUE_ROLLUP_CHUNK_SIZE = int(os.getenv("REVENUE_ROLLUP_CHUNK_SIZE", 500))  # (date, product) buckets per batch
+REVENUE_ROLLUP_OVERLAP_SECONDS = int(os.getenv("REVENUE_ROLLUP_OVERLAP_SECONDS", 300))  # Re-scan window behind the watermark
+REVENUE_ROLLUP_LOCK_TIMEOUT = int(os.getenv("REVENUE_ROLLUP_LOCK_TIMEOUT", 900))  # Single-runner guard
+
+# NOTIFICATIONS
+
+NOTIFICATION_PAGE_SIZE = int(os.getenv("NOTIFICATION_PAGE_SIZE", 20))  # Default inbox page
+NOTIFICATION_MAX_PAGE_SIZE = int(os.getenv("NOTIFICATION_MAX_PAGE_SIZE", 100))
+NOTIFICATION_UNREAD_CACHE_TTL = int(os.getenv("NOTIFICATION_UNREAD_CACHE_TTL", 86400))  # Counter is recounted after expiry
+NOTIFICATION_RENDER_CACHE_TTL = int(os.getenv("NOTIFICATION_RENDER_CACHE_TTL", 86400))  # Rendered (template, params, language) text
+NOTIFICATION_PREFERENCES_CACHE_TTL = int(os.getenv("NOTIFICATION_PREFERENCES_CACHE_TTL", 86400))  # Mirrored opt-out bitmasks; reloaded after expiry
+NOTIFICATION_BROADCAST_CHUNK_SIZE = int(os.getenv("NOTIFICATION_BROADCAST_CHUNK_SIZE", 5000))  # Users per INSERT ... SELECT
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv("NOTIFICATION_RETENTION_MONTHS", 12))  # Older month partitions are dropped
+NOTIFICATION_PARTITIONS_AHEAD = int(os.getenv("NOTIFICATION_PARTITIONS_AHEAD", 3))  # No DEFAULT partition: inserts need these
+NOTIFICATION_DIGEST_DEFAULT = os.getenv("NOTIFICATION_DIGEST_DEFAULT", "False") in ("True", "true", "1")  # For users without an email_digest preference
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", 900))  # Seconds from a user's first held email to the digest
+NOTIFICATION_DIGEST_FLUSH_BATCH = int(os.getenv("NOTIFICATION_DIGEST_FLUSH_BATCH", 500))  # Users claimed per buffer round trip
+NOTIFICATION_DIGEST_BACKEND = os.getenv("NOTIFICATION_DIGEST_BACKEND", "redis" if REDIS_URL else "memory")  # memory: single process only
+NOTIFICATION_DIGEST_REDIS_URL = os.getenv("NOTIFICATION_DIGEST_REDIS_URL", REDIS_URL)
+
+# REAL-TIME NOTIFICATIONS (SSE, served by the ASGI app)
+
+REALTIME_CHANNEL_LAYER = os.getenv("REALTIME_CHANNEL_LAYER", "redis" if REDIS_URL else "memory")  # memory: single process only
+REALTIME_REDIS_URL = os.getenv("REALTIME_REDIS_URL", REDIS_URL)
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", 100))  # Pending pushes per stream before the oldest is dropped
+NOTIFICATION_STREAM_HEARTBEAT = int(os.getenv("NOTIFICATION_STREAM_HEARTBEAT", 15))  # Seconds; keeps proxies from closing idle streams
+NOTIFICATION_STREAM_MAX_SECONDS = int(os.getenv("NOTIFICATION_STREAM_MAX_SECONDS", 3600))  # Client reconnects and re-authenticates
+
+# PAYMENT RECONCILIATION
+
+RECONCILIATION_CHUNK_SIZE = int(os.getenv("RECONCILIATION_CHUNK_SIZE", 5000))  # Rows per grouped check
+
 # SIMPLE JWT CONFIG
 
 SIMPLE_JWT = {
@@ -286,7 +421,7 @@ if not CORS_ALLOW_ALL_ORIGINS:
 
 CORS_ALLOW_CREDENTIALS = os.getenv("CORS_ALLOW_CREDENTIALS", "True") in ("True", "true", "1")
 CORS_ALLOW_HEADERS = list(
-    os.getenv("CORS_ALLOW_HEADERS", "content-type,authorization,x-csrftoken").split(",")
+    os.getenv("CORS_ALLOW_HEADERS", "content-type,authorization,x-csrftoken,idempotency-key").split(",")
 )
 
 # LOGGING CONFIGURATION
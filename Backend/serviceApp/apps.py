@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ServiceappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'serviceApp'
+
+    def ready(self):
+        from serviceApp import signals  # noqa: F401
@@ -0,0 +1,111 @@
+import time
+import uuid
+import asyncio
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from serviceApp.services.fake_gateway import start_fake_gateway
+from serviceApp.services.gateway import (
+    HTTPPaymentGateway, AsyncHTTPPaymentGateway, PaymentDeclined, PaymentGatewayError, gateway_options
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the checkout payment step against a gateway (optionally an in-process fake) under load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--mode', choices=['sync', 'async'], default='sync',
+                            help="sync: pooled requests.Session on a thread pool; async: httpx on one event loop")
+        parser.add_argument('--url', help="Gateway base URL (defaults to PAYMENT_GATEWAY_URL)")
+        parser.add_argument('--start-fake', action='store_true', help="Start a fake gateway in-process")
+        parser.add_argument('--latency-ms', type=float, default=150)
+        parser.add_argument('--jitter-ms', type=float, default=50)
+        parser.add_argument('--failure-rate', type=float, default=0.0)
+        parser.add_argument('--decline-rate', type=float, default=0.0)
+        parser.add_argument('--amount', default='9.99')
+
+    def handle(self, *args, **options):
+        server = None
+        gateway_kwargs = gateway_options()
+        gateway_kwargs['pool_size'] = options['concurrency']
+
+        if options['start_fake']:
+            server, gateway_kwargs['base_url'] = start_fake_gateway(
+                latency_ms=options['latency_ms'],
+                jitter_ms=options['jitter_ms'],
+                failure_rate=options['failure_rate'],
+                decline_rate=options['decline_rate'],
+            )
+        elif options['url']:
+            gateway_kwargs['base_url'] = options['url']
+
+        amount = Decimal(options['amount'])
+        try:
+            started = time.perf_counter()
+            if options['mode'] == 'async':
+                results = asyncio.run(self.run_async(gateway_kwargs, amount, options))
+            else:
+                results = self.run_sync(gateway_kwargs, amount, options)
+            elapsed = time.perf_counter() - started
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        self.report(results, elapsed, options)
+
+    @staticmethod
+    def charge_once(gateway, amount):
+        started = time.perf_counter()
+        try:
+            gateway.charge(amount, 'usd', 'benchmark', idempotency_key=f"bench_{uuid.uuid4().hex}")
+            outcome = 'succeeded'
+        except PaymentDeclined:
+            outcome = 'declined'
+        except PaymentGatewayError:
+            outcome = 'error'
+        return outcome, time.perf_counter() - started
+
+    def run_sync(self, gateway_kwargs, amount, options):
+        gateway = HTTPPaymentGateway(**gateway_kwargs)
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            return list(pool.map(lambda _: self.charge_once(gateway, amount), range(options['requests'])))
+
+    async def run_async(self, gateway_kwargs, amount, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async with AsyncHTTPPaymentGateway(**gateway_kwargs) as gateway:
+            async def charge_once():
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        await gateway.charge(amount, 'usd', 'benchmark', idempotency_key=f"bench_{uuid.uuid4().hex}")
+                        outcome = 'succeeded'
+                    except PaymentDeclined:
+                        outcome = 'declined'
+                    except PaymentGatewayError:
+                        outcome = 'error'
+                    return outcome, time.perf_counter() - started
+
+            return await asyncio.gather(*[charge_once() for _ in range(options['requests'])])
+
+    def report(self, results, elapsed, options):
+        latencies = sorted(latency for _, latency in results)
+        outcomes = {}
+        for outcome, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f"mode={options['mode']} requests={len(results)} concurrency={options['concurrency']}")
+        self.stdout.write(f"throughput: {len(results) / elapsed:.1f} charges/s over {elapsed:.2f}s")
+        self.stdout.write(
+            f"latency ms: p50={percentile(0.50):.1f} p95={percentile(0.95):.1f} "
+            f"p99={percentile(0.99):.1f} max={latencies[-1] * 1000:.1f}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(outcomes.items()))
+        ))
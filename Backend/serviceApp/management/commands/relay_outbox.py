@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from serviceApp.services.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = "Drain the transactional outbox continuously (a dedicated relay instead of Celery-scheduled runs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the outbox is empty")
+        parser.add_argument('--batch-size', type=int, help="Defaults to OUTBOX_RELAY_BATCH_SIZE")
+        parser.add_argument('--once', action='store_true', help="Drain what is due and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            result = OutboxService.relay(batch_size=options['batch_size'])
+            if any(result.values()):
+                self.stdout.write(
+                    f"dispatched={result['dispatched']} retried={result['retried']} failed={result['failed']}"
+                )
+            if options['once']:
+                return
+            if not result['dispatched']:
+                time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from serviceApp.services.fake_gateway import FakeGatewayServer
+
+
+class Command(BaseCommand):
+    help = "Run a local fake payment gateway that simulates latency, transient failures and declines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency-ms', type=float, default=150, help="Mean response latency")
+        parser.add_argument('--jitter-ms', type=float, default=50, help="Latency standard deviation")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of requests answered 503")
+        parser.add_argument('--decline-rate', type=float, default=0.0, help="Share of charges declined (402)")
+        parser.add_argument('--verbose-requests', action='store_true', help="Log every request")
+
+    def handle(self, *args, **options):
+        server = FakeGatewayServer(
+            (options['host'], options['port']),
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            failure_rate=options['failure_rate'],
+            decline_rate=options['decline_rate'],
+            verbose=options['verbose_requests'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake gateway on http://{options['host']}:{options['port']} "
+            f"(latency {options['latency_ms']}±{options['jitter_ms']}ms, "
+            f"failures {options['failure_rate']:.0%}, declines {options['decline_rate']:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0002_usersubscription_serviceapp__status_e7ea68_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubscription',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Optimistic-concurrency counter, bumped on every state transition'),
+        ),
+    ]
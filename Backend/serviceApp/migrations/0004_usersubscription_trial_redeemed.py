@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_trial_redeemed(apps, schema_editor):
+    """Flag one trial-origin subscription per (user, product) before the constraint is added"""
+    UserSubscription = apps.get_model('serviceApp', 'UserSubscription')
+    trial_rows = UserSubscription.objects.filter(
+        models.Q(status='trial') | models.Q(plan__is_trial=True)
+    ).order_by('user_id', 'product_id', 'created_at').values_list('id', 'user_id', 'product_id')
+
+    seen = set()
+    redeemed_ids = []
+    for sub_id, user_id, product_id in trial_rows.iterator(chunk_size=2000):
+        if (user_id, product_id) not in seen:
+            seen.add((user_id, product_id))
+            redeemed_ids.append(sub_id)
+
+    for start in range(0, len(redeemed_ids), 2000):
+        UserSubscription.objects.filter(
+            id__in=redeemed_ids[start:start + 2000]
+        ).update(trial_redeemed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0003_usersubscription_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubscription',
+            name='trial_redeemed',
+            field=models.BooleanField(default=False, help_text='Set when this subscription started as a trial; kept after upgrade'),
+        ),
+        migrations.RunPython(backfill_trial_redeemed, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usersubscription',
+            constraint=models.UniqueConstraint(condition=models.Q(('trial_redeemed', True)), fields=('user', 'product'), name='unique_trial_per_user_product'),
+        ),
+    ]
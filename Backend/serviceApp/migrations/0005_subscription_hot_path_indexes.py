@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:47
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def expire_duplicate_live_subscriptions(apps, schema_editor):
+    """Keep only the newest live subscription per (user, product) so the unique index can be built"""
+    UserSubscription = apps.get_model('serviceApp', 'UserSubscription')
+    live = UserSubscription.objects.filter(status__in=['active', 'trial'])
+
+    duplicates = live.values('user_id', 'product_id').annotate(n=Count('id')).filter(n__gt=1)
+    for dup in duplicates.iterator():
+        stale_ids = list(
+            live.filter(
+                user_id=dup['user_id'],
+                product_id=dup['product_id']
+            ).order_by('-created_at').values_list('id', flat=True)[1:]
+        )
+        live.filter(id__in=stale_ids).update(status='expired', version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('serviceApp', '0004_usersubscription_trial_redeemed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Superseded by unique_live_subscription_per_product; it also blocked
+        # re-subscribing to the same plan after a cancellation or expiry
+        migrations.AlterUniqueTogether(
+            name='usersubscription',
+            unique_together=set(),
+        ),
+        migrations.RunPython(
+            expire_duplicate_live_subscriptions,
+            migrations.RunPython.noop,
+            atomic=True,
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "unique_live_subscription_per_product" '
+                        'ON "serviceApp_usersubscription" ("user_id", "product_id") '
+                        'WHERE "status" IN (\'active\', \'trial\');',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "unique_live_subscription_per_product";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='usersubscription',
+                    constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['active', 'trial'])), fields=('user', 'product'), name='unique_live_subscription_per_product'),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='usersubscription',
+            index=models.Index(condition=models.Q(('status__in', ['active', 'trial'])), fields=['end_date'], include=('status', 'auto_renew'), name='usersub_live_end_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['user_subscription', 'is_paid'], include=('amount', 'due_date'), name='invoice_sub_paid_idx'),
+        ),
+    ]
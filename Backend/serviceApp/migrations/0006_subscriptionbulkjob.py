@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0005_subscription_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionBulkJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('operation', models.CharField(choices=[('extend', 'Extend End Date'), ('cancel', 'Cancel'), ('change_plan', 'Change Plan'), ('set_auto_renew', 'Set Auto-Renew')], max_length=20)),
+                ('filters', models.JSONField(default=dict, help_text='Selection: product_id, plan_id, status, end_date_from, end_date_to')),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Operation arguments: days, plan_id or auto_renew')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('last_processed_id', models.UUIDField(blank=True, help_text='Keyset cursor, lets a failed job resume', null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subscription_bulk_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+CREATE_PARTITIONED_TABLE = '''
+CREATE TABLE "serviceApp_subscriptionevent" (
+    "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+    "event_type" smallint NOT NULL CHECK ("event_type" >= 0),
+    "from_status" varchar(20) NOT NULL,
+    "to_status" varchar(20) NOT NULL,
+    "end_date" date NULL,
+    "data" jsonb NULL,
+    "created_at" timestamp with time zone NOT NULL,
+    "plan_id" uuid NULL,
+    "product_id" uuid NOT NULL,
+    "subscription_id" uuid NOT NULL,
+    "user_id" uuid NOT NULL,
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
+CREATE TABLE "serviceApp_subscriptionevent_default" PARTITION OF "serviceApp_subscriptionevent" DEFAULT;
+CREATE INDEX "subevent_sub_created_idx" ON "serviceApp_subscriptionevent" ("subscription_id", "created_at");
+CREATE INDEX "subevent_product_type_idx" ON "serviceApp_subscriptionevent" ("product_id", "event_type", "created_at");
+CREATE INDEX "subevent_type_created_idx" ON "serviceApp_subscriptionevent" ("event_type", "created_at");
+'''
+
+
+def create_initial_partitions(apps, schema_editor):
+    from serviceApp.services.partitions import ensure_monthly_partitions
+    ensure_monthly_partitions('serviceApp_subscriptionevent', months_ahead=3)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0006_subscriptionbulkjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Monthly range partitions on created_at; Django only sees a plain table
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=CREATE_PARTITIONED_TABLE,
+                    reverse_sql='DROP TABLE IF EXISTS "serviceApp_subscriptionevent" CASCADE;',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='SubscriptionEvent',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('event_type', models.PositiveSmallIntegerField(choices=[(1, 'Trial Started'), (2, 'Purchased'), (3, 'Upgraded'), (4, 'Renewed'), (5, 'Cancelled'), (6, 'Expired'), (7, 'Extended'), (8, 'Plan Changed'), (9, 'Auto-Renew Changed')])),
+                        ('from_status', models.CharField(blank=True, max_length=20)),
+                        ('to_status', models.CharField(max_length=20)),
+                        ('end_date', models.DateField(blank=True, null=True)),
+                        ('data', models.JSONField(blank=True, null=True)),
+                        ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('plan', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='serviceApp.subscriptionplan')),
+                        ('product', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='serviceApp.product')),
+                        ('subscription', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='serviceApp.usersubscription')),
+                        ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['subscription', 'created_at'], name='subevent_sub_created_idx'), models.Index(fields=['product', 'event_type', 'created_at'], name='subevent_product_type_idx'), models.Index(fields=['event_type', 'created_at'], name='subevent_type_created_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_initial_partitions, migrations.RunPython.noop),
+    ]
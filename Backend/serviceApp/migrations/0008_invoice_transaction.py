@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_invoices_to_transactions(apps, schema_editor):
+    """Resolve the legacy transaction_ref string into the new foreign key in one UPDATE"""
+    Invoice = apps.get_model('serviceApp', 'Invoice')
+    Transaction = apps.get_model('serviceApp', 'Transaction')
+
+    Invoice.objects.filter(transaction__isnull=True, transaction_ref__isnull=False).update(
+        transaction=Subquery(
+            Transaction.objects.filter(transaction_ref=OuterRef('transaction_ref')).values('id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0007_subscriptionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='transaction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='serviceApp.transaction'),
+        ),
+        migrations.RunPython(link_invoices_to_transactions, migrations.RunPython.noop),
+    ]
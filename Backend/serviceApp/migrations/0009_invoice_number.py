@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+# Numbers already issued are derived from creation order; the sequence then
+# continues after the last one so allocation never collides with the backfill
+BACKFILL_INVOICE_NUMBERS = '''
+UPDATE "serviceApp_invoice" AS invoice
+SET "invoice_number" = 'INV-' || to_char(numbered."issued_date", 'YYYYMMDD') || '-' || lpad(numbered.seq::text, GREATEST(6, length(numbered.seq::text)), '0')
+FROM (
+    SELECT "id", "issued_date", row_number() OVER (ORDER BY "created_at", "id") AS seq
+    FROM "serviceApp_invoice"
+) AS numbered
+WHERE invoice."id" = numbered."id";
+
+SELECT setval('serviceapp_invoice_number_seq', GREATEST(count(*), 1), count(*) > 0) FROM "serviceApp_invoice";
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0008_invoice_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='invoice_number',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True),
+        ),
+        migrations.RunSQL(
+            sql='CREATE SEQUENCE IF NOT EXISTS serviceapp_invoice_number_seq;',
+            reverse_sql='DROP SEQUENCE IF EXISTS serviceapp_invoice_number_seq;',
+        ),
+        migrations.RunSQL(BACKFILL_INVOICE_NUMBERS, migrations.RunSQL.noop),
+    ]
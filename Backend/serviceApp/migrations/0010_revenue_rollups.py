@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:01
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Change-feed indexes on the existing invoice/subscription tables are built CONCURRENTLY
+    atomic = False
+
+    dependencies = [
+        ('serviceApp', '0009_invoice_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoiced_count', models.PositiveIntegerField(default=0)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_count', models.PositiveIntegerField(default=0)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['updated_at'], name='invoice_updated_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='usersubscription',
+            index=models.Index(fields=['updated_at'], name='usersub_updated_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='revenuedailyrollup',
+            name='plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='serviceApp.subscriptionplan'),
+        ),
+        migrations.AddField(
+            model_name='revenuedailyrollup',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='serviceApp.product'),
+        ),
+        migrations.AddIndex(
+            model_name='revenuedailyrollup',
+            index=models.Index(fields=['product', 'date'], name='revenue_rollup_product_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='revenuedailyrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'product', 'plan'), name='unique_revenue_rollup_bucket'),
+        ),
+    ]
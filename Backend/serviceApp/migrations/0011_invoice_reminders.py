@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('serviceApp', '0010_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='last_reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='reminder_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Reminder stages already sent (see INVOICE_REMINDER_SCHEDULE)'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['is_paid', 'due_date'], name='invoice_paid_due_idx'),
+        ),
+    ]
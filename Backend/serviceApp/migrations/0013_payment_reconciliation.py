@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:15
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0012_payment_webhook_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date_from', models.DateField(blank=True, help_text='Transactions created / invoices issued from this date; empty = full ledger', null=True)),
+                ('date_to', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('phase', models.CharField(choices=[('transactions', 'Transactions'), ('invoices', 'Invoices')], default='transactions', max_length=20)),
+                ('last_processed_id', models.UUIDField(blank=True, help_text='Keyset cursor within the phase, lets a failed run resume', null=True)),
+                ('transactions_checked', models.PositiveIntegerField(default=0)),
+                ('invoices_checked', models.PositiveIntegerField(default=0)),
+                ('discrepancy_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('started_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reconciliation_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentDiscrepancy',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('amount_mismatch', 'Transaction total differs from its invoices'), ('orphaned_transaction', 'Transaction without invoices'), ('paid_without_transaction', 'Paid invoice without transaction')], max_length=30)),
+                ('transaction_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('invoice_amount', models.DecimalField(blank=True, decimal_places=2, help_text="Sum of the transaction's invoices, or the invoice amount", max_digits=12, null=True)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='discrepancies', to='serviceApp.invoice')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='discrepancies', to='serviceApp.transaction')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discrepancies', to='serviceApp.reconciliationrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'kind'], name='discrepancy_run_kind_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('serviceApp', '0013_payment_reconciliation'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='notification',
+            index=models.Index(fields=['receiver', '-created_at', '-id'], name='notification_inbox_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver'], name='notification_unread_idx'),
+        ),
+    ]
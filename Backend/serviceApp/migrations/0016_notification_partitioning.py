@@ -0,0 +1,120 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+TABLE = 'serviceApp_notification'
+
+# The old table is renamed out of the way, then copied into the partitioned one
+CREATE_PARTITIONED_TABLE = '''
+ALTER TABLE "serviceApp_notification" RENAME TO "serviceApp_notification_unpartitioned";
+ALTER INDEX "serviceApp_notification_pkey" RENAME TO "serviceApp_notification_unpartitioned_pkey";
+CREATE TABLE "serviceApp_notification" (
+    "id" uuid NOT NULL,
+    "created_at" timestamp with time zone NOT NULL,
+    "updated_at" timestamp with time zone NOT NULL,
+    "title" varchar(200) NULL,
+    "message" text NOT NULL,
+    "is_read" boolean NOT NULL,
+    "receiver_id" uuid NOT NULL,
+    "sender_id" uuid NULL,
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
+'''
+
+# Indexes are declared on the parent and created on every partition; indexes
+# and foreign keys come after the copy, so each is built or validated in one pass
+COPY_ROWS_AND_INDEX = '''
+INSERT INTO "serviceApp_notification" ("id", "created_at", "updated_at", "title", "message", "is_read", "receiver_id", "sender_id")
+SELECT "id", "created_at", "updated_at", "title", "message", "is_read", "receiver_id", "sender_id"
+FROM "serviceApp_notification_unpartitioned";
+DROP TABLE "serviceApp_notification_unpartitioned";
+CREATE INDEX "notification_inbox_idx" ON "serviceApp_notification" ("receiver_id", "created_at" DESC, "id" DESC);
+CREATE INDEX "notification_unread_idx" ON "serviceApp_notification" ("receiver_id") WHERE NOT "is_read";
+CREATE INDEX "serviceApp_notification_sender_id_b88f9c31" ON "serviceApp_notification" ("sender_id");
+ALTER TABLE "serviceApp_notification" ADD CONSTRAINT "serviceApp_notification_receiver_id_e5503956_fk_authApp_user_id"
+    FOREIGN KEY ("receiver_id") REFERENCES "authApp_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE "serviceApp_notification" ADD CONSTRAINT "serviceApp_notification_sender_id_b88f9c31_fk_authApp_user_id"
+    FOREIGN KEY ("sender_id") REFERENCES "authApp_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+'''
+
+UNPARTITION = '''
+CREATE TABLE "serviceApp_notification_unpartitioned" (
+    "id" uuid NOT NULL PRIMARY KEY,
+    "created_at" timestamp with time zone NOT NULL,
+    "updated_at" timestamp with time zone NOT NULL,
+    "title" varchar(200) NULL,
+    "message" text NOT NULL,
+    "is_read" boolean NOT NULL,
+    "receiver_id" uuid NOT NULL,
+    "sender_id" uuid NULL
+);
+INSERT INTO "serviceApp_notification_unpartitioned" SELECT "id", "created_at", "updated_at", "title", "message", "is_read", "receiver_id", "sender_id" FROM "serviceApp_notification";
+DROP TABLE "serviceApp_notification" CASCADE;
+ALTER TABLE "serviceApp_notification_unpartitioned" RENAME TO "serviceApp_notification";
+ALTER INDEX "serviceApp_notification_unpartitioned_pkey" RENAME TO "serviceApp_notification_pkey";
+CREATE INDEX "notification_inbox_idx" ON "serviceApp_notification" ("receiver_id", "created_at" DESC, "id" DESC);
+CREATE INDEX "notification_unread_idx" ON "serviceApp_notification" ("receiver_id") WHERE NOT "is_read";
+CREATE INDEX "serviceApp_notification_receiver_id_e5503956" ON "serviceApp_notification" ("receiver_id");
+CREATE INDEX "serviceApp_notification_sender_id_b88f9c31" ON "serviceApp_notification" ("sender_id");
+ALTER TABLE "serviceApp_notification" ADD CONSTRAINT "serviceApp_notification_receiver_id_e5503956_fk_authApp_user_id"
+    FOREIGN KEY ("receiver_id") REFERENCES "authApp_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE "serviceApp_notification" ADD CONSTRAINT "serviceApp_notification_sender_id_b88f9c31_fk_authApp_user_id"
+    FOREIGN KEY ("sender_id") REFERENCES "authApp_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+'''
+
+
+def months_between(earlier, later):
+    return (later.year - earlier.year) * 12 + later.month - earlier.month
+
+
+def partition_notifications(apps, schema_editor):
+    from serviceApp.services.partitions import ensure_monthly_partitions
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_PARTITIONED_TABLE)
+        cursor.execute('SELECT min("created_at"), max("created_at") FROM "serviceApp_notification_unpartitioned"')
+        oldest, newest = cursor.fetchone()
+
+    # No DEFAULT partition (it would stop the planner from scanning months in
+    # order), so every month holding existing rows needs its partition
+    today = timezone.now().date()
+    months_back = max(0, months_between(oldest.date(), today)) if oldest else 0
+    months_ahead = max(3, months_between(today, newest.date())) if newest else 3
+    ensure_monthly_partitions(TABLE, months_ahead=months_ahead, months_back=months_back)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(COPY_ROWS_AND_INDEX)
+
+
+def unpartition_notifications(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(UNPARTITION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0015_notification_broadcast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Monthly range partitions on created_at, primary key (id, created_at);
+        # Django only sees a plain table
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_notifications, unpartition_notifications),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='notification',
+                    name='receiver',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications_received', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
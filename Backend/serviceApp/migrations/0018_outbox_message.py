@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:47
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0017_notification_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('task', 'Celery task'), ('email', 'Email')], max_length=10)),
+                ('task_name', models.CharField(blank=True, help_text='Registered Celery task name, for tasks', max_length=200)),
+                ('payload', models.JSONField(default=dict, help_text='Task: args and kwargs. Email: subject, template_name, context, recipient_list')),
+                ('dedup_key', models.CharField(blank=True, help_text='Set to record a message at most once', max_length=255, null=True, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('dispatched', 'Dispatched'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Not dispatched before; pushed back after a failed attempt')),
+                ('error', models.TextField(blank=True, null=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['available_at', 'id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:57
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('serviceApp', '0018_outbox_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Nullable without a default: adding the column is a metadata-only change
+        migrations.AddField(
+            model_name='usersubscription',
+            name='gateway_charge_id',
+            field=models.CharField(blank=True, help_text='Gateway charge that paid for the current period; matched by charge webhooks', max_length=100, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='usersubscription',
+            index=models.Index(condition=models.Q(('gateway_charge_id__isnull', False)), fields=['gateway_charge_id'], name='usersub_charge_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serviceApp', '0019_usersubscription_gateway_charge_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentdiscrepancy',
+            name='kind',
+            field=models.CharField(choices=[('amount_mismatch', 'Transaction total differs from its invoices'), ('orphaned_transaction', 'Transaction without invoices'), ('paid_without_transaction', 'Paid invoice without transaction'), ('paid_unsettled_transaction', 'Paid invoice whose transaction did not succeed')], max_length=30),
+        ),
+    ]
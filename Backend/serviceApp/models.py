@@ -1,5 +1,6 @@
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser,Group,Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -90,11 +91,42 @@ class UserSubscription(Common):
    end_date = models.DateField()
    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='trial')
    auto_renew = models.BooleanField(default=False)
+   version = models.PositiveIntegerField(default=0, help_text="Optimistic-concurrency counter, bumped on every state transition")
+   trial_redeemed = models.BooleanField(default=False, help_text="Set when this subscription started as a trial; kept after upgrade")
+   gateway_charge_id = models.CharField(max_length=100, null=True, blank=True, help_text="Gateway charge that paid for the current period; matched by charge webhooks")
 
    class Meta:
-      unique_together = ('user', 'product', 'plan')
       indexes = [
           models.Index(fields=['status', 'end_date']),
+          # Expiry / renewal sweeps only ever look at live subscriptions
+          models.Index(
+              fields=['end_date'],
+              condition=models.Q(status__in=['active', 'trial']),
+              include=['status', 'auto_renew'],
+              name='usersub_live_end_date_idx',
+          ),
+          # Change feed for the revenue rollup job (plan changes move invoices between buckets)
+          models.Index(fields=['updated_at'], name='usersub_updated_at_idx'),
+          # charge.failed / charge.refunded webhooks look subscriptions up by charge
+          models.Index(
+              fields=['gateway_charge_id'],
+              condition=models.Q(gateway_charge_id__isnull=False),
+              name='usersub_charge_id_idx',
+          ),
+      ]
+      constraints = [
+          # One trial per (user, product), even after the trial became active
+          models.UniqueConstraint(
+              fields=['user', 'product'],
+              condition=models.Q(trial_redeemed=True),
+              name='unique_trial_per_user_product',
+          ),
+          # At most one live (active or trial) subscription per (user, product)
+          models.UniqueConstraint(
+              fields=['user', 'product'],
+              condition=models.Q(status__in=['active', 'trial']),
+              name='unique_live_subscription_per_product',
+          ),
       ]
       permissions = [
          ("activate_subscription", "Can manually activate a subscription"),
@@ -107,19 +139,125 @@ class UserSubscription(Common):
       return f"{self.user.username} - {self.product.name} ({self.plan.name})"
 
 
+# Subscription Event Log
+class SubscriptionEvent(models.Model):
+   """
+   Append-only history of subscription lifecycle transitions, one row per change.
+   Written in the same transaction as the state change and never updated.
+   In PostgreSQL the table is range-partitioned by month on created_at
+   (primary key is (id, created_at)), so analytics scan only the months they need.
+   """
+   TRIAL_STARTED = 1
+   PURCHASED = 2
+   UPGRADED = 3
+   RENEWED = 4
+   CANCELLED = 5
+   EXPIRED = 6
+   EXTENDED = 7
+   PLAN_CHANGED = 8
+   AUTO_RENEW_CHANGED = 9
+
+   EVENT_TYPE_CHOICES = [
+      (TRIAL_STARTED, 'Trial Started'),
+      (PURCHASED, 'Purchased'),
+      (UPGRADED, 'Upgraded'),
+      (RENEWED, 'Renewed'),
+      (CANCELLED, 'Cancelled'),
+      (EXPIRED, 'Expired'),
+      (EXTENDED, 'Extended'),
+      (PLAN_CHANGED, 'Plan Changed'),
+      (AUTO_RENEW_CHANGED, 'Auto-Renew Changed'),
+   ]
+
+   id = models.BigAutoField(primary_key=True)
+   # No FK constraints: history must outlive the rows it describes and inserts stay cheap
+   subscription = models.ForeignKey(UserSubscription, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='events')
+   user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+   product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+   plan = models.ForeignKey(SubscriptionPlan, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+')
+   event_type = models.PositiveSmallIntegerField(choices=EVENT_TYPE_CHOICES)
+   from_status = models.CharField(max_length=20, blank=True)
+   to_status = models.CharField(max_length=20)
+   end_date = models.DateField(null=True, blank=True)
+   data = models.JSONField(null=True, blank=True)
+   created_at = models.DateTimeField(default=timezone.now)
+
+   class Meta:
+      indexes = [
+         models.Index(fields=['subscription', 'created_at'], name='subevent_sub_created_idx'),
+         models.Index(fields=['product', 'event_type', 'created_at'], name='subevent_product_type_idx'),
+         models.Index(fields=['event_type', 'created_at'], name='subevent_type_created_idx'),
+      ]
+
+   def __str__(self):
+      return f"{self.subscription_id} {self.get_event_type_display()} @ {self.created_at:%Y-%m-%d %H:%M}"
+
+
+# Bulk Subscription Operations
+class SubscriptionBulkJob(Common):
+   """
+   A staff-initiated operation over many subscriptions at once
+   (e.g. extending every active subscriber of a product after an outage).
+   Executed in the background as chunked UPDATEs; progress is tracked here.
+   """
+   OPERATION_CHOICES = [
+      ('extend', 'Extend End Date'),
+      ('cancel', 'Cancel'),
+      ('change_plan', 'Change Plan'),
+      ('set_auto_renew', 'Set Auto-Renew'),
+   ]
+   STATUS_CHOICES = [
+      ('pending', 'Pending'),
+      ('running', 'Running'),
+      ('completed', 'Completed'),
+      ('failed', 'Failed'),
+   ]
+
+   created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='subscription_bulk_jobs')
+   operation = models.CharField(max_length=20, choices=OPERATION_CHOICES)
+   filters = models.JSONField(default=dict, help_text="Selection: product_id, plan_id, status, end_date_from, end_date_to")
+   params = models.JSONField(default=dict, blank=True, help_text="Operation arguments: days, plan_id or auto_renew")
+   status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+   total = models.PositiveIntegerField(default=0)
+   processed = models.PositiveIntegerField(default=0)
+   last_processed_id = models.UUIDField(null=True, blank=True, help_text="Keyset cursor, lets a failed job resume")
+   error = models.TextField(null=True, blank=True)
+   started_at = models.DateTimeField(null=True, blank=True)
+   finished_at = models.DateTimeField(null=True, blank=True)
+
+   def __str__(self):
+      return f"{self.get_operation_display()} ({self.status}) {self.processed}/{self.total}"
+
+
 # Invoice
 class Invoice(Common):
    """
    Invoice for a specific user subscription (per product).
    """
    user_subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, related_name='invoices')
+   invoice_number = models.CharField(max_length=32, unique=True, null=True, blank=True, editable=False)
    amount = models.DecimalField(max_digits=10, decimal_places=2)
    issued_date = models.DateField(auto_now_add=True)
    due_date = models.DateField()
    is_paid = models.BooleanField(default=False)
+   transaction = models.ForeignKey('Transaction', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
    transaction_ref = models.CharField(max_length=100, null=True, blank=True)
+   reminder_count = models.PositiveSmallIntegerField(default=0, help_text="Reminder stages already sent (see INVOICE_REMINDER_SCHEDULE)")
+   last_reminded_at = models.DateTimeField(null=True, blank=True)
    
    class Meta:
+        indexes = [
+            # Covers per-user invoice lookups filtered by paid status
+            models.Index(
+                fields=['user_subscription', 'is_paid'],
+                include=['amount', 'due_date'],
+                name='invoice_sub_paid_idx',
+            ),
+            # Change feed for the revenue rollup job
+            models.Index(fields=['updated_at'], name='invoice_updated_at_idx'),
+            # Daily reminder scan for unpaid invoices by due date
+            models.Index(fields=['is_paid', 'due_date'], name='invoice_paid_due_idx'),
+        ]
         permissions = [
             ("mark_invoice_paid", "Can mark invoice as paid"),
             ("generate_invoice_pdf", "Can generate invoice PDF"),
@@ -127,7 +265,7 @@ class Invoice(Common):
         ]
 
    def __str__(self):
-      return f"Invoice {self.id} - {self.user_subscription.user.username} ({self.user_subscription.product.name})"
+      return f"Invoice {self.invoice_number} - {self.user_subscription.user.username} ({self.user_subscription.product.name})"
 
 
 # Transaction (Optional - Grouped Payment)
@@ -153,21 +291,180 @@ class Transaction(Common):
       return f"{self.transaction_ref} - {self.user.username}"
 
 
+# Revenue rollups
+class RevenueDailyRollup(Common):
+   """
+   Pre-aggregated invoice totals per (issued date, product, plan).
+   Maintained incrementally from invoice changes by a watermark-driven job so
+   finance dashboards read rollup rows instead of scanning invoices.
+   """
+   date = models.DateField()
+   product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='revenue_rollups')
+   plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE, related_name='revenue_rollups')
+   invoiced_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+   invoiced_count = models.PositiveIntegerField(default=0)
+   paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+   paid_count = models.PositiveIntegerField(default=0)
+   outstanding_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+   outstanding_count = models.PositiveIntegerField(default=0)
+
+   class Meta:
+      constraints = [
+         models.UniqueConstraint(fields=['date', 'product', 'plan'], name='unique_revenue_rollup_bucket'),
+      ]
+      indexes = [
+         models.Index(fields=['product', 'date'], name='revenue_rollup_product_idx'),
+      ]
+
+   def __str__(self):
+      return f"{self.date} {self.product_id}/{self.plan_id}: {self.invoiced_amount}"
+
+
+class RollupWatermark(models.Model):
+   """High-water mark of the last processed change for an incremental job"""
+   name = models.CharField(max_length=50, primary_key=True)
+   value = models.DateTimeField(null=True, blank=True)
+   updated_at = models.DateTimeField(auto_now=True)
+
+   def __str__(self):
+      return f"{self.name} @ {self.value}"
+
+
+# Payment gateway webhooks
+class PaymentWebhookEvent(Common):
+   """
+   Inbox of signed gateway webhook events. The webhook endpoint only appends
+   here (INSERT ... ON CONFLICT DO NOTHING on event_id, so redeliveries are
+   dropped) and acknowledges; a batched consumer applies the state changes.
+   """
+   PENDING = 'pending'
+   PROCESSED = 'processed'
+   IGNORED = 'ignored'
+   FAILED = 'failed'
+
+   STATUS_CHOICES = [
+      (PENDING, 'Pending'),
+      (PROCESSED, 'Processed'),
+      (IGNORED, 'Ignored'),
+      (FAILED, 'Failed'),
+   ]
+
+   event_id = models.CharField(max_length=255, unique=True, help_text="Gateway event id, the dedup key")
+   event_type = models.CharField(max_length=100)
+   payload = models.JSONField(default=dict)
+   status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+   attempts = models.PositiveSmallIntegerField(default=0)
+   error = models.TextField(null=True, blank=True)
+   processed_at = models.DateTimeField(null=True, blank=True)
+
+   class Meta:
+      indexes = [
+         models.Index(
+            fields=['created_at', 'id'],
+            name='webhook_pending_idx',
+            condition=models.Q(status='pending')
+         ),
+      ]
+
+   def __str__(self):
+      return f"{self.event_type} {self.event_id} ({self.status})"
+
+
+# Payment reconciliation
+class ReconciliationRun(Common):
+   """
+   One pass of the payment reconciliation job over the ledger (or a date range).
+   Transactions, then paid invoices, are checked in keyset chunks with grouped
+   SQL; each chunk's findings are written with the cursor so a failed run resumes.
+   """
+   STATUS_CHOICES = [
+      ('pending', 'Pending'),
+      ('running', 'Running'),
+      ('completed', 'Completed'),
+      ('failed', 'Failed'),
+   ]
+   PHASE_CHOICES = [
+      ('transactions', 'Transactions'),
+      ('invoices', 'Invoices'),
+   ]
+
+   started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliation_runs')
+   date_from = models.DateField(null=True, blank=True, help_text="Transactions created / invoices issued from this date; empty = full ledger")
+   date_to = models.DateField(null=True, blank=True)
+   status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+   phase = models.CharField(max_length=20, choices=PHASE_CHOICES, default='transactions')
+   last_processed_id = models.UUIDField(null=True, blank=True, help_text="Keyset cursor within the phase, lets a failed run resume")
+   transactions_checked = models.PositiveIntegerField(default=0)
+   invoices_checked = models.PositiveIntegerField(default=0)
+   discrepancy_count = models.PositiveIntegerField(default=0)
+   error = models.TextField(null=True, blank=True)
+   started_at = models.DateTimeField(null=True, blank=True)
+   finished_at = models.DateTimeField(null=True, blank=True)
+
+   def __str__(self):
+      return f"Reconciliation {self.created_at:%Y-%m-%d %H:%M} ({self.status}) {self.discrepancy_count} discrepancies"
+
+
+class PaymentDiscrepancy(Common):
+   """A ledger inconsistency found by a ReconciliationRun"""
+   AMOUNT_MISMATCH = 'amount_mismatch'
+   ORPHANED_TRANSACTION = 'orphaned_transaction'
+   PAID_WITHOUT_TRANSACTION = 'paid_without_transaction'
+   PAID_UNSETTLED_TRANSACTION = 'paid_unsettled_transaction'
+
+   KIND_CHOICES = [
+      (AMOUNT_MISMATCH, 'Transaction total differs from its invoices'),
+      (ORPHANED_TRANSACTION, 'Transaction without invoices'),
+      (PAID_WITHOUT_TRANSACTION, 'Paid invoice without transaction'),
+      (PAID_UNSETTLED_TRANSACTION, 'Paid invoice whose transaction did not succeed'),
+   ]
+
+   run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='discrepancies')
+   kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+   transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='discrepancies')
+   invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='discrepancies')
+   user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+   transaction_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+   invoice_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Sum of the transaction's invoices, or the invoice amount")
+   invoice_count = models.PositiveIntegerField(default=0)
+
+   class Meta:
+      indexes = [
+         models.Index(fields=['run', 'kind'], name='discrepancy_run_kind_idx'),
+      ]
+
+   def __str__(self):
+      return f"{self.get_kind_display()} ({self.transaction_id or self.invoice_id})"
+
+
 # Notification
 class Notification(Common):
    """
    Stores user notifications for events such as renewals,
    payment confirmations, or trial expirations.
+   In PostgreSQL the table is range-partitioned by month on created_at
+   (primary key is (id, created_at)) without a DEFAULT partition, so newest-first
+   inbox pages stop in the latest months and retention drops whole partitions.
    """
-   receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications_received')
+   # Indexed through notification_inbox_idx, whose leading column it is
+   receiver = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='notifications_received')
    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications_sent')
    title = models.CharField(max_length=200,null=True,blank=True)
-   message = models.TextField(max_length=2000)
+   # Empty for templated notifications, rendered at read time from template_key + params
+   message = models.TextField(max_length=2000, blank=True)
+   template_key = models.CharField(max_length=64, null=True, blank=True)
+   params = models.JSONField(null=True, blank=True)
    is_read = models.BooleanField(default=False)
    
    class Meta:
          verbose_name = "Notification"
          verbose_name_plural = "Notifications"
+         indexes = [
+            # Inbox keyset pages: receiver = ? AND (created_at, id) < cursor ORDER BY created_at DESC, id DESC
+            models.Index(fields=['receiver', '-created_at', '-id'], name='notification_inbox_idx'),
+            # Unread recount when the cached counter is cold
+            models.Index(fields=['receiver'], name='notification_unread_idx', condition=models.Q(is_read=False)),
+         ]
          permissions = [
                   ("send_system_notification", "Can send system-wide notifications"),
                   ("delete_user_notification", "Can delete user notifications"),
@@ -177,3 +474,82 @@ class Notification(Common):
    def __str__(self):
       return f"{self.receiver.username} - {self.title}"
   
+
+
+# Notification broadcasts
+class NotificationBroadcast(Common):
+   """
+   A system notification sent to every active user or a segment of them.
+   Fanned out in the background in keyset chunks of users, each chunk one
+   INSERT ... SELECT; progress and the cursor are tracked here.
+   """
+   STATUS_CHOICES = [
+      ('pending', 'Pending'),
+      ('running', 'Running'),
+      ('completed', 'Completed'),
+      ('failed', 'Failed'),
+   ]
+
+   created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='notification_broadcasts')
+   title = models.CharField(max_length=200)
+   message = models.TextField(max_length=2000)
+   segment = models.JSONField(default=dict, blank=True, help_text="Audience: role_id, product_id, subscription_status; empty for all active users")
+   status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+   total = models.PositiveIntegerField(default=0)
+   processed = models.PositiveIntegerField(default=0)
+   last_user_id = models.UUIDField(null=True, blank=True, help_text="Keyset cursor, lets a failed broadcast resume")
+   error = models.TextField(null=True, blank=True)
+   started_at = models.DateTimeField(null=True, blank=True)
+   finished_at = models.DateTimeField(null=True, blank=True)
+
+   def __str__(self):
+      return f"{self.title} ({self.status}) {self.processed}/{self.total}"
+
+
+# Transactional outbox
+class OutboxMessage(Common):
+   """
+   A Celery task or an email recorded in the same transaction as the change
+   that causes it, instead of a .delay() from inside that transaction. Nothing
+   is dispatched for a rolled-back change and nothing is lost while the broker
+   is down; relay_outbox sends committed rows in batches locked with SKIP LOCKED.
+   """
+   PENDING = 'pending'
+   DISPATCHED = 'dispatched'
+   FAILED = 'failed'
+
+   STATUS_CHOICES = [
+      (PENDING, 'Pending'),
+      (DISPATCHED, 'Dispatched'),
+      (FAILED, 'Failed'),
+   ]
+
+   TASK = 'task'
+   EMAIL = 'email'
+
+   KIND_CHOICES = [
+      (TASK, 'Celery task'),
+      (EMAIL, 'Email'),
+   ]
+
+   kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+   task_name = models.CharField(max_length=200, blank=True, help_text="Registered Celery task name, for tasks")
+   payload = models.JSONField(default=dict, help_text="Task: args and kwargs. Email: subject, template_name, context, recipient_list")
+   dedup_key = models.CharField(max_length=255, unique=True, null=True, blank=True, help_text="Set to record a message at most once")
+   status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+   attempts = models.PositiveSmallIntegerField(default=0)
+   available_at = models.DateTimeField(default=timezone.now, help_text="Not dispatched before; pushed back after a failed attempt")
+   error = models.TextField(null=True, blank=True)
+   dispatched_at = models.DateTimeField(null=True, blank=True)
+
+   class Meta:
+      indexes = [
+         models.Index(
+            fields=['available_at', 'id'],
+            name='outbox_pending_idx',
+            condition=models.Q(status='pending')
+         ),
+      ]
+
+   def __str__(self):
+      return f"{self.task_name or self.kind} ({self.status})"
@@ -0,0 +1,32 @@
+from rest_framework.permissions import BasePermission
+
+
+class HasModelPermission(BasePermission):
+    """
+    Grants access to authenticated users holding `required_permission`
+    (superusers pass through Django's has_perm)
+    """
+    required_permission = None
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user
+            and request.user.is_authenticated
+            and request.user.has_perm(self.required_permission)
+        )
+
+
+class CanViewInvoiceSummary(HasModelPermission):
+    required_permission = 'serviceApp.view_invoice_summary'
+
+
+class CanViewTransactionHistory(HasModelPermission):
+    required_permission = 'serviceApp.view_transaction_history'
+
+
+class CanReconcilePayments(HasModelPermission):
+    required_permission = 'serviceApp.reconcile_payments'
+
+
+class CanSendSystemNotification(HasModelPermission):
+    required_permission = 'serviceApp.send_system_notification'
@@ -1,10 +1,15 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
     Product, SubscriptionPlan, UserSubscription, 
-    Invoice, Transaction, Notification
+    Invoice, Transaction, Notification, SubscriptionBulkJob,
+    ReconciliationRun, PaymentDiscrepancy, NotificationBroadcast
 )
+from authApp.models import Role
+from serviceApp.services.notification_preferences import CHANNELS, CATEGORIES
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -87,13 +92,13 @@ class InvoiceSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Invoice
-        fields = ['id', 'user_subscription', 'product_name', 'plan_name', 'amount', 
-                  'issued_date', 'due_date', 'is_paid', 'transaction_ref', 'user_email']
-        read_only_fields = ['id', 'issued_date']
+        fields = ['id', 'invoice_number', 'user_subscription', 'product_name', 'plan_name', 'amount', 
+                  'issued_date', 'due_date', 'is_paid', 'transaction', 'transaction_ref', 'user_email']
+        read_only_fields = ['id', 'invoice_number', 'issued_date', 'transaction']
 
 
 class TransactionSerializer(serializers.ModelSerializer):
-    invoices = InvoiceSerializer(source='invoice_set', many=True, read_only=True)
+    invoices = InvoiceSerializer(many=True, read_only=True)
     
     class Meta:
         model = Transaction
@@ -109,5 +114,231 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ['id', 'receiver', 'receiver_email', 'sender', 'sender_name', 'title', 
-                  'message', 'is_read', 'created_at']
-        read_only_fields = ['id', 'created_at']
+                  'message', 'template_key', 'params', 'is_read', 'created_at']
+        read_only_fields = ['id', 'template_key', 'params', 'created_at']
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    """Selection for bulk mark-read: ids, a cursor (that item and older) or all"""
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False, max_length=1000)
+    before = serializers.CharField(required=False, max_length=200)
+    all = serializers.BooleanField(required=False, default=False)
+    
+    def validate(self, attrs):
+        selectors = [key for key in ('ids', 'before') if attrs.get(key)] + (['all'] if attrs.get('all') else [])
+        if len(selectors) != 1:
+            raise serializers.ValidationError("Provide exactly one of ids, before or all")
+        return attrs
+
+
+class NotificationPreferencesSerializer(serializers.Serializer):
+    """Notification preferences kept in User.notifications; send any of them"""
+    email_digest = serializers.BooleanField(required=False)
+    language = serializers.ChoiceField(choices=[code for code, _ in settings.LANGUAGES], required=False)
+    # {"<channel>": {"<category>": bool}}; categories not sent are left as they are
+    channels = serializers.DictField(
+        child=serializers.DictField(child=serializers.BooleanField(), allow_empty=False),
+        required=False,
+        allow_empty=False
+    )
+    
+    def validate_channels(self, channels):
+        unknown_channels = set(channels) - set(CHANNELS)
+        if unknown_channels:
+            raise serializers.ValidationError(f"Unknown channels: {', '.join(sorted(unknown_channels))}")
+        unknown_categories = {category for categories in channels.values() for category in categories} - set(CATEGORIES)
+        if unknown_categories:
+            raise serializers.ValidationError(f"Unknown categories: {', '.join(sorted(unknown_categories))}")
+        return channels
+    
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Provide email_digest, language or channels")
+        return attrs
+
+
+class NotificationBroadcastSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    
+    ALLOWED_SEGMENT = {'role_id', 'product_id', 'subscription_status'}
+    
+    class Meta:
+        model = NotificationBroadcast
+        fields = ['id', 'title', 'message', 'segment', 'status', 'total', 'processed',
+                  'progress', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['id', 'status', 'total', 'processed', 'error',
+                            'created_at', 'started_at', 'finished_at']
+    
+    def get_progress(self, obj):
+        if obj.total:
+            return round(obj.processed * 100 / obj.total, 2)
+        return 100.0 if obj.status == 'completed' else 0.0
+    
+    def validate_segment(self, segment):
+        segment = segment or {}
+        if not isinstance(segment, dict):
+            raise serializers.ValidationError("Segment must be an object")
+        
+        unknown = set(segment) - self.ALLOWED_SEGMENT
+        if unknown:
+            raise serializers.ValidationError(f"Unknown segment keys: {', '.join(sorted(unknown))}")
+        
+        for key, model in (('role_id', Role), ('product_id', Product)):
+            if segment.get(key):
+                try:
+                    exists = model.objects.filter(id=segment[key]).exists()
+                except DjangoValidationError:
+                    exists = False
+                if not exists:
+                    raise serializers.ValidationError(f"'{key}' does not reference an existing {model.__name__.lower()}")
+        
+        statuses = segment.get('subscription_status')
+        if statuses:
+            statuses = [statuses] if isinstance(statuses, str) else statuses
+            valid = {choice for choice, _ in UserSubscription.STATUS_CHOICES}
+            if not isinstance(statuses, list) or not all(isinstance(status, str) and status in valid for status in statuses):
+                raise serializers.ValidationError(f"'subscription_status' must be among: {', '.join(sorted(valid))}")
+        
+        return segment
+
+
+class SubscriptionBulkFiltersSerializer(serializers.Serializer):
+    product_id = serializers.UUIDField(required=False)
+    plan_id = serializers.UUIDField(required=False)
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=UserSubscription.STATUS_CHOICES),
+        allow_empty=False,
+        required=False
+    )
+    end_date_from = serializers.DateField(required=False)
+    end_date_to = serializers.DateField(required=False)
+    
+    def validate(self, attrs):
+        if attrs.get('end_date_from') and attrs.get('end_date_to') and attrs['end_date_from'] > attrs['end_date_to']:
+            raise serializers.ValidationError("'end_date_from' must not be after 'end_date_to'")
+        return attrs
+
+
+class SubscriptionBulkJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    
+    ALLOWED_FILTERS = {'product_id', 'plan_id', 'status', 'end_date_from', 'end_date_to'}
+    
+    class Meta:
+        model = SubscriptionBulkJob
+        fields = ['id', 'operation', 'filters', 'params', 'status', 'total', 'processed',
+                  'progress', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['id', 'status', 'total', 'processed', 'error',
+                            'created_at', 'started_at', 'finished_at']
+    
+    def get_progress(self, obj):
+        if obj.total:
+            return round(obj.processed * 100 / obj.total, 2)
+        return 100.0 if obj.status == 'completed' else 0.0
+    
+    def validate_filters(self, filters):
+        if not isinstance(filters, dict):
+            raise serializers.ValidationError("Filters must be an object")
+        
+        unknown = set(filters) - self.ALLOWED_FILTERS
+        if unknown:
+            raise serializers.ValidationError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        
+        filters = dict(filters)
+        if isinstance(filters.get('status'), str):
+            filters['status'] = [filters['status']]
+        
+        serializer = SubscriptionBulkFiltersSerializer(data=filters)
+        if not serializer.is_valid():
+            raise serializers.ValidationError(serializer.errors)
+        
+        # Stored as JSON: the job reads back the normalized values
+        return {
+            key: [str(item) for item in value] if isinstance(value, list) else str(value)
+            for key, value in serializer.validated_data.items()
+        }
+    
+    def validate(self, data):
+        filters = data.get('filters') or {}
+        params = data.get('params') or {}
+        
+        if not filters:
+            raise serializers.ValidationError({"filters": "At least one filter is required"})
+        
+        operation = data['operation']
+        if operation == 'extend':
+            days = params.get('days')
+            if not isinstance(days, int) or days <= 0:
+                raise serializers.ValidationError({"params": "'days' must be a positive integer"})
+        
+        elif operation == 'change_plan':
+            try:
+                plan = SubscriptionPlan.objects.filter(id=params.get('plan_id'), is_trial=False).first()
+            except DjangoValidationError:
+                plan = None
+            if not plan:
+                raise serializers.ValidationError({"params": "'plan_id' must reference a non-trial plan"})
+            if filters.get('product_id') and str(plan.product_id) != str(filters['product_id']):
+                raise serializers.ValidationError({"params": "Plan does not belong to the filtered product"})
+        
+        elif operation == 'set_auto_renew':
+            if not isinstance(params.get('auto_renew'), bool):
+                raise serializers.ValidationError({"params": "'auto_renew' must be true or false"})
+        
+        return data
+
+
+class ReconciliationRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationRun
+        fields = ['id', 'date_from', 'date_to', 'status', 'phase', 'transactions_checked',
+                  'invoices_checked', 'discrepancy_count', 'error', 'created_at',
+                  'started_at', 'finished_at']
+        read_only_fields = ['id', 'status', 'phase', 'transactions_checked', 'invoices_checked',
+                            'discrepancy_count', 'error', 'created_at', 'started_at', 'finished_at']
+    
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must be on or before date_to")
+        return attrs
+
+
+class PaymentDiscrepancySerializer(serializers.ModelSerializer):
+    transaction_ref = serializers.CharField(source='transaction.transaction_ref', read_only=True, default=None)
+    invoice_number = serializers.CharField(source='invoice.invoice_number', read_only=True, default=None)
+    
+    class Meta:
+        model = PaymentDiscrepancy
+        fields = ['id', 'kind', 'transaction', 'transaction_ref', 'invoice', 'invoice_number',
+                  'user', 'transaction_amount', 'invoice_amount', 'invoice_count']
+
+
+class ExportFilterSerializer(serializers.Serializer):
+    """Query parameters of the staff invoice / transaction exports"""
+    file_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    compression = serializers.ChoiceField(choices=['gzip'], required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    product_id = serializers.UUIDField(required=False)
+    user_id = serializers.UUIDField(required=False)
+    is_paid = serializers.BooleanField(required=False, allow_null=True)
+    status = serializers.CharField(required=False, max_length=20)
+    
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must be on or before date_to")
+        return attrs
+
+
+class RevenueSummaryQuerySerializer(serializers.Serializer):
+    """Query parameters of the revenue summary"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    product_id = serializers.UUIDField(required=False)
+    plan_id = serializers.UUIDField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'month', 'product', 'plan'], default='day')
+    
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must be on or before date_to")
+        return attrs
@@ -0,0 +1,125 @@
+"""
+Per-user buffers for notification email digests.
+
+Users who opted into digests (User.notifications["email_digest"]) do not get
+one email per notification; their entries are buffered here and a periodic
+flush sends one combined email per user once their window has closed.
+
+- redis:  a list per user (`notif_digest:items:<user id>`) plus one sorted set
+          of users scored by the time their window closes. The window opens
+          with the first buffered entry (ZADD NX) and is claimed by exactly one
+          flusher (ZREM), so concurrent flush tasks never send twice.
+- memory: process-local, for tests and single-process development
+
+Selected by settings.NOTIFICATION_DIGEST_BACKEND.
+"""
+import json
+import threading
+from django.conf import settings
+
+try:
+    import redis
+except ImportError:  # optional: only needed for the redis buffer
+    redis = None
+
+ITEMS_KEY = 'notif_digest:items:{}'
+DUE_KEY = 'notif_digest:due'
+
+
+class ImproperlyConfiguredDigestBuffer(Exception):
+    """Unknown digest backend or a missing optional dependency"""
+
+
+class RedisDigestBuffer:
+
+    def __init__(self, url):
+        if redis is None:
+            raise ImproperlyConfiguredDigestBuffer("redis is required for RedisDigestBuffer")
+        self.client = redis.Redis.from_url(url)
+
+    def add(self, user_id, entry, due_at):
+        """
+        Append an entry; the user's window closes at due_at unless already open
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(ITEMS_KEY.format(user_id), json.dumps(entry, default=str))
+        pipe.zadd(DUE_KEY, {str(user_id): due_at}, nx=True)
+        pipe.execute()
+
+    def claim_due(self, now, limit):
+        """
+        Users whose window closed by now, each handed to exactly one caller
+
+        Returns:
+            List of user ids (str)
+        """
+        candidates = [
+            member.decode('utf-8')
+            for member in self.client.zrangebyscore(DUE_KEY, '-inf', now, start=0, num=limit)
+        ]
+        if not candidates:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in candidates:
+            pipe.zrem(DUE_KEY, user_id)
+        return [user_id for user_id, removed in zip(candidates, pipe.execute()) if removed]
+
+    def take(self, user_ids):
+        """
+        Remove and return the buffered entries of claimed users. Entries added
+        after the claim open a new window, or are taken here if they beat it.
+
+        Returns:
+            {user_id: [entry, ...]}
+        """
+        pipe = self.client.pipeline(transaction=True)
+        for user_id in user_ids:
+            pipe.lrange(ITEMS_KEY.format(user_id), 0, -1)
+            pipe.delete(ITEMS_KEY.format(user_id))
+        results = pipe.execute()
+        return {
+            user_id: [json.loads(item) for item in results[index * 2]]
+            for index, user_id in enumerate(user_ids)
+        }
+
+
+class InMemoryDigestBuffer:
+
+    def __init__(self):
+        self._items = {}
+        self._due = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id, entry, due_at):
+        user_id = str(user_id)
+        with self._lock:
+            self._items.setdefault(user_id, []).append(json.loads(json.dumps(entry, default=str)))
+            self._due.setdefault(user_id, due_at)
+
+    def claim_due(self, now, limit):
+        with self._lock:
+            due = sorted((due_at, user_id) for user_id, due_at in self._due.items() if due_at <= now)[:limit]
+            for _, user_id in due:
+                del self._due[user_id]
+        return [user_id for _, user_id in due]
+
+    def take(self, user_ids):
+        with self._lock:
+            return {user_id: self._items.pop(user_id, []) for user_id in user_ids}
+
+
+_buffer = None
+
+
+def get_digest_buffer():
+    """Process-wide buffer so the Redis connection pool is reused"""
+    global _buffer
+    if _buffer is None:
+        backend = settings.NOTIFICATION_DIGEST_BACKEND
+        if backend == 'redis':
+            _buffer = RedisDigestBuffer(settings.NOTIFICATION_DIGEST_REDIS_URL)
+        elif backend == 'memory':
+            _buffer = InMemoryDigestBuffer()
+        else:
+            raise ImproperlyConfiguredDigestBuffer(f"Unknown NOTIFICATION_DIGEST_BACKEND '{backend}'")
+    return _buffer
@@ -0,0 +1,146 @@
+"""
+Streaming CSV / NDJSON exports of invoices and transactions.
+
+Rows are read as tuples through a server-side cursor (QuerySet.iterator),
+encoded into ~64 KB pieces and optionally gzip-compressed as they are
+produced, so memory stays flat whatever the size of the export. Rows are
+streamed in table order; sorting millions of rows is left to the consumer.
+"""
+import csv
+import json
+import zlib
+from django.db.models import Exists, OuterRef
+from serviceApp.models import Invoice, Transaction
+
+FLUSH_BYTES = 64 * 1024
+
+INVOICE_COLUMNS = [
+    ('id', 'id'),
+    ('invoice_number', 'invoice_number'),
+    ('user_id', 'user_subscription__user_id'),
+    ('user_email', 'user_subscription__user__email'),
+    ('product', 'user_subscription__product__name'),
+    ('plan', 'user_subscription__plan__name'),
+    ('amount', 'amount'),
+    ('issued_date', 'issued_date'),
+    ('due_date', 'due_date'),
+    ('is_paid', 'is_paid'),
+    ('transaction_ref', 'transaction_ref'),
+]
+
+TRANSACTION_COLUMNS = [
+    ('id', 'id'),
+    ('transaction_ref', 'transaction_ref'),
+    ('user_id', 'user_id'),
+    ('user_email', 'user__email'),
+    ('total_amount', 'total_amount'),
+    ('status', 'status'),
+    ('payment_method', 'payment_method'),
+    ('created_at', 'created_at'),
+]
+
+
+def invoice_export_queryset(filters):
+    """
+    Args:
+        filters: dict with optional date_from, date_to (issued date), product_id, user_id, is_paid
+    """
+    queryset = Invoice.objects.all()
+    if filters.get('date_from'):
+        queryset = queryset.filter(issued_date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        queryset = queryset.filter(issued_date__lte=filters['date_to'])
+    if filters.get('product_id'):
+        queryset = queryset.filter(user_subscription__product_id=filters['product_id'])
+    if filters.get('user_id'):
+        queryset = queryset.filter(user_subscription__user_id=filters['user_id'])
+    if filters.get('is_paid') is not None:
+        queryset = queryset.filter(is_paid=filters['is_paid'])
+    return queryset
+
+
+def transaction_export_queryset(filters):
+    """
+    Args:
+        filters: dict with optional date_from, date_to (created date), product_id
+                 (any settled invoice of that product), user_id, status
+    """
+    queryset = Transaction.objects.all()
+    if filters.get('date_from'):
+        queryset = queryset.filter(created_at__date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        queryset = queryset.filter(created_at__date__lte=filters['date_to'])
+    if filters.get('product_id'):
+        # EXISTS rather than a join so a transaction is never emitted twice
+        queryset = queryset.filter(Exists(Invoice.objects.filter(
+            transaction_id=OuterRef('pk'),
+            user_subscription__product_id=filters['product_id']
+        )))
+    if filters.get('user_id'):
+        queryset = queryset.filter(user_id=filters['user_id'])
+    if filters.get('status'):
+        queryset = queryset.filter(status=filters['status'])
+    return queryset
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each row back instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def _encode(rows, headers, file_format):
+    if file_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(headers, row)), default=str) + '\n'
+    else:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def _buffer(pieces):
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, columns, file_format='csv', compression=None, chunk_size=2000):
+    """
+    Lazily encode a queryset as CSV or NDJSON bytes
+
+    Args:
+        queryset: Invoice or Transaction queryset
+        columns: list of (header, lookup) pairs
+        file_format: 'csv' or 'ndjson'
+        compression: None or 'gzip'
+        chunk_size: rows fetched per server-side cursor round trip
+
+    Returns:
+        Generator of bytes for StreamingHttpResponse
+    """
+    headers = [header for header, _ in columns]
+    rows = queryset.order_by().values_list(
+        *[lookup for _, lookup in columns]
+    ).iterator(chunk_size=chunk_size)
+
+    stream = _buffer(_encode(rows, headers, file_format))
+    if compression == 'gzip':
+        stream = _gzip(stream)
+    return stream
@@ -0,0 +1,106 @@
+"""
+Local fake payment gateway for development and load tests.
+
+Speaks the same JSON protocol as HTTPPaymentGateway (POST /charges, POST /refunds)
+and simulates network latency, transient 503s and card declines. Responses are
+remembered per Idempotency-Key, like a real gateway, so client retries are safe.
+Started with `manage.py run_fake_gateway` or in-process by `benchmark_checkout`.
+"""
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse their connections as they would in production
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': 'Invalid JSON'})
+
+        if self.path not in ('/charges', '/refunds'):
+            return self._send(404, {'error': 'Not found'})
+
+        server = self.server
+        key = self.headers.get('Idempotency-Key')
+        if key:
+            with server.lock:
+                stored = server.responses.get(key)
+            if stored is not None:
+                return self._send(*stored)
+
+        latency = max(0.0, random.gauss(server.latency_ms, server.jitter_ms)) / 1000
+        time.sleep(latency)
+
+        roll = random.random()
+        if roll < server.failure_rate:
+            # Transient failure: not remembered, a retry with the same key may succeed
+            return self._send(503, {'error': 'Gateway temporarily unavailable'})
+
+        if self.path == '/charges':
+            if roll < server.failure_rate + server.decline_rate:
+                result = (402, {'error': 'Card declined', 'status': 'declined'})
+            else:
+                result = (200, {
+                    'id': f"ch_{uuid.uuid4().hex[:24]}",
+                    'status': 'succeeded',
+                    'amount': payload.get('amount', 0),
+                    'currency': payload.get('currency'),
+                })
+        else:
+            result = (200, {
+                'id': payload.get('charge'),
+                'status': 'refunded',
+                'amount': payload.get('amount', 0),
+            })
+
+        if key:
+            with server.lock:
+                server.responses[key] = result
+        return self._send(*result)
+
+    def _send(self, status_code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=150, jitter_ms=50, failure_rate=0.0, decline_rate=0.0, verbose=False):
+        super().__init__(address, FakeGatewayHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.verbose = verbose
+        self.responses = {}
+        self.lock = threading.Lock()
+
+
+def start_fake_gateway(host='127.0.0.1', port=0, **options):
+    """
+    Serve the fake gateway from a daemon thread
+
+    Returns:
+        (server, base_url); call server.shutdown() to stop it
+    """
+    server = FakeGatewayServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,319 @@
+"""
+Payment gateway adapters.
+
+SubscriptionService talks to a PaymentGateway; which one is selected by
+settings.PAYMENT_GATEWAY:
+
+- dummy: approves every charge instantly (development default)
+- http:  JSON-over-HTTP gateway (or the local fake started with
+         `manage.py run_fake_gateway`) through a pooled requests.Session with
+         connect/read timeouts and retries with exponential backoff
+
+AsyncHTTPPaymentGateway is the asyncio counterpart built on httpx, used by the
+checkout benchmark to drive many concurrent charges from one process.
+
+Every call carries an Idempotency-Key, so retrying a POST after a timeout can
+never charge twice.
+
+Webhooks sent by the gateway are signed with HMAC-SHA256 over
+"<timestamp>.<raw body>" and carry the header
+`X-Gateway-Signature: t=<unix timestamp>,v1=<hex digest>`.
+"""
+import abc
+import hmac
+import time
+import uuid
+import random
+import hashlib
+import asyncio
+import logging
+from decimal import Decimal
+from django.conf import settings
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # optional: only needed for the async adapter
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class PaymentGatewayError(Exception):
+    """The gateway could not be reached or answered with an error"""
+
+
+class PaymentDeclined(PaymentGatewayError):
+    """The gateway answered and refused the charge"""
+
+
+class ImproperlyConfiguredGateway(PaymentGatewayError):
+    """Unknown adapter or a missing optional dependency"""
+
+
+class ChargeResult:
+    def __init__(self, charge_id, status, amount, raw=None):
+        self.charge_id = charge_id
+        self.status = status
+        self.amount = amount
+        self.raw = raw or {}
+
+    @property
+    def succeeded(self):
+        return self.status == 'succeeded'
+
+    def __repr__(self):
+        return f"ChargeResult({self.charge_id}, {self.status}, {self.amount})"
+
+
+def to_minor_units(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal('1')))
+
+
+class PaymentGateway(abc.ABC):
+    """Adapter interface"""
+
+    @abc.abstractmethod
+    def charge(self, amount, currency, customer_ref, idempotency_key, description=''):
+        """
+        Args:
+            amount: Decimal amount in major units
+            currency: ISO currency code
+            customer_ref: stable id of the paying user
+            idempotency_key: same key => same charge, however often it is sent
+
+        Returns:
+            ChargeResult
+
+        Raises:
+            PaymentDeclined, PaymentGatewayError
+        """
+
+    @abc.abstractmethod
+    def refund(self, charge_id, idempotency_key, amount=None):
+        """
+        Returns:
+            ChargeResult
+
+        Raises:
+            PaymentGatewayError
+        """
+
+
+class DummyPaymentGateway(PaymentGateway):
+    """Approves everything without I/O"""
+
+    def charge(self, amount, currency, customer_ref, idempotency_key, description=''):
+        return ChargeResult(f"dummy_{uuid.uuid4().hex[:16]}", 'succeeded', Decimal(amount))
+
+    def refund(self, charge_id, idempotency_key, amount=None):
+        return ChargeResult(charge_id, 'refunded', amount)
+
+
+class HTTPPaymentGateway(PaymentGateway):
+    """
+    Blocking JSON gateway client. One Session per process keeps TCP/TLS
+    connections alive across requests; the adapter pool bounds concurrency.
+    """
+
+    def __init__(self, base_url, api_key='', connect_timeout=2.0, read_timeout=10.0,
+                 max_retries=2, backoff_factor=0.2, pool_size=20):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'POST']),  # POSTs are idempotent via Idempotency-Key
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def _post(self, path, payload, idempotency_key):
+        try:
+            response = self.session.post(
+                f"{self.base_url}{path}",
+                json=payload,
+                headers={'Idempotency-Key': idempotency_key},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            raise PaymentGatewayError(f"Gateway unreachable: {exc}") from exc
+        return _parse_response(response.status_code, _json_or_empty(response))
+
+    def charge(self, amount, currency, customer_ref, idempotency_key, description=''):
+        return self._post('/charges', {
+            'amount': to_minor_units(amount),
+            'currency': currency,
+            'customer': str(customer_ref),
+            'description': description,
+        }, idempotency_key)
+
+    def refund(self, charge_id, idempotency_key, amount=None):
+        payload = {'charge': charge_id}
+        if amount is not None:
+            payload['amount'] = to_minor_units(amount)
+        return self._post('/refunds', payload, idempotency_key)
+
+
+class AsyncHTTPPaymentGateway:
+    """
+    asyncio counterpart of HTTPPaymentGateway on a shared httpx.AsyncClient.
+    Use as an async context manager so the connection pool is closed.
+    """
+
+    def __init__(self, base_url, api_key='', connect_timeout=2.0, read_timeout=10.0,
+                 max_retries=2, backoff_factor=0.2, pool_size=20):
+        if httpx is None:
+            raise ImproperlyConfiguredGateway("httpx is required for AsyncHTTPPaymentGateway")
+
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        client_kwargs = {
+            'base_url': base_url.rstrip('/'),
+            'headers': {'Authorization': f'Bearer {api_key}'} if api_key else {},
+        }
+        if hasattr(httpx, 'Limits'):
+            client_kwargs['timeout'] = httpx.Timeout(read_timeout, connect=connect_timeout)
+            client_kwargs['limits'] = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        else:  # httpx < 0.18 (pinned by googletrans)
+            client_kwargs['timeout'] = httpx.Timeout(read_timeout, connect_timeout=connect_timeout)
+            client_kwargs['pool_limits'] = httpx.PoolLimits(soft_limit=pool_size, hard_limit=pool_size)
+        self.client = httpx.AsyncClient(**client_kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _post(self, path, payload, idempotency_key):
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(path, json=payload, headers={'Idempotency-Key': idempotency_key})
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return _parse_response(response.status_code, _json_or_empty(response))
+            except httpx.HTTPError as exc:
+                if attempt >= self.max_retries:
+                    raise PaymentGatewayError(f"Gateway unreachable: {exc}") from exc
+            attempt += 1
+            # Exponential backoff with jitter, matching urllib3's schedule for the sync client
+            await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+    async def charge(self, amount, currency, customer_ref, idempotency_key, description=''):
+        return await self._post('/charges', {
+            'amount': to_minor_units(amount),
+            'currency': currency,
+            'customer': str(customer_ref),
+            'description': description,
+        }, idempotency_key)
+
+    async def refund(self, charge_id, idempotency_key, amount=None):
+        payload = {'charge': charge_id}
+        if amount is not None:
+            payload['amount'] = to_minor_units(amount)
+        return await self._post('/refunds', payload, idempotency_key)
+
+
+def _json_or_empty(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _parse_response(status_code, body):
+    if status_code == 402:
+        raise PaymentDeclined(body.get('error', 'Payment declined'))
+    if status_code >= 400:
+        raise PaymentGatewayError(f"Gateway error {status_code}: {body.get('error', '')}")
+    return ChargeResult(
+        body.get('id'),
+        body.get('status', 'succeeded'),
+        Decimal(body.get('amount', 0)) / 100,
+        raw=body,
+    )
+
+
+def sign_webhook(body, secret, timestamp=None):
+    """
+    Signature header value for a webhook body (bytes), as the gateway sends it
+    """
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    digest = hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('ascii') + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_webhook_signature(body, header, secret, tolerance=300):
+    """
+    Check a webhook signature header against the raw request body
+
+    Args:
+        body: raw request body (bytes), before any parsing
+        header: value of the X-Gateway-Signature header
+        secret: shared webhook signing secret
+        tolerance: max age in seconds, rejects replayed deliveries
+
+    Returns:
+        True if the signature is valid and fresh
+    """
+    if not secret or not header:
+        return False
+    try:
+        parts = dict(item.split('=', 1) for item in header.split(','))
+        timestamp = int(parts['t'])
+        signature = parts['v1']
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = sign_webhook(body, secret, timestamp).split('v1=', 1)[1]
+    return hmac.compare_digest(expected, signature)
+
+
+def gateway_options():
+    return {
+        'base_url': settings.PAYMENT_GATEWAY_URL,
+        'api_key': settings.PAYMENT_GATEWAY_API_KEY,
+        'connect_timeout': settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT,
+        'read_timeout': settings.PAYMENT_GATEWAY_READ_TIMEOUT,
+        'max_retries': settings.PAYMENT_GATEWAY_MAX_RETRIES,
+        'backoff_factor': settings.PAYMENT_GATEWAY_BACKOFF,
+        'pool_size': settings.PAYMENT_GATEWAY_POOL_SIZE,
+    }
+
+
+_gateway = None
+
+
+def get_payment_gateway():
+    """Process-wide gateway instance so the HTTP connection pool is reused"""
+    global _gateway
+    if _gateway is None:
+        if settings.PAYMENT_GATEWAY == 'http':
+            _gateway = HTTPPaymentGateway(**gateway_options())
+        elif settings.PAYMENT_GATEWAY == 'dummy':
+            _gateway = DummyPaymentGateway()
+        else:
+            raise ImproperlyConfiguredGateway(f"Unknown PAYMENT_GATEWAY '{settings.PAYMENT_GATEWAY}'")
+    return _gateway
@@ -0,0 +1,148 @@
+"""
+Invoice PDF rendering with a content-addressed disk cache.
+
+A PDF is keyed by the SHA-256 of the data printed on it, so an invoice is only
+re-rendered when something visible on the document changes. Rendering is a
+small dependency-free PDF 1.4 writer (Helvetica, single page) whose output is
+byte-for-byte deterministic for the same input.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from django.conf import settings
+
+# Bump when the page layout changes so cached files are regenerated
+LAYOUT_VERSION = 1
+
+PAGE_WIDTH = 595   # A4 in points
+PAGE_HEIGHT = 842
+
+
+def invoice_document(invoice):
+    """
+    Everything printed on the invoice PDF, as plain strings
+
+    Args:
+        invoice: Invoice with user_subscription__user/product/plan loaded
+    """
+    subscription = invoice.user_subscription
+    user = subscription.user
+    return {
+        'invoice_number': invoice.invoice_number or str(invoice.id),
+        'issued_date': invoice.issued_date.strftime('%Y-%m-%d'),
+        'due_date': invoice.due_date.strftime('%Y-%m-%d'),
+        'customer_name': user.get_full_name or user.username,
+        'customer_email': user.email,
+        'product_name': subscription.product.name,
+        'plan_name': subscription.plan.name,
+        'amount': str(invoice.amount),
+        'is_paid': invoice.is_paid,
+        'transaction_ref': invoice.transaction_ref or '',
+    }
+
+
+def content_digest(document):
+    payload = json.dumps({'layout': LAYOUT_VERSION, 'document': document}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cached_pdf_path(digest):
+    return os.path.join(str(settings.INVOICE_PDF_ROOT), digest[:2], f"{digest}.pdf")
+
+
+def store_pdf(digest, data):
+    """
+    Write the PDF atomically (temp file + rename) so readers never see a partial file
+
+    Returns:
+        Path of the cached PDF
+    """
+    path = cached_pdf_path(digest)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+def _escape(text):
+    text = str(text).encode('cp1252', errors='replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text(x, y, value, size=10, bold=False):
+    font = 'F2' if bold else 'F1'
+    return f"BT /{font} {size} Tf {x} {y} Td ({_escape(value)}) Tj ET"
+
+
+def render_invoice_pdf(document):
+    """
+    Render an invoice document to PDF bytes
+
+    Args:
+        document: dict from invoice_document()
+    """
+    left, right = 50, PAGE_WIDTH - 50
+    status_label = 'PAID' if document['is_paid'] else 'UNPAID'
+
+    ops = [
+        _text(left, 780, 'INVOICE', size=22, bold=True),
+        _text(right - 120, 780, status_label, size=14, bold=True),
+        _text(left, 750, f"Invoice Number: {document['invoice_number']}"),
+        _text(left, 735, f"Issued: {document['issued_date']}"),
+        _text(left, 720, f"Due: {document['due_date']}"),
+        _text(left, 685, 'Bill To', size=12, bold=True),
+        _text(left, 668, document['customer_name']),
+        _text(left, 653, document['customer_email']),
+        f"{left} 620 m {right} 620 l S",
+        _text(left, 605, 'Description', bold=True),
+        _text(right - 100, 605, 'Amount', bold=True),
+        f"{left} 598 m {right} 598 l S",
+        _text(left, 580, f"{document['product_name']} - {document['plan_name']}"),
+        _text(right - 100, 580, f"${document['amount']}"),
+        f"{left} 565 m {right} 565 l S",
+        _text(right - 190, 545, 'Total', size=12, bold=True),
+        _text(right - 100, 545, f"${document['amount']}", size=12, bold=True),
+    ]
+    if document['transaction_ref']:
+        ops.append(_text(left, 510, f"Transaction Reference: {document['transaction_ref']}"))
+
+    stream = "\n".join(ops).encode('latin-1')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>"
+        ).encode('ascii'),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length " + str(len(stream)).encode('ascii') + b" >>\nstream\n" + stream + b"\nendstream",
+    ]
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode('ascii')
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode('ascii')
+
+    return bytes(out)
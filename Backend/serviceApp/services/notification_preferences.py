@@ -0,0 +1,55 @@
+"""
+Per-channel, per-category notification opt-outs as a bitmask.
+
+User.notifications["channels"] holds what the user chose, e.g.
+{"email": {"expiry": false}}; anything not mentioned stays enabled. Fan-out
+cannot afford to parse that JSON for every recipient, so every write also
+stores the opted-out (channel, category) pairs as bits in
+User.notification_optouts and mirrors the value in the cache: a recipient is
+allowed when `notification_optouts & bit(channel, category) = 0`, a test that
+works in SQL and on a cached integer alike. 0 means everything is enabled.
+"""
+
+CHANNELS = ('in_app', 'email')
+
+CATEGORIES = (
+    'subscription',  # purchase and renewal confirmations
+    'expiry',        # subscription expiring soon
+    'announcement',  # broadcasts
+)
+
+
+def bit(channel, category):
+    """
+    Raises:
+        ValueError: unknown channel or category
+    """
+    return 1 << (CHANNELS.index(channel) * len(CATEGORIES) + CATEGORIES.index(category))
+
+
+def optouts_from_preferences(preferences):
+    """
+    Bitmask of the pairs switched off in a User.notifications value
+    """
+    channels = preferences.get('channels') if isinstance(preferences, dict) else None
+    mask = 0
+    if not isinstance(channels, dict):
+        return mask
+    for channel in CHANNELS:
+        categories = channels.get(channel)
+        if not isinstance(categories, dict):
+            continue
+        for category in CATEGORIES:
+            if categories.get(category) is False:
+                mask |= bit(channel, category)
+    return mask
+
+
+def channels_from_optouts(mask):
+    """
+    The full channel x category matrix, True where enabled
+    """
+    return {
+        channel: {category: not mask & bit(channel, category) for category in CATEGORIES}
+        for channel in CHANNELS
+    }
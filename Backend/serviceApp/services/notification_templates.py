@@ -0,0 +1,69 @@
+"""
+Registry of notification templates.
+
+System notifications are stored as a template key plus the params it needs
+(Notification.template_key / Notification.params) instead of rendered text, so
+the same boilerplate is not repeated on every row and a notification can be
+shown in whatever language the reader uses, including languages added later.
+
+Titles and messages are gettext strings with str.format placeholders; their
+translations live in the usual locale catalogs (makemessages / compilemessages).
+Params must be plain JSON values: format amounts and dates before storing them.
+"""
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
+
+
+class UnknownNotificationTemplate(KeyError):
+    """No template registered under the key"""
+
+
+class NotificationTemplate:
+
+    def __init__(self, key, title, message):
+        self.key = key
+        self.title = title
+        self.message = message
+
+    def render(self, params, language):
+        """
+        Returns:
+            (title, message) in the given language
+
+        Raises:
+            KeyError: a placeholder has no param
+        """
+        with translation.override(language):
+            return str(self.title).format_map(params), str(self.message).format_map(params)
+
+
+TEMPLATES = {
+    template.key: template
+    for template in (
+        NotificationTemplate(
+            'subscription.purchased',
+            _('Subscription Purchased - {product}'),
+            _('Your subscription to {product} ({plan}) has been successfully purchased. '
+              'Invoice #{invoice_number} for ${amount} is due on {due_date}.'),
+        ),
+        NotificationTemplate(
+            'subscription.renewed',
+            _('Subscription Renewed - {product}'),
+            _('Your subscription to {product} has been successfully renewed. '
+              'Invoice #{invoice_number} for ${amount} is due on {due_date}.'),
+        ),
+        NotificationTemplate(
+            'subscription.expiring',
+            _('Subscription Expiring Soon - {product}'),
+            _('Your subscription to {product} ({plan}) will expire in {days} days on {end_date}. '
+              'Please renew your subscription to avoid service interruption.'),
+        ),
+    )
+}
+
+
+def get_template(key):
+    try:
+        return TEMPLATES[key]
+    except KeyError:
+        raise UnknownNotificationTemplate(key)
@@ -0,0 +1,117 @@
+"""
+Monthly range-partition management for append-heavy PostgreSQL tables.
+
+Parents are created with PARTITION BY RANGE (created_at) in their migrations,
+optionally with a DEFAULT partition; this module keeps month partitions created
+ahead of time and drops expired ones, which removes a month of rows without
+DELETE, dead tuples or vacuum work.
+All helpers are no-ops on databases other than PostgreSQL.
+"""
+import re
+import logging
+from datetime import date
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value):
+    """First day of the month containing value"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    """Shift a month-start date by a number of months"""
+    month_index = value.year * 12 + (value.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def ensure_monthly_partitions(table, months_ahead=3, months_back=0):
+    """
+    Create missing month partitions of table, from months_back before the
+    current month up to months_ahead after it
+
+    Returns:
+        List of partition names created
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    quote = connection.ops.quote_name
+    current = month_start(timezone.now().date())
+    created = []
+
+    with connection.cursor() as cursor:
+        for offset in range(-months_back, months_ahead + 1):
+            start = add_months(current, offset)
+            end = add_months(start, 1)
+            name = partition_name(table, start)
+
+            cursor.execute("SELECT to_regclass(%s)", [quote(name)])
+            if cursor.fetchone()[0] is not None:
+                continue
+
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            created.append(name)
+
+    if created:
+        logger.info(f"Created partitions for {table}: {', '.join(created)}")
+    return created
+
+
+def monthly_partitions(table):
+    """
+    Month partitions attached to table, oldest first
+
+    Returns:
+        List of (partition name, month start date)
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [connection.ops.quote_name(table)]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def expired_monthly_partitions(table, keep_months):
+    """
+    Partitions holding only months before the last keep_months (current month included)
+    """
+    cutoff = add_months(month_start(timezone.now().date()), -(keep_months - 1))
+    return [name for name, month in monthly_partitions(table) if month < cutoff]
+
+
+def drop_partition(table, name):
+    """
+    Detach a partition and drop it in one short transaction; the parent is
+    locked only for the catalog change, however many rows the partition holds
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}")
+            cursor.execute(f"DROP TABLE {quote(name)}")
+    logger.info(f"Dropped partition {name} of {table}")
+
@@ -0,0 +1,271 @@
+"""
+Real-time fan-out of notifications to connected clients.
+
+Every user has a channel `notifications:<user id>`. Publishers (request
+workers, Celery tasks) call publish() synchronously after commit; the
+Server-Sent Events view subscribes to the channel of the connected user and
+relays whatever arrives. Which transport carries the messages is selected by
+settings.REALTIME_CHANNEL_LAYER:
+
+- redis:  Redis pub/sub, so a notification created in any process reaches the
+          ASGI worker holding the user's stream. Each worker keeps ONE pub/sub
+          connection, subscribed to the channels of its connected users and
+          demultiplexed to local queues, instead of one connection per client.
+- memory: process-local queues, for tests and single-process development
+
+Delivery is best-effort: a client that is offline misses the push and catches
+up from the inbox endpoint, which remains the source of truth.
+"""
+import json
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from django.conf import settings
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # optional: only needed for the redis layer
+    redis = None
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Subscribed for the lifetime of the shared pub/sub connection, so the reader
+# always has a connection to wait on even when no user is connected
+CONTROL_CHANNEL = 'notifications:_layer'
+
+
+class ImproperlyConfiguredChannelLayer(Exception):
+    """Unknown channel layer or a missing optional dependency"""
+
+
+def notification_channel(user_id):
+    return f"notifications:{user_id}"
+
+
+def format_sse(event, data, event_id=None):
+    """One Server-Sent Events frame; data is JSON-encoded on a single line"""
+    frame = f"event: {event}\n"
+    if event_id:
+        frame += f"id: {event_id}\n"
+    return frame + f"data: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    """Messages of one channel for one consumer, decoded from JSON"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def get(self, timeout=None):
+        """
+        Returns:
+            The next message, or None if nothing arrived within timeout seconds
+        """
+        try:
+            data = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return json.loads(data)
+
+
+class InMemoryChannelLayer:
+    """
+    Process-local fan-out. publish() may be called from any thread; each
+    subscriber owns a bounded asyncio queue on its event loop, and a slow
+    consumer loses its oldest pending messages rather than growing without bound.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        """
+        Returns:
+            Number of subscribers the message was handed to
+        """
+        return self.dispatch(channel, json.dumps(message, default=str))
+
+    def publish_many(self, messages):
+        """messages: iterable of (channel, message)"""
+        with self._lock:
+            channels = set(self._subscribers)
+        for channel, message in messages:
+            # Nobody listening in this process: skip the encoding
+            if channel in channels:
+                self.publish(channel, message)
+
+    def dispatch(self, channel, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_dropping_oldest, queue, data)
+            except RuntimeError:  # loop already closed, the stream is going away
+                pass
+        return len(subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(entry)
+        try:
+            yield Subscription(entry[1])
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel)
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+def _put_dropping_oldest(queue, data):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(data)
+
+
+class RedisChannelLayer:
+    """
+    Redis pub/sub. Publishing goes through a pooled blocking client; receiving
+    goes through one asyncio pub/sub connection per process (per event loop),
+    whose reader task hands messages to the local subscribers.
+    """
+
+    def __init__(self, url, queue_size=100):
+        if redis is None:
+            raise ImproperlyConfiguredChannelLayer("redis is required for RedisChannelLayer")
+
+        self.url = url
+        self.publisher = redis.Redis.from_url(url)
+        self.local = InMemoryChannelLayer(queue_size=queue_size)
+        self._loop = None
+        self._client = None
+        self._pubsub = None
+        self._reader = None
+        self._guard = None
+        self._refcounts = {}
+
+    def publish(self, channel, message):
+        """
+        Returns:
+            Number of processes subscribed to the channel
+        """
+        return self.publisher.publish(channel, json.dumps(message, default=str))
+
+    def publish_many(self, messages):
+        """messages: iterable of (channel, message), sent in one pipelined round trip"""
+        pipe = self.publisher.pipeline(transaction=False)
+        for channel, message in messages:
+            pipe.publish(channel, json.dumps(message, default=str))
+        pipe.execute()
+
+    async def _ensure_connection(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (tests): state of the old loop is unusable
+            self._loop = loop
+            self._guard = asyncio.Lock()
+            self._refcounts = {}
+            self._client = aioredis.Redis.from_url(self.url)
+            self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            self._reader = None
+        async with self._guard:
+            if self._reader is None or self._reader.done():
+                await self._pubsub.subscribe(CONTROL_CHANNEL)
+                self._reader = loop.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The pub/sub reconnects and resubscribes on the next read
+                logger.warning(f"Realtime pub/sub read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message.get('type') != 'message':
+                continue
+            channel = message['channel']
+            data = message['data']
+            self.local.dispatch(
+                channel.decode('utf-8') if isinstance(channel, bytes) else channel,
+                data.decode('utf-8') if isinstance(data, bytes) else data,
+            )
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        await self._ensure_connection()
+        async with self.local.subscribe(channel) as subscription:
+            # Reference-counted: several streams of one user share the Redis subscription
+            async with self._guard:
+                self._refcounts[channel] = self._refcounts.get(channel, 0) + 1
+                if self._refcounts[channel] == 1:
+                    await self._pubsub.subscribe(channel)
+            try:
+                yield subscription
+            finally:
+                async with self._guard:
+                    self._refcounts[channel] -= 1
+                    if not self._refcounts[channel]:
+                        del self._refcounts[channel]
+                        try:
+                            await self._pubsub.unsubscribe(channel)
+                        except Exception as e:
+                            logger.warning(f"Realtime unsubscribe from {channel} failed: {e}")
+
+
+_layer = None
+
+
+def get_channel_layer():
+    """Process-wide channel layer so publisher connections are pooled"""
+    global _layer
+    if _layer is None:
+        backend = settings.REALTIME_CHANNEL_LAYER
+        if backend == 'redis':
+            _layer = RedisChannelLayer(settings.REALTIME_REDIS_URL, queue_size=settings.REALTIME_QUEUE_SIZE)
+        elif backend == 'memory':
+            _layer = InMemoryChannelLayer(queue_size=settings.REALTIME_QUEUE_SIZE)
+        else:
+            raise ImproperlyConfiguredChannelLayer(f"Unknown REALTIME_CHANNEL_LAYER '{backend}'")
+    return _layer
+
+
+def publish_notification(user_id, message):
+    """
+    Push a message to the user's channel without ever failing the caller
+
+    Returns:
+        True if the layer accepted it
+    """
+    try:
+        get_channel_layer().publish(notification_channel(user_id), message)
+        return True
+    except Exception as e:
+        logger.warning(f"Realtime publish to user {user_id} failed: {e}")
+        return False
+
+
+def publish_notifications(messages):
+    """
+    publish_notification() for many users at once
+
+    Args:
+        messages: list of (user_id, message)
+    """
+    try:
+        get_channel_layer().publish_many(
+            (notification_channel(user_id), message) for user_id, message in messages
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Realtime publish to {len(messages)} users failed: {e}")
+        return False
@@ -1,14 +1,179 @@
-from django.db import transaction
-from django.utils import timezone
-from datetime import timedelta
+from django.db import transaction, IntegrityError, connection
+from django.db.models import F, Q, Value, Case, When, DateField, IntegerField, ExpressionWrapper, Prefetch, Sum, Count, Exists, OuterRef
+from django.db.models.functions import TruncMonth
+from django.core.cache import cache
+from django.utils import timezone, translation
+from datetime import timedelta, datetime, time
 from decimal import Decimal
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
+import os
+import json
 import uuid
-from serviceApp.models import Invoice, Transaction, Notification,Product, SubscriptionPlan, UserSubscription
+import base64
+import hashlib
+import binascii
+import logging
+import operator
+from functools import reduce
+from serviceApp.services.gateway import get_payment_gateway, PaymentDeclined, PaymentGatewayError
+from serviceApp.services.invoice_pdf import invoice_document, content_digest, cached_pdf_path
+from serviceApp.services.realtime import publish_notification, publish_notifications
+from serviceApp.services.digest import get_digest_buffer
+from serviceApp.services.notification_templates import get_template
+from serviceApp.services.notification_preferences import bit, optouts_from_preferences
+from multiproduct.mailer import mailer
+from serviceApp.services.partitions import ensure_monthly_partitions, expired_monthly_partitions, drop_partition
+from serviceApp.models import Invoice, Transaction, Notification,Product, SubscriptionPlan, UserSubscription, SubscriptionBulkJob, SubscriptionEvent, RevenueDailyRollup, RollupWatermark, PaymentWebhookEvent, ReconciliationRun, PaymentDiscrepancy, NotificationBroadcast, OutboxMessage
+from authApp.models import User, UserRole
 
+logger = logging.getLogger(__name__)
+
+
+def insert_on_conflict_do_nothing(instance):
+    """
+    Insert a model instance with INSERT ... ON CONFLICT DO NOTHING RETURNING pk
+    in a single round trip, letting the table's unique constraints arbitrate.
+
+    Returns True if the row was inserted, False if a constraint rejected it.
+    """
+    meta = instance._meta
+    fields = meta.concrete_fields
+    quote = connection.ops.quote_name
+    
+    columns = ', '.join(quote(f.column) for f in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    values = [f.get_db_prep_save(f.pre_save(instance, True), connection) for f in fields]
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(meta.db_table)} ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(meta.pk.column)}',
+            values
+        )
+        inserted = cursor.fetchone() is not None
+    
+    if inserted:
+        instance._state.adding = False
+        instance._state.db = connection.alias
+    return inserted
+
+
+def record_subscription_event(subscription, event_type, from_status='', data=None):
+    """
+    Append one lifecycle event for a subscription.
+    Call inside the transaction that performed the state change.
+    """
+    return SubscriptionEvent.objects.create(
+        subscription_id=subscription.id,
+        user_id=subscription.user_id,
+        product_id=subscription.product_id,
+        plan_id=subscription.plan_id,
+        event_type=event_type,
+        from_status=from_status,
+        to_status=subscription.status,
+        end_date=subscription.end_date,
+        data=data
+    )
+
+
+class SubscriptionConflictError(ValueError):
+    """
+    Raised when a subscription transition loses an optimistic-concurrency race
+    (the row changed status or version between read and write)
+    """
+
+
+class SubscriptionStateMachine:
+    """
+    Explicit lifecycle for UserSubscription.
+
+    Every transition is a single conditional
+    UPDATE ... WHERE id=? AND status=? AND version=?
+    that writes only the changed columns. No row locks are taken;
+    a concurrent writer that got there first makes the UPDATE match
+    zero rows and the caller gets a SubscriptionConflictError.
+    """
+
+    # action -> (allowed source statuses, target status)
+    TRANSITIONS = {
+        'upgrade': (('trial',), 'active'),
+        'renew': (('trial', 'active', 'expired'), 'active'),
+        'cancel': (('trial', 'active'), 'cancelled'),
+        'expire': (('trial', 'active'), 'expired'),
+    }
+
+    EVENT_TYPES = {
+        'upgrade': SubscriptionEvent.UPGRADED,
+        'renew': SubscriptionEvent.RENEWED,
+        'cancel': SubscriptionEvent.CANCELLED,
+        'expire': SubscriptionEvent.EXPIRED,
+    }
+
+    @staticmethod
+    def can_transition(subscription, action):
+        allowed_from, _ = SubscriptionStateMachine.TRANSITIONS[action]
+        return subscription.status in allowed_from
+
+    @staticmethod
+    def transition(subscription, action, **changes):
+        """
+        Apply a lifecycle transition to a subscription
+
+        Args:
+            subscription: UserSubscription instance as read by the caller
+            action: key of TRANSITIONS ('upgrade', 'renew', 'cancel', 'expire')
+            **changes: extra columns to write alongside the status change
+
+        Returns:
+            The same instance, updated in memory to match the row
+        """
+        allowed_from, to_status = SubscriptionStateMachine.TRANSITIONS[action]
+        if subscription.status not in allowed_from:
+            raise ValueError(
+                f"Cannot {action} a subscription in {subscription.status} status"
+            )
+
+        now = timezone.now()
+        from_status = subscription.status
+        
+        with transaction.atomic():
+            updated = UserSubscription.objects.filter(
+                id=subscription.id,
+                status=from_status,
+                version=subscription.version
+            ).update(
+                status=to_status,
+                version=F('version') + 1,
+                updated_at=now,
+                **changes
+            )
+
+            if not updated:
+                raise SubscriptionConflictError(
+                    "Subscription was modified by another request, please retry"
+                )
+
+            # Mirror the write on the in-memory instance instead of re-reading the row
+            for field, value in changes.items():
+                setattr(subscription, field, value)
+            subscription.status = to_status
+            subscription.version += 1
+            subscription.updated_at = now
+
+            record_subscription_event(
+                subscription,
+                SubscriptionStateMachine.EVENT_TYPES[action],
+                from_status
+            )
+
+            # After the outermost commit, so a concurrent read cannot re-cache the old state
+            user_id = subscription.user_id
+            transaction.on_commit(lambda: SubscriptionService.invalidate_subscription_cache(user_id))
+
+        return subscription
 
 
 class SubscriptionService:
@@ -16,6 +181,18 @@ class SubscriptionService:
     Handles all subscription-related business logic
     """
     
+    @staticmethod
+    def subscription_cache_key(user_id):
+        return f"user_subs_{user_id}"
+    
+    @staticmethod
+    def invalidate_subscription_cache(*user_ids):
+        """
+        Drop cached subscription lists for the given users in one round trip
+        """
+        if user_ids:
+            cache.delete_many([SubscriptionService.subscription_cache_key(uid) for uid in user_ids])
+    
     @staticmethod
     def check_existing_subscription(user, product):
         """
@@ -34,36 +211,55 @@ class SubscriptionService:
         """
         return start_date + timedelta(days=duration_days)
     
+    @staticmethod
+    def trial_plan_cache_key(product_id):
+        return f"trial_plan_{product_id}"
+    
+    @staticmethod
+    def invalidate_trial_plan_cache(product_id):
+        """Drop a product's cached trial plan once the surrounding transaction commits"""
+        key = SubscriptionService.trial_plan_cache_key(product_id)
+        transaction.on_commit(lambda: cache.delete(key))
+    
+    @staticmethod
+    def get_trial_plan(product):
+        """
+        Resolve the trial plan of a product from the per-product cache.
+        The plan table is only touched on a cache miss (once per product per hour);
+        saving or deleting a plan of the product invalidates the entry (serviceApp.signals).
+        """
+        cache_key = SubscriptionService.trial_plan_cache_key(product.id)
+        trial_plan = cache.get(cache_key)
+        
+        if trial_plan is None:
+            trial_plan, _ = SubscriptionPlan.objects.get_or_create(
+                product=product,
+                is_trial=True,
+                defaults={
+                    'name': f'{product.name} Trial',
+                    'plan_type': 'weekly',
+                    'duration_days': product.trial_duration,
+                    'price': Decimal('0.00'),
+                    'discount': None
+                }
+            )
+            cache.set(cache_key, trial_plan, timeout=3600)
+        
+        # Reuse the caller's product so serializers don't refetch it
+        trial_plan.product = product
+        return trial_plan
+    
     @staticmethod
     def create_trial_subscription(user, product):
         """
-        Create a trial subscription for a product
+        Create a trial subscription for a product.
+        A single guarded INSERT: the unique_trial_per_user_product constraint
+        rejects repeat trials, including trials that were later upgraded.
         """
         if not product.trial_duration:
             raise ValueError("Product does not offer trial period")
         
-        # Check if user already had a trial
-        previous_trial = UserSubscription.objects.filter(
-            user=user,
-            product=product,
-            status='trial'
-        ).exists()
-        
-        if previous_trial:
-            raise ValueError("User already used trial for this product")
-        
-        # Get or create trial plan
-        trial_plan, _ = SubscriptionPlan.objects.get_or_create(
-            product=product,
-            is_trial=True,
-            defaults={
-                'name': f'{product.name} Trial',
-                'plan_type': 'weekly',
-                'duration_days': product.trial_duration,
-                'price': Decimal('0.00'),
-                'discount': None
-            }
-        )
+        trial_plan = SubscriptionService.get_trial_plan(product)
         
         start_date = timezone.now().date()
         end_date = SubscriptionService.calculate_end_date(
@@ -71,20 +267,32 @@ class SubscriptionService:
             product.trial_duration
         )
         
-        subscription = UserSubscription.objects.create(
+        subscription = UserSubscription(
             user=user,
             product=product,
             plan=trial_plan,
             start_date=start_date,
             end_date=end_date,
             status='trial',
-            auto_renew=False
+            auto_renew=False,
+            trial_redeemed=True
         )
         
+        with transaction.atomic():
+            inserted = insert_on_conflict_do_nothing(subscription)
+            if inserted:
+                record_subscription_event(subscription, SubscriptionEvent.TRIAL_STARTED)
+        
+        if not inserted:
+            # Only the failure path pays for working out which constraint fired
+            if UserSubscription.objects.filter(user=user, product=product, trial_redeemed=True).exists():
+                raise ValueError("User already used trial for this product")
+            raise ValueError("User already has an active subscription for this product")
+        
+        SubscriptionService.invalidate_subscription_cache(user.id)
         return subscription
     
     @staticmethod
-    @transaction.atomic
     def purchase_subscription(user, product, plan, auto_renew=False):
         """
         Main method to purchase a subscription
@@ -93,21 +301,25 @@ class SubscriptionService:
         - Existing subscription handling
         - Payment processing
         - Subscription creation
-        """
         
-        # Check for existing active subscription
+        The gateway is called before any transaction is opened; the insert that
+        follows is short. If a concurrent request wins the race for the
+        subscription in between, the charge is refunded.
+        """
         existing = SubscriptionService.check_existing_subscription(user, product)
-        
-        if existing:
+        if existing is not None:
             if existing.status == 'trial':
                 # Upgrade from trial to paid
                 return SubscriptionService.upgrade_from_trial(
                     existing, plan, auto_renew
                 )
-            else:
-                raise ValueError(
-                    f"User already has an {existing.status} subscription for this product"
-                )
+            raise ValueError(
+                f"User already has an {existing.status} subscription for this product"
+            )
+        
+        charge = SubscriptionService.process_payment(user, plan)
+        if charge is None:
+            raise ValueError("Payment processing failed")
         
         # Calculate dates
         start_date = timezone.now().date()
@@ -116,33 +328,49 @@ class SubscriptionService:
             plan.duration_days
         )
         
-        # TODO: Process payment here
-        payment_successful = SubscriptionService.process_payment(user, plan)
-        
-        if not payment_successful:
-            raise ValueError("Payment processing failed")
-        
-        # Create subscription
-        subscription = UserSubscription.objects.create(
+        # Single round trip: unique_live_subscription_per_product rejects the
+        # insert when the user already has an active or trial subscription
+        subscription = UserSubscription(
             user=user,
             product=product,
             plan=plan,
             start_date=start_date,
             end_date=end_date,
             status='active',
-            auto_renew=auto_renew
+            auto_renew=auto_renew,
+            gateway_charge_id=charge.charge_id
         )
         
-        # TODO: Send confirmation email
-        from .tasks import send_subscription_confirmation
-        send_subscription_confirmation.delay(subscription.id)
+        with transaction.atomic():
+            inserted = insert_on_conflict_do_nothing(subscription)
+            if inserted:
+                record_subscription_event(
+                    subscription,
+                    SubscriptionEvent.PURCHASED,
+                    data={'charge_id': charge.charge_id}
+                )
+                # Committed together with the subscription
+                from ..tasks.tasks import send_subscription_confirmation
+                OutboxService.enqueue_task(
+                    send_subscription_confirmation,
+                    args=[str(subscription.id)],
+                    dedup_key=f"subscription_confirmation_{subscription.id}"
+                )
+        
+        if not inserted:
+            # A concurrent purchase or trial start got there after our check
+            SubscriptionService.refund_payment(charge)
+            raise SubscriptionConflictError(
+                "Subscription was modified by another request, please retry"
+            )
+        
+        SubscriptionService.invalidate_subscription_cache(user.id)
         
         # TODO: Trigger webhooks/events
         
         return subscription
     
     @staticmethod
-    @transaction.atomic
     def upgrade_from_trial(trial_subscription, new_plan, auto_renew=False):
         """
         Upgrade a trial subscription to a paid plan
@@ -150,13 +378,13 @@ class SubscriptionService:
         if trial_subscription.status != 'trial':
             raise ValueError("Can only upgrade from trial status")
         
-        # Process payment
-        payment_successful = SubscriptionService.process_payment(
+        # Process payment (outside any transaction)
+        charge = SubscriptionService.process_payment(
             trial_subscription.user, 
             new_plan
         )
         
-        if not payment_successful:
+        if charge is None:
             raise ValueError("Payment processing failed")
         
         # Update subscription
@@ -166,38 +394,66 @@ class SubscriptionService:
             new_plan.duration_days
         )
         
-        trial_subscription.plan = new_plan
-        trial_subscription.start_date = start_date
-        trial_subscription.end_date = end_date
-        trial_subscription.status = 'active'
-        trial_subscription.auto_renew = auto_renew
-        trial_subscription.save()
-        
-        return trial_subscription
+        try:
+            return SubscriptionStateMachine.transition(
+                trial_subscription,
+                'upgrade',
+                plan=new_plan,
+                start_date=start_date,
+                end_date=end_date,
+                auto_renew=auto_renew,
+                gateway_charge_id=charge.charge_id
+            )
+        except SubscriptionConflictError:
+            SubscriptionService.refund_payment(charge)
+            raise
     
     @staticmethod
     def process_payment(user, plan):
         """
-        Process payment for subscription
-        Integrate with payment gateway (Stripe, PayPal, etc.)
+        Charge the plan price through the configured payment gateway
+        (settings.PAYMENT_GATEWAY). Must not be called inside transaction.atomic:
+        no DB transaction or row lock may be held across the network call.
+        
+        Returns:
+            ChargeResult if the charge succeeded, None if it was declined or failed
         """
-        # TODO: Implement actual payment gateway integration
-        # This is a placeholder
-        amount = plan.final_price
+        if connection.in_atomic_block:
+            logger.warning("Payment gateway called inside a database transaction")
         
-        # Example integration structure:
-        # try:
-        #     charge = stripe.Charge.create(
-        #         amount=int(amount * 100),
-        #         currency='usd',
-        #         customer=user.stripe_customer_id,
-        #         description=f'Subscription for {plan.product.name}'
-        #     )
-        #     return charge.paid
-        # except stripe.error.CardError:
-        #     return False
+        try:
+            charge = get_payment_gateway().charge(
+                amount=plan.final_price,
+                currency=settings.PAYMENT_CURRENCY,
+                customer_ref=user.id,
+                # One key per attempt; the HTTP client reuses it across its own retries
+                idempotency_key=f"charge_{uuid.uuid4().hex}",
+                description=f'Subscription for {plan.product.name}'
+            )
+        except PaymentDeclined as e:
+            logger.info(f"Payment declined for user {user.id}: {str(e)}")
+            return None
+        except PaymentGatewayError as e:
+            logger.error(f"Payment gateway error for user {user.id}: {str(e)}")
+            return None
         
-        return True  # Placeholder
+        return charge if charge.succeeded else None
+    
+    @staticmethod
+    def refund_payment(charge):
+        """
+        Refund a charge whose subscription change lost a race. Failures are
+        logged for manual follow-up rather than raised over the original error.
+        """
+        try:
+            get_payment_gateway().refund(
+                charge.charge_id,
+                idempotency_key=f"refund_{charge.charge_id}"
+            )
+            return True
+        except PaymentGatewayError as e:
+            logger.error(f"Refund of charge {charge.charge_id} failed: {str(e)}")
+            return False
     
     @staticmethod
     @transaction.atomic
@@ -208,22 +464,21 @@ class SubscriptionService:
         if subscription.status not in ['active', 'trial']:
             raise ValueError("Can only cancel active or trial subscriptions")
         
-        subscription.status = 'cancelled'
-        subscription.auto_renew = False
-        subscription.save()
+        SubscriptionStateMachine.transition(
+            subscription,
+            'cancel',
+            auto_renew=False
+        )
         
         # TODO: Process refund if applicable
         
          # Send cancellation confirmation
-        from .tasks import send_cancellation_confirmation
-        send_cancellation_confirmation.delay(subscription.id)
-        
-        # TODO: Send cancellation email
+        from ..tasks.tasks import send_cancellation_confirmation
+        OutboxService.enqueue_task(send_cancellation_confirmation, args=[str(subscription.id)])
         
         return subscription
     
     @staticmethod
-    @transaction.atomic
     def renew_subscription(subscription):
         """
         Renew an expired subscription or process auto-renewal
@@ -231,13 +486,16 @@ class SubscriptionService:
         if subscription.status == 'cancelled':
             raise ValueError("Cannot renew cancelled subscription")
         
-        # Process payment
-        payment_successful = SubscriptionService.process_payment(
+        if not SubscriptionStateMachine.can_transition(subscription, 'renew'):
+            raise ValueError(f"Cannot renew {subscription.status} subscription")
+        
+        # Process payment (outside any transaction)
+        charge = SubscriptionService.process_payment(
             subscription.user, 
             subscription.plan
         )
         
-        if not payment_successful:
+        if charge is None:
             raise ValueError("Payment processing failed")
         
         # Extend subscription
@@ -247,12 +505,17 @@ class SubscriptionService:
             subscription.plan.duration_days
         )
         
-        subscription.start_date = new_start
-        subscription.end_date = new_end
-        subscription.status = 'active'
-        subscription.save()
-        
-        return subscription
+        try:
+            return SubscriptionStateMachine.transition(
+                subscription,
+                'renew',
+                start_date=new_start,
+                end_date=new_end,
+                gateway_charge_id=charge.charge_id
+            )
+        except SubscriptionConflictError:
+            SubscriptionService.refund_payment(charge)
+            raise
     
     @staticmethod
     def check_and_expire_subscriptions():
@@ -268,26 +531,221 @@ class SubscriptionService:
         )
         
         for subscription in expired_subscriptions:
-            if subscription.auto_renew and subscription.status == 'active':
-                try:
-                    SubscriptionService.renew_subscription(subscription)
-                except Exception as e:
-                    # Log error and mark as expired
-                    subscription.status = 'expired'
-                    subscription.save()
-            else:
-                subscription.status = 'expired'
-                subscription.save()
+            try:
+                if subscription.auto_renew and subscription.status == 'active':
+                    try:
+                        SubscriptionService.renew_subscription(subscription)
+                        continue
+                    except Exception as e:
+                        # After a lost race the in-memory version is stale, so the expire below conflicts too
+                        logger.warning(f"Auto-renewal of subscription {subscription.id} failed, expiring it: {str(e)}")
+                SubscriptionStateMachine.transition(subscription, 'expire')
+            except SubscriptionConflictError:
+                # Another worker or request already moved this subscription on
+                continue
+
+
+class SubscriptionBulkService:
+    """
+    Fleet-wide subscription changes (compensations, migrations) applied as
+    chunked set-based UPDATEs with F() expressions instead of row-by-row saves
+    """
+    
+    @staticmethod
+    def build_queryset(filters):
+        """
+        Translate a job's filters into a UserSubscription queryset
+        """
+        queryset = UserSubscription.objects.all()
+        
+        if filters.get('product_id'):
+            queryset = queryset.filter(product_id=filters['product_id'])
+        if filters.get('plan_id'):
+            queryset = queryset.filter(plan_id=filters['plan_id'])
+        if filters.get('status'):
+            statuses = filters['status']
+            if isinstance(statuses, str):
+                statuses = [statuses]
+            queryset = queryset.filter(status__in=statuses)
+        if filters.get('end_date_from'):
+            queryset = queryset.filter(end_date__gte=filters['end_date_from'])
+        if filters.get('end_date_to'):
+            queryset = queryset.filter(end_date__lte=filters['end_date_to'])
+        
+        return queryset
+    
+    @staticmethod
+    def get_changes(job):
+        """
+        Column assignments (and an optional extra guard filter) for one job
+        """
+        params = job.params or {}
+        changes = {'version': F('version') + 1}
+        guard = {}
+        
+        if job.operation == 'extend':
+            changes['end_date'] = ExpressionWrapper(
+                F('end_date') + timedelta(days=int(params['days'])),
+                output_field=DateField()
+            )
+        elif job.operation == 'cancel':
+            changes['status'] = 'cancelled'
+            changes['auto_renew'] = False
+            guard['status__in'] = SubscriptionStateMachine.TRANSITIONS['cancel'][0]
+        elif job.operation == 'change_plan':
+            plan = SubscriptionPlan.objects.get(id=params['plan_id'])
+            changes['plan_id'] = plan.id
+            # A plan can only be applied to subscriptions of its own product
+            guard['product_id'] = plan.product_id
+        elif job.operation == 'set_auto_renew':
+            changes['auto_renew'] = bool(params['auto_renew'])
+        else:
+            raise ValueError(f"Unknown bulk operation: {job.operation}")
+        
+        return changes, guard
+    
+    EVENT_TYPES = {
+        'extend': SubscriptionEvent.EXTENDED,
+        'cancel': SubscriptionEvent.CANCELLED,
+        'change_plan': SubscriptionEvent.PLAN_CHANGED,
+        'set_auto_renew': SubscriptionEvent.AUTO_RENEW_CHANGED,
+    }
+    
+    @staticmethod
+    def build_events(job, rows, changes):
+        """
+        One SubscriptionEvent per affected row, computed from the pre-update values
+        """
+        params = job.params or {}
+        now = timezone.now()
+        events = []
+        
+        for row in rows:
+            end_date = row['end_date']
+            to_status = changes.get('status', row['status'])
+            plan_id = changes.get('plan_id', row['plan_id'])
+            data = {'bulk_job_id': str(job.id)}
+            
+            if job.operation == 'extend':
+                end_date = end_date + timedelta(days=int(params['days']))
+                data['days'] = int(params['days'])
+            elif job.operation == 'change_plan':
+                data['from_plan_id'] = str(row['plan_id'])
+            elif job.operation == 'set_auto_renew':
+                data['auto_renew'] = changes['auto_renew']
+            
+            events.append(SubscriptionEvent(
+                subscription_id=row['id'],
+                user_id=row['user_id'],
+                product_id=row['product_id'],
+                plan_id=plan_id,
+                event_type=SubscriptionBulkService.EVENT_TYPES[job.operation],
+                from_status=row['status'],
+                to_status=to_status,
+                end_date=end_date,
+                data=data,
+                created_at=now
+            ))
+        
+        return events
+    
+    @staticmethod
+    def run_job(job_id, chunk_size=None):
+        """
+        Execute a bulk job in keyset-paginated chunks.
+        Each chunk is one UPDATE in its own short transaction; progress and the
+        keyset cursor are persisted after every chunk so a failed job resumes
+        where it stopped instead of re-applying earlier chunks.
+        """
+        chunk_size = chunk_size or settings.SUBSCRIPTION_BULK_CHUNK_SIZE
+        job = SubscriptionBulkJob.objects.get(id=job_id)
+        
+        if job.status == 'completed':
+            return job
+        
+        changes, guard = SubscriptionBulkService.get_changes(job)
+        queryset = SubscriptionBulkService.build_queryset(job.filters).filter(**guard).order_by('id')
+        
+        SubscriptionBulkJob.objects.filter(id=job.id).update(
+            status='running',
+            started_at=job.started_at or timezone.now(),
+            total=queryset.count() if job.last_processed_id is None else job.total,
+            error=None,
+            updated_at=timezone.now()
+        )
+        
+        last_id = job.last_processed_id
+        while True:
+            chunk = queryset.filter(id__gt=last_id) if last_id else queryset
+            rows = list(chunk.values(
+                'id', 'user_id', 'product_id', 'plan_id', 'status', 'end_date'
+            )[:chunk_size])
+            if not rows:
+                break
+            
+            ids = [row['id'] for row in rows]
+            last_id = ids[-1]
+            
+            with transaction.atomic():
+                UserSubscription.objects.filter(id__in=ids, **guard).update(
+                    updated_at=timezone.now(),
+                    **changes
+                )
+                SubscriptionEvent.objects.bulk_create(
+                    SubscriptionBulkService.build_events(job, rows, changes)
+                )
+                SubscriptionBulkJob.objects.filter(id=job.id).update(
+                    processed=F('processed') + len(ids),
+                    last_processed_id=last_id,
+                    updated_at=timezone.now()
+                )
+            
+            SubscriptionService.invalidate_subscription_cache(*{row['user_id'] for row in rows})
+        
+        SubscriptionBulkJob.objects.filter(id=job.id).update(
+            status='completed',
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+        return job
+
 
 class InvoiceService:
     """
     Service to handle invoice creation, payment, and email notifications
     """
     
+    INVOICE_NUMBER_SEQUENCE = 'serviceapp_invoice_number_seq'
+    
+    @staticmethod
+    def allocate_invoice_numbers(count):
+        """
+        Reserve a block of invoice numbers from the PostgreSQL sequence in one round trip
+        
+        Args:
+            count: How many numbers to reserve
+        
+        Returns:
+            List of invoice numbers like INV-20250101-000123
+        """
+        if count <= 0:
+            return []
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [InvoiceService.INVOICE_NUMBER_SEQUENCE, count]
+            )
+            values = [row[0] for row in cursor.fetchall()]
+        
+        prefix = timezone.now().strftime('%Y%m%d')
+        return [f"INV-{prefix}-{value:06d}" for value in values]
+    
     @staticmethod
     def generate_invoice_number():
         """Generate unique invoice number"""
-        return f"INV-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+        return InvoiceService.allocate_invoice_numbers(1)[0]
     
     @staticmethod
     def create_invoice(user_subscription, amount=None):
@@ -301,19 +759,54 @@ class InvoiceService:
         Returns:
             Invoice instance
         """
-        if amount is None:
-            amount = user_subscription.plan.price
+        return InvoiceService.create_invoices([user_subscription], amount=amount)[0]
+    
+    @staticmethod
+    def create_invoices(user_subscriptions, amount=None):
+        """
+        Create one invoice per subscription with a single number reservation and a single INSERT
         
+        Args:
+            user_subscriptions: List of UserSubscription instances (plan loaded when amount is None)
+            amount: Optional custom amount applied to every invoice (defaults to each plan price)
+        
+        Returns:
+            List of Invoice instances
+        """
+        user_subscriptions = list(user_subscriptions)
+        numbers = InvoiceService.allocate_invoice_numbers(len(user_subscriptions))
         due_date = timezone.now().date() + timedelta(days=30)
         
-        invoice = Invoice.objects.create(
-            user_subscription=user_subscription,
-            amount=amount,
-            due_date=due_date,
-            is_paid=False
-        )
+        invoices = [
+            Invoice(
+                user_subscription=user_subscription,
+                invoice_number=invoice_number,
+                amount=user_subscription.plan.price if amount is None else amount,
+                due_date=due_date,
+                is_paid=False
+            )
+            for user_subscription, invoice_number in zip(user_subscriptions, numbers)
+        ]
         
-        return invoice
+        return Invoice.objects.bulk_create(invoices)
+    
+    @staticmethod
+    def get_invoice_by_number(invoice_number):
+        """
+        Look up an invoice by its number through the unique index
+        
+        Args:
+            invoice_number: Invoice number like INV-20250101-000123
+        
+        Returns:
+            Invoice instance or None
+        """
+        return Invoice.objects.select_related(
+            'user_subscription__user',
+            'user_subscription__product',
+            'user_subscription__plan',
+            'transaction'
+        ).filter(invoice_number=invoice_number.strip().upper()).first()
     
     @staticmethod
     def mark_invoice_paid(invoice, transaction_ref=None):
@@ -333,6 +826,29 @@ class InvoiceService:
         
         return invoice
     
+    @staticmethod
+    def get_invoice_pdf(invoice):
+        """
+        Return the cached PDF of an invoice, scheduling a background render when missing
+        
+        Args:
+            invoice: Invoice with user_subscription__user/product/plan loaded
+        
+        Returns:
+            Tuple (path, digest); path is None while the PDF is being rendered
+        """
+        digest = content_digest(invoice_document(invoice))
+        path = cached_pdf_path(digest)
+        if os.path.exists(path):
+            return path, digest
+        
+        # One render per document version, however many requests ask for it
+        if cache.add(f"invoice_pdf_lock_{digest}", str(invoice.id), timeout=settings.INVOICE_PDF_RENDER_LOCK_TIMEOUT):
+            from ..tasks.tasks import render_invoice_pdf_task
+            render_invoice_pdf_task.delay(str(invoice.id), digest)
+        
+        return None, digest
+    
     @staticmethod
     def send_invoice_email(invoice, email_type='purchase'):
         """
@@ -348,7 +864,7 @@ class InvoiceService:
         
         context = {
             'user_name': user.get_full_name or user.first_name,
-            'invoice_number': invoice.id,
+            'invoice_number': invoice.invoice_number,
             'product_name': product.name,
             'plan_name': plan.name,
             'amount': str(invoice.amount),
@@ -361,17 +877,16 @@ class InvoiceService:
         }
         
         if email_type == 'purchase':
-            subject = f'Invoice {invoice.id} - Purchase Confirmation'
+            subject = f'Invoice {invoice.invoice_number} - Purchase Confirmation'
             template_name = 'emails/invoice_purchase.html'
         elif email_type == 'renewal':
-            subject = f'Invoice {invoice.id} - Subscription Renewal'
+            subject = f'Invoice {invoice.invoice_number} - Subscription Renewal'
             template_name = 'emails/invoice_renewal.html'
         else:  # reminder
-            subject = f'Payment Reminder - Invoice {invoice.id}'
+            subject = f'Payment Reminder - Invoice {invoice.invoice_number}'
             template_name = 'emails/invoice_reminder.html'
         
-        from ..tasks.tasks import send_email_notification_task
-        send_email_notification_task.delay(
+        OutboxService.enqueue_email(
             subject=subject,
             template_name=template_name,
             context=context,
@@ -381,31 +896,186 @@ class InvoiceService:
         return True
 
 
+class InvoiceReminderService:
+    """
+    Daily dunning run. Unpaid invoices move through INVOICE_REMINDER_SCHEDULE
+    (days relative to the due date, e.g. -3, 0, 3, 7, 14) and every user
+    receives at most one grouped reminder email per run, whatever the number
+    of invoices they owe.
+    """
+    
+    @staticmethod
+    def stage_reached(invoice_due_date, today):
+        """Number of schedule stages whose day has come for this due date"""
+        days_past_due = (today - invoice_due_date).days
+        return sum(1 for offset in settings.INVOICE_REMINDER_SCHEDULE if offset <= days_past_due)
+    
+    @staticmethod
+    def stage_label(stage):
+        schedule = settings.INVOICE_REMINDER_SCHEDULE
+        offset = schedule[stage - 1]
+        if offset > 0 and stage == len(schedule):
+            return 'final'
+        if offset > 0:
+            return 'overdue'
+        return 'due' if offset == 0 else 'upcoming'
+    
+    @staticmethod
+    def due_invoices(today):
+        """
+        Unpaid invoices with a reminder stage not sent yet, and not already reminded today.
+        Served by the (is_paid, due_date) index.
+        """
+        schedule = settings.INVOICE_REMINDER_SCHEDULE
+        start_of_day = timezone.make_aware(datetime.combine(today, time.min))
+        
+        pending_stage = reduce(operator.or_, (
+            Q(due_date__lte=today - timedelta(days=offset), reminder_count__lte=stage)
+            for stage, offset in enumerate(schedule)
+        ))
+        
+        return Invoice.objects.filter(
+            pending_stage,
+            is_paid=False,
+            due_date__lte=today - timedelta(days=schedule[0]),
+        ).filter(
+            Q(last_reminded_at__isnull=True) | Q(last_reminded_at__lt=start_of_day)
+        )
+    
+    @staticmethod
+    def send_reminders(today=None, chunk_size=None):
+        """
+        Send one grouped reminder per user, chunked by user id (keyset)
+        
+        Returns:
+            dict with the number of users emailed and invoices covered
+        """
+        today = today or timezone.now().date()
+        chunk_size = chunk_size or settings.INVOICE_REMINDER_CHUNK_SIZE
+        schedule = settings.INVOICE_REMINDER_SCHEDULE
+        queryset = InvoiceReminderService.due_invoices(today)
+        
+        # Highest stage whose day has come; lets a late run jump straight to it
+        reached = Case(
+            *[
+                When(due_date__lte=today - timedelta(days=offset), then=Value(stage + 1))
+                for stage, offset in reversed(list(enumerate(schedule)))
+            ],
+            default=F('reminder_count'),
+            output_field=IntegerField()
+        )
+        
+        users_sent = 0
+        invoices_sent = 0
+        last_user_id = None
+        
+        while True:
+            user_ids = queryset.order_by('user_subscription__user_id').values_list(
+                'user_subscription__user_id', flat=True
+            ).distinct()
+            if last_user_id is not None:
+                user_ids = user_ids.filter(user_subscription__user_id__gt=last_user_id)
+            user_ids = list(user_ids[:chunk_size])
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+            
+            invoices = queryset.filter(
+                user_subscription__user_id__in=user_ids
+            ).select_related('user_subscription__user').order_by('due_date')
+            
+            by_user = {}
+            for invoice in invoices:
+                by_user.setdefault(invoice.user_subscription.user_id, []).append(invoice)
+            
+            messages = []
+            for user_invoices in by_user.values():
+                user = user_invoices[0].user_subscription.user
+                stage = max(InvoiceReminderService.stage_reached(inv.due_date, today) for inv in user_invoices)
+                label = InvoiceReminderService.stage_label(stage)
+                total_amount = sum(inv.amount for inv in user_invoices)
+                overdue_count = sum(1 for inv in user_invoices if inv.due_date < today)
+                
+                if label == 'final':
+                    subject = f'Final Notice - {len(user_invoices)} Unpaid Invoice(s)'
+                elif label == 'overdue':
+                    subject = f'Payment Overdue - {len(user_invoices)} Invoice(s)'
+                else:
+                    subject = f'Payment Reminder - {len(user_invoices)} Invoice(s) Due'
+                
+                messages.append(OutboxService.email_message(
+                    subject=subject,
+                    template_name='emails/invoice_reminder_digest.html',
+                    context={
+                        'user_name': user.get_full_name or user.username,
+                        'invoice_count': len(user_invoices),
+                        'overdue_count': overdue_count,
+                        'total_amount': str(total_amount),
+                        'stage': label,
+                        'site_url': settings.SITE_BASE_URL,
+                        'invoice_ids': [str(inv.id) for inv in user_invoices],
+                    },
+                    recipient_list=[user.email]
+                ))
+                users_sent += 1
+                invoices_sent += len(user_invoices)
+            
+            # The emails and the reminder bookkeeping commit together, so a
+            # crashed run neither skips nor repeats a chunk's reminders
+            with transaction.atomic():
+                OutboxService.record(messages)
+                # updated_at is left alone: reminder bookkeeping is not an invoice content change
+                Invoice.objects.filter(
+                    id__in=[inv.id for group in by_user.values() for inv in group]
+                ).update(reminder_count=reached, last_reminded_at=timezone.now())
+        
+        return {'users': users_sent, 'invoices': invoices_sent}
+
+
 class PaymentService:
     """
     Service to handle payment transactions
     """
     
     @staticmethod
-    def create_transaction(user, invoices, payment_method='card', total_amount=None):
+    @transaction.atomic
+    def create_transaction(user, invoice_ids, payment_method='card', total_amount=None):
         """
         Create transaction for one or multiple invoices
         
+        The payable invoices are locked in one SELECT ... FOR UPDATE SKIP LOCKED and
+        settled in one UPDATE, so the statement count does not grow with the number
+        of invoices. Invoices locked by a concurrent payment are left out.
+        
         Args:
             user: User instance
-            invoices: List of Invoice instances
+            invoice_ids: List of Invoice ids
             payment_method: Payment method used
             total_amount: Optional custom total (auto-calculated if None)
         
         Returns:
             Transaction instance
+        
+        Raises:
+            Invoice.DoesNotExist: if none of the invoices is payable by user
         """
+        locked = list(
+            Invoice.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                id__in=invoice_ids,
+                user_subscription__user=user,
+                is_paid=False
+            ).values_list('id', 'amount')
+        )
+        
+        if not locked:
+            raise Invoice.DoesNotExist("No valid invoices found")
+        
         if total_amount is None:
-            total_amount = sum(inv.amount for inv in invoices)
+            total_amount = sum(amount for _, amount in locked)
         
         transaction_ref = f"TXN-{timezone.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6].upper()}"
         
-        transaction = Transaction.objects.create(
+        payment = Transaction.objects.create(
             user=user,
             total_amount=total_amount,
             transaction_ref=transaction_ref,
@@ -414,85 +1084,1140 @@ class PaymentService:
         )
         
         # Mark invoices as paid
-        for invoice in invoices:
-            InvoiceService.mark_invoice_paid(invoice, transaction_ref)
+        Invoice.objects.filter(id__in=[invoice_id for invoice_id, _ in locked]).update(
+            is_paid=True,
+            transaction=payment,
+            transaction_ref=transaction_ref,
+            updated_at=timezone.now()
+        )
         
-        return transaction
+        return payment
     
     @staticmethod
-    def process_payment(user, invoices, payment_method='card'):
+    def process_payment(user, invoice_ids, payment_method='card'):
         """
         Process payment for invoices
         
         Args:
             user: User instance
-            invoices: List of Invoice instances
+            invoice_ids: List of Invoice ids
             payment_method: Payment method
         
         Returns:
             Transaction instance if successful, None otherwise
+        
+        Raises:
+            Invoice.DoesNotExist: if none of the invoices is payable by user
         """
         try:
-            transaction = PaymentService.create_transaction(
+            return PaymentService.create_transaction(
                 user=user,
-                invoices=invoices,
+                invoice_ids=invoice_ids,
                 payment_method=payment_method
             )
-            return transaction
+        except Invoice.DoesNotExist:
+            raise
         except Exception as e:
             print(f"Payment processing error: {str(e)}")
             return None
+    
+    @staticmethod
+    def get_transaction(transaction_id):
+        """
+        Load a transaction with its invoices and their subscription details prefetched
+        
+        Args:
+            transaction_id: Transaction id
+        
+        Returns:
+            Transaction instance
+        """
+        return Transaction.objects.prefetch_related(
+            Prefetch(
+                'invoices',
+                queryset=Invoice.objects.select_related(
+                    'user_subscription__product',
+                    'user_subscription__plan',
+                    'user_subscription__user'
+                )
+            )
+        ).get(id=transaction_id)
 
 
-class NotificationService:
+class PaymentWebhookService:
     """
-    Service to handle user notifications
+    Gateway webhook pipeline.
+    
+    ingest() is all the request does: one INSERT ... ON CONFLICT DO NOTHING into
+    the PaymentWebhookEvent inbox (the unique event_id drops redeliveries) plus a
+    debounced kick of the consumer, so a burst of webhooks is acknowledged as fast
+    as rows can be appended. process_pending() drains the inbox in batches locked
+    with SKIP LOCKED, so several workers can share a burst, and applies each batch
+    with a fixed number of set-based statements.
     """
     
+    SCHEDULE_KEY = 'payment_webhooks_scheduled'
+    
+    # event type -> Transaction.status
+    CHARGE_STATUSES = {
+        'charge.succeeded': 'success',
+        'charge.failed': 'failed',
+        'charge.refunded': 'refunded',
+    }
+    
+    # event type -> SubscriptionStateMachine action
+    SUBSCRIPTION_ACTIONS = {
+        'subscription.cancelled': 'cancel',
+        'subscription.expired': 'expire',
+    }
+    
     @staticmethod
-    def send_purchase_notification(user_subscription, invoice):
+    def ingest(event):
         """
-        Send notification after subscription purchase
+        Append a verified webhook event to the inbox
         
         Args:
-            user_subscription: UserSubscription instance
-            invoice: Invoice instance
-        """
-        notification = Notification.objects.create(
-            receiver=user_subscription.user,
-            sender=None,
-            title=f'Subscription Purchased - {user_subscription.product.name}',
-            message=f'Your subscription to {user_subscription.product.name} ({user_subscription.plan.name}) '
-                   f'has been successfully purchased. Invoice #{invoice.id} for ${invoice.amount} '
-                   f'is due on {invoice.due_date}.',
-            is_read=False
-        )
+            event: parsed webhook body with 'id', 'type' and 'data'
         
-        # Send email notification
-        InvoiceService.send_invoice_email(invoice, email_type='purchase')
-        
-        return notification
+        Returns:
+            True if the event is new, False if it was already received
+        """
+        inserted = insert_on_conflict_do_nothing(PaymentWebhookEvent(
+            event_id=str(event['id']),
+            event_type=str(event['type']),
+            payload=event
+        ))
+        if inserted:
+            PaymentWebhookService.schedule_processing()
+        return inserted
     
     @staticmethod
-    def send_renewal_notification(user_subscription, invoice):
+    def schedule_processing():
+        """Queue at most one consumer run per PAYMENT_WEBHOOK_BATCH_DELAY window"""
+        delay = settings.PAYMENT_WEBHOOK_BATCH_DELAY
+        if cache.add(PaymentWebhookService.SCHEDULE_KEY, True, timeout=delay):
+            from ..tasks.tasks import process_payment_webhooks
+            process_payment_webhooks.apply_async(countdown=delay)
+    
+    @staticmethod
+    def process_pending(batch_size=None):
         """
-        Send notification for subscription renewal
+        Apply pending inbox events received before this run started, oldest first
         
-        Args:
-            user_subscription: UserSubscription instance
-            invoice: Invoice instance
+        Returns:
+            dict with the number of events processed, ignored and failed
         """
+        batch_size = batch_size or settings.PAYMENT_WEBHOOK_BATCH_SIZE
+        started_at = timezone.now()
+        totals = {'processed': 0, 'ignored': 0, 'failed': 0}
+        cursor = None
+        
+        while True:
+            with transaction.atomic():
+                queryset = PaymentWebhookEvent.objects.select_for_update(skip_locked=True).filter(
+                    status=PaymentWebhookEvent.PENDING,
+                    created_at__lte=started_at
+                )
+                if cursor is not None:
+                    # Keyset past this run's earlier batches, so a failing event is retried next run
+                    queryset = queryset.filter(
+                        Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], id__gt=cursor[1])
+                    )
+                events = list(queryset.order_by('created_at', 'id')[:batch_size])
+                if not events:
+                    break
+                cursor = (events[-1].created_at, events[-1].id)
+                
+                for key, count in PaymentWebhookService.apply_batch(events).items():
+                    totals[key] += count
+        
+        return totals
+    
+    @staticmethod
+    def apply_batch(events):
+        """
+        Apply a locked batch of inbox events and record their outcome. Runs inside
+        the caller's transaction. The state changes sit in a savepoint: if the batch
+        fails it is re-applied event by event, and an event that still fails is
+        retried on later runs up to PAYMENT_WEBHOOK_MAX_ATTEMPTS times.
+        """
+        now = timezone.now()
+        charge_events = []
+        subscription_events = []
+        ignored_ids = set()
+        
+        for event in events:
+            data = event.payload.get('data') or {}
+            if event.event_type in PaymentWebhookService.CHARGE_STATUSES and data.get('charge_id'):
+                charge_events.append(event)
+            elif event.event_type in PaymentWebhookService.SUBSCRIPTION_ACTIONS and PaymentWebhookService._as_uuid(data.get('subscription_id')):
+                subscription_events.append(event)
+            else:
+                ignored_ids.add(event.id)
+        
+        event_ids = [event.id for event in events]
+        try:
+            with transaction.atomic():
+                PaymentWebhookService._apply_charge_events(charge_events, now)
+                ignored_ids |= PaymentWebhookService._apply_subscription_events(subscription_events)
+        except Exception as e:
+            if len(events) > 1:
+                # Isolate the bad event(s) so they cannot hold back the rest of the batch
+                results = [PaymentWebhookService.apply_batch([event]) for event in events]
+                return {key: sum(result[key] for result in results) for key in results[0]}
+            logger.exception(f"Payment webhook event {events[0].event_id} failed: {str(e)}")
+            last_attempt = settings.PAYMENT_WEBHOOK_MAX_ATTEMPTS - 1
+            PaymentWebhookEvent.objects.filter(id__in=event_ids).update(
+                status=Case(
+                    When(attempts__gte=last_attempt, then=Value(PaymentWebhookEvent.FAILED)),
+                    default=Value(PaymentWebhookEvent.PENDING)
+                ),
+                attempts=F('attempts') + 1,
+                error=str(e)[:1000],
+                updated_at=now
+            )
+            failed = sum(1 for event in events if event.attempts >= last_attempt)
+            return {'processed': 0, 'ignored': 0, 'failed': failed}
+        
+        PaymentWebhookEvent.objects.filter(id__in=event_ids).update(
+            status=Case(
+                When(id__in=ignored_ids, then=Value(PaymentWebhookEvent.IGNORED)),
+                default=Value(PaymentWebhookEvent.PROCESSED)
+            ),
+            attempts=F('attempts') + 1,
+            error=None,
+            processed_at=now,
+            updated_at=now
+        )
+        return {'processed': len(events) - len(ignored_ids), 'ignored': len(ignored_ids), 'failed': 0}
+    
+    @staticmethod
+    def _as_uuid(value):
+        """Ids in a payload are untrusted strings; malformed ones are ignored, not retried"""
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def _apply_charge_events(events, now):
+        """
+        Settle charge events in bulk: transactions for gateway-initiated charges are
+        created, their invoices marked paid, and every referenced transaction gets
+        its final status in a single UPDATE. Subscriptions paid by a charge that
+        failed or was refunded are cancelled.
+        """
+        if not events:
+            return
+        
+        final_status = {}
+        invoice_charges = {}
+        payment_methods = {}
+        for event in events:
+            data = event.payload['data']
+            charge_id = data['charge_id']
+            status = PaymentWebhookService.CHARGE_STATUSES[event.event_type]
+            # Events are in arrival order: the last one for a charge decides its status
+            final_status[charge_id] = status
+            if status == 'success':
+                payment_methods[charge_id] = data.get('payment_method') or 'gateway'
+                for invoice_id in data.get('invoice_ids') or []:
+                    invoice_id = PaymentWebhookService._as_uuid(invoice_id)
+                    if invoice_id:
+                        invoice_charges[invoice_id] = charge_id
+        
+        if invoice_charges:
+            payable = list(Invoice.objects.filter(
+                id__in=list(invoice_charges),
+                is_paid=False
+            ).values_list('id', 'amount', 'user_subscription__user_id'))
+            
+            totals = {}
+            invoices_by_charge = {}
+            for invoice_id, amount, user_id in payable:
+                charge_id = invoice_charges[invoice_id]
+                _, total = totals.get(charge_id, (user_id, Decimal('0')))
+                totals[charge_id] = (user_id, total + amount)
+                invoices_by_charge.setdefault(charge_id, []).append(invoice_id)
+            
+            if totals:
+                # A charge settled by an earlier batch already has its Transaction
+                Transaction.objects.bulk_create([
+                    Transaction(
+                        user_id=user_id,
+                        total_amount=total,
+                        transaction_ref=charge_id,
+                        payment_method=payment_methods[charge_id],
+                        status='success'
+                    )
+                    for charge_id, (user_id, total) in totals.items()
+                ], ignore_conflicts=True)
+                
+                transaction_ids = dict(Transaction.objects.filter(
+                    transaction_ref__in=list(totals)
+                ).values_list('transaction_ref', 'id'))
+                
+                Invoice.objects.filter(id__in=[row[0] for row in payable]).update(
+                    is_paid=True,
+                    transaction_id=Case(*[
+                        When(id__in=invoice_ids, then=Value(transaction_ids[charge_id]))
+                        for charge_id, invoice_ids in invoices_by_charge.items()
+                    ]),
+                    transaction_ref=Case(*[
+                        When(id__in=invoice_ids, then=Value(charge_id))
+                        for charge_id, invoice_ids in invoices_by_charge.items()
+                    ]),
+                    updated_at=now
+                )
+        
+        statuses = {}
+        for charge_id, status in final_status.items():
+            statuses.setdefault(status, []).append(charge_id)
+        
+        Transaction.objects.filter(transaction_ref__in=list(final_status)).update(
+            status=Case(*[
+                When(transaction_ref__in=charge_ids, then=Value(status))
+                for status, charge_ids in statuses.items()
+            ]),
+            updated_at=now
+        )
+        
+        refunded = statuses.get('refunded')
+        if refunded:
+            Invoice.objects.filter(
+                transaction__transaction_ref__in=refunded,
+                is_paid=True
+            ).update(is_paid=False, updated_at=now)
+        
+        revoked = statuses.get('failed', []) + statuses.get('refunded', [])
+        if revoked:
+            # Subscription charges have no Transaction; they are matched on the subscription itself
+            for subscription in UserSubscription.objects.filter(
+                gateway_charge_id__in=revoked,
+                status__in=['active', 'trial']
+            ):
+                PaymentWebhookService._transition(subscription, 'cancel', auto_renew=False)
+    
+    @staticmethod
+    def _transition(subscription, action, **changes):
+        """
+        Apply a state machine action, re-reading the row once if it changed since it was read
+        
+        Returns:
+            False if the transition is not allowed from the subscription's current status
+        """
+        if not SubscriptionStateMachine.can_transition(subscription, action):
+            return False
+        try:
+            SubscriptionStateMachine.transition(subscription, action, **changes)
+        except SubscriptionConflictError:
+            subscription.refresh_from_db()
+            if not SubscriptionStateMachine.can_transition(subscription, action):
+                return False
+            SubscriptionStateMachine.transition(subscription, action, **changes)
+        return True
+    
+    @staticmethod
+    def _apply_subscription_events(events):
+        """
+        Run subscription events through the state machine, one conditional UPDATE each
+        
+        Returns:
+            Ids of events that did not apply (unknown subscription or transition not allowed)
+        """
+        if not events:
+            return set()
+        
+        subscription_ids = {
+            event.id: PaymentWebhookService._as_uuid(event.payload['data']['subscription_id'])
+            for event in events
+        }
+        subscriptions = UserSubscription.objects.in_bulk(list(subscription_ids.values()))
+        ignored_ids = set()
+        
+        for event in events:
+            subscription = subscriptions.get(subscription_ids[event.id])
+            action = PaymentWebhookService.SUBSCRIPTION_ACTIONS[event.event_type]
+            changes = {'auto_renew': False} if action == 'cancel' else {}
+            if subscription is None or not PaymentWebhookService._transition(subscription, action, **changes):
+                ignored_ids.add(event.id)
+        
+        return ignored_ids
+
+
+class ReconciliationService:
+    """
+    Payment reconciliation. Each check is one grouped SQL query over a keyset
+    range of primary keys, so the matching happens in the database and only
+    discrepancies come back to Python:
+    
+    - amount_mismatch: Transaction.total_amount differs from the sum of its invoices
+    - orphaned_transaction: no invoice points to the transaction
+    - paid_without_transaction: invoice marked paid but not linked to a transaction
+    - paid_unsettled_transaction: invoice marked paid but its transaction failed
+      or was refunded
+    """
+    
+    @staticmethod
+    def transaction_queryset(run):
+        queryset = Transaction.objects.all()
+        if run.date_from:
+            queryset = queryset.filter(created_at__date__gte=run.date_from)
+        if run.date_to:
+            queryset = queryset.filter(created_at__date__lte=run.date_to)
+        return queryset
+    
+    @staticmethod
+    def invoice_queryset(run):
+        queryset = Invoice.objects.filter(is_paid=True)
+        if run.date_from:
+            queryset = queryset.filter(issued_date__gte=run.date_from)
+        if run.date_to:
+            queryset = queryset.filter(issued_date__lte=run.date_to)
+        return queryset
+    
+    @staticmethod
+    def transaction_discrepancies(run, queryset):
+        """Transactions in queryset whose invoices do not add up (one GROUP BY ... HAVING)"""
+        rows = queryset.annotate(
+            invoice_total=Sum('invoices__amount'),
+            invoice_count=Count('invoices')
+        ).filter(
+            Q(invoice_count=0) | ~Q(invoice_total=F('total_amount'))
+        ).values_list('id', 'user_id', 'total_amount', 'invoice_total', 'invoice_count')
+        
+        return [
+            PaymentDiscrepancy(
+                run=run,
+                kind=PaymentDiscrepancy.AMOUNT_MISMATCH if invoice_count else PaymentDiscrepancy.ORPHANED_TRANSACTION,
+                transaction_id=transaction_id,
+                user_id=user_id,
+                transaction_amount=total_amount,
+                invoice_amount=invoice_total or Decimal('0'),
+                invoice_count=invoice_count
+            )
+            for transaction_id, user_id, total_amount, invoice_total, invoice_count in rows
+        ]
+    
+    @staticmethod
+    def invoice_discrepancies(run, queryset):
+        """Paid invoices in queryset that no successful transaction settles"""
+        rows = queryset.filter(
+            Q(transaction__isnull=True) | ~Q(transaction__status='success')
+        ).values_list('id', 'user_subscription__user_id', 'amount', 'transaction_id', 'transaction__total_amount')
+        return [
+            PaymentDiscrepancy(
+                run=run,
+                kind=PaymentDiscrepancy.PAID_UNSETTLED_TRANSACTION if transaction_id else PaymentDiscrepancy.PAID_WITHOUT_TRANSACTION,
+                invoice_id=invoice_id,
+                transaction_id=transaction_id,
+                user_id=user_id,
+                transaction_amount=transaction_amount,
+                invoice_amount=amount,
+                invoice_count=1
+            )
+            for invoice_id, user_id, amount, transaction_id, transaction_amount in rows
+        ]
+    
+    @staticmethod
+    def run(run_id, chunk_size=None):
+        """
+        Execute a reconciliation run in keyset chunks: per chunk, one query for
+        the id range, one grouped query for its discrepancies and one short
+        transaction writing them together with progress and the cursor.
+        """
+        chunk_size = chunk_size or settings.RECONCILIATION_CHUNK_SIZE
+        run = ReconciliationRun.objects.get(id=run_id)
+        
+        if run.status == 'completed':
+            return run
+        
+        ReconciliationRun.objects.filter(id=run.id).update(
+            status='running',
+            started_at=run.started_at or timezone.now(),
+            error=None,
+            updated_at=timezone.now()
+        )
+        
+        # phase -> (rows to check, discrepancy finder, progress counter)
+        phases = [
+            ('transactions', ReconciliationService.transaction_queryset,
+             ReconciliationService.transaction_discrepancies, 'transactions_checked'),
+            ('invoices', ReconciliationService.invoice_queryset,
+             ReconciliationService.invoice_discrepancies, 'invoices_checked'),
+        ]
+        start = [phase for phase, _, _, _ in phases].index(run.phase)
+        last_id = run.last_processed_id
+        
+        for phase, get_queryset, find_discrepancies, counter in phases[start:]:
+            while True:
+                queryset = get_queryset(run)
+                if last_id:
+                    queryset = queryset.filter(id__gt=last_id)
+                ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                
+                found = find_discrepancies(run, queryset.filter(id__lte=ids[-1]))
+                last_id = ids[-1]
+                
+                with transaction.atomic():
+                    PaymentDiscrepancy.objects.bulk_create(found)
+                    ReconciliationRun.objects.filter(id=run.id).update(
+                        phase=phase,
+                        last_processed_id=last_id,
+                        discrepancy_count=F('discrepancy_count') + len(found),
+                        updated_at=timezone.now(),
+                        **{counter: F(counter) + len(ids)}
+                    )
+            last_id = None
+        
+        ReconciliationRun.objects.filter(id=run.id).update(
+            status='completed',
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        run.refresh_from_db()
+        return run
+    
+    @staticmethod
+    def summary(run):
+        """Discrepancy count and amounts per kind for a run"""
+        return list(
+            run.discrepancies.values('kind').annotate(
+                count=Count('id'),
+                transaction_amount=Sum('transaction_amount'),
+                invoice_amount=Sum('invoice_amount')
+            ).order_by('kind')
+        )
+
+
+class RevenueRollupService:
+    """
+    Incremental maintenance of RevenueDailyRollup. Each run recomputes only the
+    (issued date, product) buckets whose invoices changed since the watermark,
+    so dashboards aggregate a few rollup rows instead of millions of invoices.
+    """
+    WATERMARK = 'revenue_daily_rollup'
+    LOCK_KEY = 'revenue_rollup_lock'
+    
+    AMOUNT_FIELDS = [
+        'invoiced_amount', 'invoiced_count',
+        'paid_amount', 'paid_count',
+        'outstanding_amount', 'outstanding_count',
+    ]
+    
+    SUMMARY_GROUPS = {
+        'day': ['date'],
+        'month': ['month'],
+        'product': ['product_id', 'product__name'],
+        'plan': ['plan_id', 'plan__name', 'product_id'],
+    }
+    
+    @staticmethod
+    def changed_buckets(since=None):
+        """
+        Collect (issued_date, product_id) buckets touched after since (all buckets when None)
+        """
+        invoices = Invoice.objects.all()
+        if since is not None:
+            invoices = invoices.filter(updated_at__gt=since)
+        buckets = set(invoices.values_list('issued_date', 'user_subscription__product_id').distinct())
+        
+        if since is None:
+            # Also revisit buckets whose invoices are all gone so their rows get removed
+            buckets.update(RevenueDailyRollup.objects.values_list('date', 'product_id').distinct())
+        else:
+            # A plan change re-attributes the subscription's existing invoices
+            changed_subscriptions = UserSubscription.objects.filter(updated_at__gt=since).values('id')
+            buckets.update(
+                Invoice.objects.filter(user_subscription__in=changed_subscriptions)
+                .values_list('issued_date', 'user_subscription__product_id').distinct()
+            )
+        
+        return buckets
+    
+    @staticmethod
+    def recompute_buckets(buckets):
+        """
+        Re-aggregate the given (date, product_id) buckets from invoices and upsert them.
+        Plans that no longer have invoices in a bucket are deleted.
+        
+        Returns:
+            Number of rollup rows written
+        """
+        if not buckets:
+            return 0
+        
+        invoice_scope = reduce(operator.or_, (
+            Q(issued_date=date, user_subscription__product_id=product_id) for date, product_id in buckets
+        ))
+        rollup_scope = reduce(operator.or_, (
+            Q(date=date, product_id=product_id) for date, product_id in buckets
+        ))
+        
+        rows = Invoice.objects.filter(invoice_scope).values(
+            'issued_date', 'user_subscription__product_id', 'user_subscription__plan_id'
+        ).annotate(
+            invoiced_amount=Sum('amount'),
+            invoiced_count=Count('id'),
+            paid_amount=Sum('amount', filter=Q(is_paid=True)),
+            paid_count=Count('id', filter=Q(is_paid=True)),
+        ).order_by()
+        
+        rollups = []
+        for row in rows:
+            paid_amount = row['paid_amount'] or Decimal('0')
+            rollups.append(RevenueDailyRollup(
+                date=row['issued_date'],
+                product_id=row['user_subscription__product_id'],
+                plan_id=row['user_subscription__plan_id'],
+                invoiced_amount=row['invoiced_amount'],
+                invoiced_count=row['invoiced_count'],
+                paid_amount=paid_amount,
+                paid_count=row['paid_count'],
+                outstanding_amount=row['invoiced_amount'] - paid_amount,
+                outstanding_count=row['invoiced_count'] - row['paid_count'],
+            ))
+        
+        fresh = {(rollup.date, rollup.product_id, rollup.plan_id) for rollup in rollups}
+        
+        with transaction.atomic():
+            RevenueDailyRollup.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['date', 'product', 'plan'],
+                update_fields=RevenueRollupService.AMOUNT_FIELDS + ['updated_at'],
+            )
+            stale_ids = [
+                rollup_id
+                for rollup_id, date, product_id, plan_id in RevenueDailyRollup.objects.filter(rollup_scope)
+                .values_list('id', 'date', 'product_id', 'plan_id')
+                if (date, product_id, plan_id) not in fresh
+            ]
+            if stale_ids:
+                RevenueDailyRollup.objects.filter(id__in=stale_ids).delete()
+        
+        return len(rollups)
+    
+    @staticmethod
+    def refresh(full=False, chunk_size=None):
+        """
+        Bring the rollups up to date with invoice changes since the last run
+        
+        Args:
+            full: Ignore the watermark and rebuild every bucket
+            chunk_size: Buckets recomputed per statement batch
+        
+        Returns:
+            Number of buckets recomputed, or None if another refresh is running
+        """
+        if not cache.add(RevenueRollupService.LOCK_KEY, True, timeout=settings.REVENUE_ROLLUP_LOCK_TIMEOUT):
+            return None
+        
+        try:
+            chunk_size = chunk_size or settings.REVENUE_ROLLUP_CHUNK_SIZE
+            watermark, _ = RollupWatermark.objects.get_or_create(name=RevenueRollupService.WATERMARK)
+            started_at = timezone.now()
+            
+            since = None
+            if not full and watermark.value is not None:
+                # Overlap covers transactions that committed after a later-started one
+                since = watermark.value - timedelta(seconds=settings.REVENUE_ROLLUP_OVERLAP_SECONDS)
+            
+            buckets = sorted(RevenueRollupService.changed_buckets(since))
+            for start in range(0, len(buckets), chunk_size):
+                RevenueRollupService.recompute_buckets(buckets[start:start + chunk_size])
+            
+            RollupWatermark.objects.filter(name=RevenueRollupService.WATERMARK).update(
+                value=started_at,
+                updated_at=timezone.now()
+            )
+            return len(buckets)
+        finally:
+            cache.delete(RevenueRollupService.LOCK_KEY)
+    
+    @staticmethod
+    def summary(filters, group_by='day'):
+        """
+        Aggregate rollups for the revenue dashboard
+        
+        Args:
+            filters: dict with optional date_from, date_to, product_id, plan_id
+            group_by: 'day', 'month', 'product' or 'plan'
+        
+        Returns:
+            dict with totals, series and the as_of watermark
+        """
+        queryset = RevenueDailyRollup.objects.all()
+        if filters.get('date_from'):
+            queryset = queryset.filter(date__gte=filters['date_from'])
+        if filters.get('date_to'):
+            queryset = queryset.filter(date__lte=filters['date_to'])
+        if filters.get('product_id'):
+            queryset = queryset.filter(product_id=filters['product_id'])
+        if filters.get('plan_id'):
+            queryset = queryset.filter(plan_id=filters['plan_id'])
+        
+        aggregates = {field: Sum(field) for field in RevenueRollupService.AMOUNT_FIELDS}
+        keys = RevenueRollupService.SUMMARY_GROUPS[group_by]
+        if group_by == 'month':
+            queryset = queryset.annotate(month=TruncMonth('date'))
+        
+        totals = queryset.aggregate(**aggregates)
+        series = list(queryset.values(*keys).annotate(**aggregates).order_by(*keys))
+        
+        watermark = RollupWatermark.objects.filter(name=RevenueRollupService.WATERMARK).first()
+        
+        return {
+            'totals': {key: value or 0 for key, value in totals.items()},
+            'series': series,
+            'as_of': watermark.value if watermark else None,
+        }
+
+
+class NotificationService:
+    """
+    Service to handle user notifications
+    
+    Every notification is created through create_notification() and marked read
+    through mark_as_read(), which keep a per-user unread counter in the cache
+    and push the change to the user's open notification streams.
+    The counter is recounted from the partial unread index whenever it is cold
+    (first read, eviction or NOTIFICATION_UNREAD_CACHE_TTL), which also bounds
+    any drift from a lost increment.
+    
+    System notifications are stored as a template key and params (see
+    notification_templates) and rendered by render() in the reader's language.
+    Opt-outs per channel and category are checked against the user's
+    notification_optouts bitmask (see notification_preferences).
+    """
+    
+    @staticmethod
+    def unread_cache_key(user_id):
+        return f"notif_unread_{user_id}"
+    
+    @staticmethod
+    def get_unread_count(user_id):
+        """O(1) when the counter is warm, one indexed COUNT otherwise"""
+        key = NotificationService.unread_cache_key(user_id)
+        count = cache.get(key)
+        if count is None:
+            count = Notification.objects.filter(receiver_id=user_id, is_read=False).count()
+            cache.add(key, count, timeout=settings.NOTIFICATION_UNREAD_CACHE_TTL)
+        return max(count, 0)
+    
+    @staticmethod
+    def adjust_unread_count(user_id, delta):
+        """
+        Move a warm counter by delta once the surrounding transaction commits.
+        A cold counter is left alone; the next read recounts it.
+        """
+        if not delta:
+            return
+        key = NotificationService.unread_cache_key(user_id)
+        
+        def apply():
+            try:
+                if delta > 0:
+                    cache.incr(key, delta)
+                else:
+                    cache.decr(key, -delta)
+            except ValueError:
+                pass
+        
+        transaction.on_commit(apply)
+    
+    @staticmethod
+    def create_notification(receiver, title=None, message='', sender=None, template_key=None, params=None, category=None):
+        """
+        Create an unread notification and bump the receiver's unread counter
+        
+        Args:
+            receiver: User instance
+            title, message: literal text, for notifications without a template
+            sender: User instance or None for system notifications
+            template_key: registered template to render at read time instead
+            params: JSON-serializable values for the template's placeholders
+            category: notification_preferences category the receiver may have
+                switched off in-app; None for notifications that always go out
+        
+        Returns:
+            The Notification, or None if the receiver opted out
+        """
+        if category and not NotificationService.allows(receiver, 'in_app', category):
+            return None
+        
         notification = Notification.objects.create(
-            receiver=user_subscription.user,
-            sender=None,
-            title=f'Subscription Renewed - {user_subscription.product.name}',
-            message=f'Your subscription to {user_subscription.product.name} has been successfully renewed. '
-                   f'Invoice #{invoice.id} for ${invoice.amount} is due on {invoice.due_date}.',
+            receiver=receiver,
+            sender=sender,
+            title=title,
+            message=message,
+            template_key=template_key,
+            params=params,
             is_read=False
         )
+        NotificationService.adjust_unread_count(receiver.id, 1)
+        NotificationService.push(receiver.id, NotificationService.stream_message(notification))
+        return notification
+    
+    @staticmethod
+    def preferred_language(user, request=None):
+        """
+        The user's language from User.notifications["language"], else the one
+        the request asks for (Accept-Language), else LANGUAGE_CODE
+        """
+        preferences = user.notifications if isinstance(user.notifications, dict) else {}
+        language = preferences.get('language')
+        if language in dict(settings.LANGUAGES):
+            return language
+        if request is not None:
+            return translation.get_language_from_request(request)
+        return settings.LANGUAGE_CODE
+    
+    @staticmethod
+    def update_preferences(user, **changes):
+        """
+        Set keys of User.notifications (email_digest, language, channels);
+        other keys are kept and channels are merged per channel. The opt-out
+        bitmask is recomputed and its cache mirror refreshed on commit.
+        """
+        preferences = dict(user.notifications) if isinstance(user.notifications, dict) else {}
+        channels = changes.pop('channels', None)
+        if channels:
+            merged = dict(preferences.get('channels') or {})
+            for channel, categories in channels.items():
+                merged[channel] = {**(merged.get(channel) or {}), **categories}
+            preferences['channels'] = merged
+        preferences.update(changes)
+        
+        user.notifications = preferences
+        user.notification_optouts = optouts_from_preferences(preferences)
+        user.save(update_fields=['notifications', 'notification_optouts'])
+        
+        key = NotificationService.optouts_cache_key(user.id)
+        optouts = user.notification_optouts
+        transaction.on_commit(
+            lambda: cache.set(key, optouts, timeout=settings.NOTIFICATION_PREFERENCES_CACHE_TTL)
+        )
+        return preferences
+    
+    @staticmethod
+    def allows(user, channel, category):
+        """Whether the user receives this category on this channel"""
+        return not user.notification_optouts & bit(channel, category)
+    
+    @staticmethod
+    def optouts_cache_key(user_id):
+        return f"notif_optouts_{user_id}"
+    
+    @staticmethod
+    def get_optouts(user_ids):
+        """
+        Opt-out bitmasks of many users without loading them: one cache round
+        trip, and one query for the ids not mirrored yet
+        
+        Returns:
+            {user_id (str): bitmask}
+        """
+        user_ids = [str(user_id) for user_id in user_ids]
+        keys = {NotificationService.optouts_cache_key(user_id): user_id for user_id in user_ids}
+        optouts = {keys[key]: mask for key, mask in cache.get_many(list(keys)).items()}
+        
+        missing = [user_id for user_id in user_ids if user_id not in optouts]
+        if missing:
+            loaded = {
+                str(user_id): mask
+                for user_id, mask in User.objects.filter(id__in=missing).values_list('id', 'notification_optouts')
+            }
+            cache.set_many(
+                {NotificationService.optouts_cache_key(user_id): mask for user_id, mask in loaded.items()},
+                timeout=settings.NOTIFICATION_PREFERENCES_CACHE_TTL
+            )
+            optouts.update(loaded)
+        return optouts
+    
+    @staticmethod
+    def render_cache_key(template_key, params, language):
+        params_hash = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"notif_render_{template_key}_{language}_{params_hash}"
+    
+    @staticmethod
+    def render(notifications, language):
+        """
+        Fill in title and message of templated notifications, in place and
+        unsaved. Rendered text is cached per (template, params hash, language)
+        and fetched in one round trip for the whole list; a row whose template
+        or params no longer fit keeps its stored text.
+        
+        Returns:
+            notifications
+        """
+        templated = [notification for notification in notifications if notification.template_key]
+        if not templated:
+            return notifications
+        
+        keys = [
+            NotificationService.render_cache_key(notification.template_key, notification.params, language)
+            for notification in templated
+        ]
+        rendered = cache.get_many(keys)
+        fresh = {}
+        
+        for notification, key in zip(templated, keys):
+            if key not in rendered:
+                try:
+                    rendered[key] = fresh[key] = get_template(notification.template_key).render(
+                        notification.params or {}, language
+                    )
+                except (KeyError, IndexError, ValueError) as e:
+                    logger.warning(f"Cannot render notification {notification.id} ({notification.template_key}): {e}")
+                    continue
+            notification.title, notification.message = rendered[key]
+        
+        if fresh:
+            cache.set_many(fresh, timeout=settings.NOTIFICATION_RENDER_CACHE_TTL)
+        return notifications
+    
+    @staticmethod
+    def stream_message(notification, language=None):
+        """Payload of a 'notification' event on the real-time stream"""
+        if notification.template_key:
+            NotificationService.render(
+                [notification], language or NotificationService.preferred_language(notification.receiver)
+            )
+        sender = notification.sender
+        return {
+            'type': 'notification',
+            'id': str(notification.id),
+            'sender': str(sender.id) if sender else None,
+            'sender_name': sender.username if sender else None,
+            'title': notification.title,
+            'message': notification.message,
+            'is_read': notification.is_read,
+            'created_at': notification.created_at.isoformat(),
+            'cursor': NotificationService.encode_cursor(notification),
+        }
+    
+    @staticmethod
+    def push(user_id, message):
+        """
+        Publish a real-time message to the user once the surrounding transaction
+        commits, so clients never see rows that were rolled back
+        """
+        transaction.on_commit(lambda: publish_notification(user_id, message))
+    
+    @staticmethod
+    def mark_as_read(user, notification_id):
+        """
+        Mark one of the user's notifications read with a conditional UPDATE
+        
+        Returns:
+            True if it was unread, False if already read
+        
+        Raises:
+            Notification.DoesNotExist
+        """
+        updated = NotificationService.mark_many_as_read(user, notification_ids=[notification_id])
+        
+        if not updated and not Notification.objects.filter(id=notification_id, receiver=user).exists():
+            raise Notification.DoesNotExist("Notification not found")
+        
+        return bool(updated)
+    
+    @staticmethod
+    def mark_many_as_read(user, notification_ids=None, before=None):
+        """
+        Mark the user's unread notifications read in a single UPDATE
+        (served by the partial unread index) and move the counter by the rows changed
+        
+        Args:
+            user: User instance
+            notification_ids: Only these ids; ids of other users are ignored
+            before: Cursor; the notification it points at and everything older
+            Neither given: the whole inbox
+        
+        Returns:
+            Number of notifications that were unread
+        
+        Raises:
+            ValueError: malformed cursor
+        """
+        queryset = Notification.objects.filter(receiver=user, is_read=False)
+        if notification_ids is not None:
+            queryset = queryset.filter(id__in=notification_ids)
+        if before:
+            created_at, notification_id = NotificationService.decode_cursor(before)
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=notification_id)
+            )
+        
+        updated = queryset.update(is_read=True, updated_at=timezone.now())
+        NotificationService.adjust_unread_count(user.id, -updated)
+        if updated:
+            # Lets the user's other open tabs drop their badge without refetching
+            NotificationService.push(user.id, {'type': 'read', 'count': updated})
+        return updated
+    
+    @staticmethod
+    def encode_cursor(notification):
+        return NotificationService.make_cursor(notification.created_at, notification.id)
+    
+    @staticmethod
+    def make_cursor(created_at, notification_id):
+        raw = f"{created_at.isoformat()}|{notification_id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Raises:
+            ValueError: malformed cursor
+        """
+        try:
+            created_at, notification_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+            return datetime.fromisoformat(created_at), uuid.UUID(notification_id)
+        except (UnicodeError, TypeError, binascii.Error) as e:
+            raise ValueError("Invalid cursor") from e
+    
+    @staticmethod
+    def get_notifications_since(user, cursor, limit=None):
+        """
+        Notifications newer than a cursor, oldest first; replays what a
+        reconnecting stream missed (its Last-Event-ID is such a cursor)
+        
+        Raises:
+            ValueError: malformed cursor
+        """
+        limit = min(limit or settings.NOTIFICATION_MAX_PAGE_SIZE, settings.NOTIFICATION_MAX_PAGE_SIZE)
+        created_at, notification_id = NotificationService.decode_cursor(cursor)
+        queryset = Notification.objects.filter(receiver=user, created_at__gte=created_at).filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=notification_id)
+        )
+        return list(queryset.select_related('sender').order_by('created_at', 'id')[:limit])
+    
+    @staticmethod
+    def get_notifications_page(user, cursor=None, limit=None):
+        """
+        One page of the user's inbox, newest first, keyed on (created_at, id)
+        
+        Args:
+            user: User instance
+            cursor: next_cursor of the previous page
+            limit: Page size, capped at NOTIFICATION_MAX_PAGE_SIZE
+        
+        Returns:
+            (notifications, next_cursor or None)
+        """
+        limit = min(limit or settings.NOTIFICATION_PAGE_SIZE, settings.NOTIFICATION_MAX_PAGE_SIZE)
+        queryset = Notification.objects.filter(receiver=user)
+        
+        if cursor:
+            created_at, notification_id = NotificationService.decode_cursor(cursor)
+            # The plain created_at bound lets the index range scan start at the cursor
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=notification_id)
+            )
+        
+        notifications = list(
+            queryset.select_related('receiver', 'sender').order_by('-created_at', '-id')[:limit + 1]
+        )
+        next_cursor = None
+        if len(notifications) > limit:
+            notifications = notifications[:limit]
+            next_cursor = NotificationService.encode_cursor(notifications[-1])
+        return notifications, next_cursor
+    
+    @staticmethod
+    def maintain_partitions():
+        """
+        Create the coming months' partitions and drop those past
+        NOTIFICATION_RETENTION_MONTHS. Receivers with unread notifications in a
+        dropped month get their cached counter reset, as it would count them.
+        
+        Returns:
+            (created partition names, dropped partition names)
+        """
+        table = Notification._meta.db_table
+        created = ensure_monthly_partitions(table, months_ahead=settings.NOTIFICATION_PARTITIONS_AHEAD)
+        dropped = []
+        
+        for name in expired_monthly_partitions(table, settings.NOTIFICATION_RETENTION_MONTHS):
+            with connection.cursor() as cursor:
+                # Served by the partition's copy of the partial unread index
+                cursor.execute(
+                    f"SELECT DISTINCT receiver_id FROM {connection.ops.quote_name(name)} WHERE NOT is_read"
+                )
+                receiver_ids = [row[0] for row in cursor.fetchall()]
+            
+            drop_partition(table, name)
+            cache.delete_many([NotificationService.unread_cache_key(receiver_id) for receiver_id in receiver_ids])
+            dropped.append(name)
         
-        # Send email notification
-        InvoiceService.send_invoice_email(invoice, email_type='renewal')
+        return created, dropped
+    
+    @staticmethod
+    def send_purchase_notification(user_subscription, invoice):
+        """
+        Send notification after subscription purchase
+        
+        Args:
+            user_subscription: UserSubscription instance
+            invoice: Invoice instance
+        """
+        user = user_subscription.user
+        params = {
+            'product': user_subscription.product.name,
+            'plan': user_subscription.plan.name,
+            'invoice_number': invoice.invoice_number,
+            'amount': str(invoice.amount),
+            'due_date': str(invoice.due_date),
+        }
+        notification = NotificationService.create_notification(
+            receiver=user,
+            template_key='subscription.purchased',
+            params=params,
+            category='subscription'
+        )
+        
+        # Send email notification, or hold it for the user's digest
+        if NotificationService.allows(user, 'email', 'subscription'):
+            if NotificationDigestService.wants_digest(user):
+                NotificationDigestService.buffer(user, 'purchase', 'subscription.purchased', params)
+            else:
+                InvoiceService.send_invoice_email(invoice, email_type='purchase')
+        
+        return notification
+    
+    @staticmethod
+    def send_renewal_notification(user_subscription, invoice):
+        """
+        Send notification for subscription renewal
+        
+        Args:
+            user_subscription: UserSubscription instance
+            invoice: Invoice instance
+        """
+        user = user_subscription.user
+        params = {
+            'product': user_subscription.product.name,
+            'invoice_number': invoice.invoice_number,
+            'amount': str(invoice.amount),
+            'due_date': str(invoice.due_date),
+        }
+        notification = NotificationService.create_notification(
+            receiver=user,
+            template_key='subscription.renewed',
+            params=params,
+            category='subscription'
+        )
+        
+        # Send email notification, or hold it for the user's digest
+        if NotificationService.allows(user, 'email', 'subscription'):
+            if NotificationDigestService.wants_digest(user):
+                NotificationDigestService.buffer(user, 'renewal', 'subscription.renewed', params)
+            else:
+                InvoiceService.send_invoice_email(invoice, email_type='renewal')
         
         return notification
     
@@ -506,16 +2231,26 @@ class NotificationService:
         """
         days_until_expiry = (user_subscription.end_date - timezone.now().date()).days
         
-        notification = Notification.objects.create(
-            receiver=user_subscription.user,
-            sender=None,
-            title=f'Subscription Expiring Soon - {user_subscription.product.name}',
-            message=f'Your subscription to {user_subscription.product.name} ({user_subscription.plan.name}) '
-                   f'will expire in {days_until_expiry} days on {user_subscription.end_date}. '
-                   f'Please renew your subscription to avoid service interruption.',
-            is_read=False
+        user = user_subscription.user
+        params = {
+            'product': user_subscription.product.name,
+            'plan': user_subscription.plan.name,
+            'days': days_until_expiry,
+            'end_date': str(user_subscription.end_date),
+        }
+        notification = NotificationService.create_notification(
+            receiver=user,
+            template_key='subscription.expiring',
+            params=params,
+            category='expiry'
         )
         
+        if not NotificationService.allows(user, 'email', 'expiry'):
+            return notification
+        if NotificationDigestService.wants_digest(user):
+            NotificationDigestService.buffer(user, 'expiry_reminder', 'subscription.expiring', params)
+            return notification
+        
         # Send email reminder
         context = {
             'user_name': user_subscription.user.get_full_name or user_subscription.user.username,
@@ -526,8 +2261,7 @@ class NotificationService:
             'site_url': settings.SITE_BASE_URL,
         }
         
-        from ..tasks.tasks import send_email_notification_task
-        send_email_notification_task.delay(
+        OutboxService.enqueue_email(
             subject=f'Subscription Expiring Soon - {user_subscription.product.name}',
             template_name='emails/renewal_reminder.html',
             context=context,
@@ -545,8 +2279,6 @@ class NotificationService:
             user: User instance
             transaction: Transaction instance
         """
-        invoices = Invoice.objects.filter(transaction_ref=transaction.transaction_ref)
-        
         context = {
             'user_name': user.get_full_name or user.username,
             'transaction_ref': transaction.transaction_ref,
@@ -555,13 +2287,455 @@ class NotificationService:
             'transaction_date': transaction.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'site_url': settings.SITE_BASE_URL,
             # Note: invoices are handled in the task or passed as IDs if needed
-            'invoice_ids': list(invoices.values_list('id', flat=True))
+            'invoice_ids': [str(invoice.id) for invoice in transaction.invoices.all()]
         }
         
-        from ..tasks.tasks import send_email_notification_task
-        send_email_notification_task.delay(
+        OutboxService.enqueue_email(
             subject=f'Payment Confirmation - {transaction.transaction_ref}',
             template_name='emails/payment_confirmation.html',
             context=context,
             recipient_list=[user.email]
         )
+
+
+class NotificationDigestService:
+    """
+    Coalesce a user's notification emails into one digest per window
+    
+    Users opt in with User.notifications["email_digest"]. Their notifications
+    are still created (and pushed) immediately; only the email is held in the
+    digest buffer. The window opens with the first held email and lasts
+    NOTIFICATION_DIGEST_WINDOW seconds; flush() then sends everything held for
+    the user as one email.
+    """
+    
+    PREFERENCE_KEY = 'email_digest'
+    
+    # notification_preferences category of each kind of held email
+    KIND_CATEGORIES = {
+        'purchase': 'subscription',
+        'renewal': 'subscription',
+        'expiry_reminder': 'expiry',
+    }
+    
+    @staticmethod
+    def wants_digest(user):
+        preferences = user.notifications if isinstance(user.notifications, dict) else {}
+        return bool(preferences.get(NotificationDigestService.PREFERENCE_KEY, settings.NOTIFICATION_DIGEST_DEFAULT))
+    
+    @staticmethod
+    def buffer(user, kind, template_key, params):
+        """
+        Hold an email for the user's next digest, once the surrounding
+        transaction commits
+        
+        Args:
+            user: receiver
+            kind: 'purchase', 'renewal' or 'expiry_reminder'
+            template_key, params: the notification the email announces,
+                rendered now in the user's language
+        """
+        notification = Notification(receiver=user, template_key=template_key, params=params)
+        NotificationService.render([notification], NotificationService.preferred_language(user))
+        entry = {
+            'kind': kind,
+            'title': notification.title,
+            'message': notification.message,
+            'created_at': timezone.now().isoformat(),
+        }
+        
+        def apply():
+            due_at = timezone.now().timestamp() + settings.NOTIFICATION_DIGEST_WINDOW
+            try:
+                get_digest_buffer().add(user.id, entry, due_at)
+            except Exception as e:
+                # Never lose the email: fall back to sending it on its own
+                logger.warning(f"Digest buffer unavailable for user {user.id}, sending directly: {e}")
+                NotificationDigestService.send_digest(user, [entry])
+        
+        transaction.on_commit(apply)
+    
+    @staticmethod
+    def flush(now=None, batch_size=None):
+        """
+        Send one email per user whose digest window has closed. Entries of
+        categories the user has since switched off for email are dropped,
+        checked against the cached opt-out bitmasks before any user is loaded.
+        
+        Returns:
+            dict with the number of users emailed and entries covered
+        """
+        now = now or timezone.now()
+        batch_size = batch_size or settings.NOTIFICATION_DIGEST_FLUSH_BATCH
+        digest_buffer = get_digest_buffer()
+        
+        users_sent = 0
+        entries_sent = 0
+        
+        while True:
+            user_ids = digest_buffer.claim_due(now.timestamp(), batch_size)
+            if not user_ids:
+                break
+            
+            # Taken entries are only in memory now: whatever is not sent goes back
+            # to the buffer, due one window later so this run does not reclaim it
+            pending = digest_buffer.take(user_ids)
+            try:
+                optouts = NotificationService.get_optouts([user_id for user_id, entries in pending.items() if entries])
+                for user_id, entries in pending.items():
+                    mask = optouts.get(user_id, 0)
+                    pending[user_id] = [
+                        entry for entry in entries
+                        if not mask & bit('email', NotificationDigestService.KIND_CATEGORIES.get(entry['kind'], 'subscription'))
+                    ]
+                users = User.objects.in_bulk([user_id for user_id, entries in pending.items() if entries])
+                
+                for user_id, entries in list(pending.items()):
+                    user = users.get(uuid.UUID(user_id))
+                    if user is None or not entries:
+                        del pending[user_id]
+                        continue
+                    try:
+                        with transaction.atomic():
+                            NotificationDigestService.send_digest(user, entries)
+                    except Exception as e:
+                        logger.exception(f"Notification digest for user {user_id} failed: {str(e)}")
+                        continue
+                    del pending[user_id]
+                    users_sent += 1
+                    entries_sent += len(entries)
+            finally:
+                retry_at = now.timestamp() + settings.NOTIFICATION_DIGEST_WINDOW
+                for user_id, entries in pending.items():
+                    for entry in entries:
+                        digest_buffer.add(user_id, entry, retry_at)
+        
+        logger.info(f"Sent {users_sent} notification digests covering {entries_sent} notifications")
+        return {'users': users_sent, 'notifications': entries_sent}
+    
+    @staticmethod
+    def send_digest(user, entries):
+        """
+        Args:
+            user: User instance
+            entries: buffered entries, oldest first
+        """
+        OutboxService.enqueue_email(
+            subject=entries[0]['title'] if len(entries) == 1 else f'Your Notification Digest - {len(entries)} Updates',
+            template_name='emails/notification_digest.html',
+            context={
+                'user_name': user.get_full_name or user.username,
+                'entries': entries,
+                'entry_count': len(entries),
+                'site_url': settings.SITE_BASE_URL,
+            },
+            recipient_list=[user.email]
+        )
+
+
+class NotificationBroadcastService:
+    """
+    System notifications to every active user or a segment of them.
+    
+    The audience is walked in keyset chunks of user ids. Each chunk is one
+    INSERT ... SELECT that builds the notification rows inside PostgreSQL, so
+    no user or notification objects pass through Python; the chunk commits
+    together with the broadcast's progress and cursor, so a failed broadcast
+    resumes without notifying anyone twice. Unread counters of the chunk are
+    dropped (recounted on next read) and live streams get one pipelined push.
+    """
+    
+    @staticmethod
+    def build_audience(segment):
+        """
+        Active users matching a segment, minus those who opted out of announcements
+        
+        Args:
+            segment: dict with optional role_id (direct or assigned role),
+                product_id and subscription_status (str or list); product and
+                status must hold for the same subscription
+        """
+        segment = segment or {}
+        # Users who switched announcements off in-app are left out in SQL
+        queryset = User.objects.filter(is_active=True).alias(
+            announcement_optout=F('notification_optouts').bitand(bit('in_app', 'announcement'))
+        ).filter(announcement_optout=0)
+        
+        if segment.get('role_id'):
+            role_id = segment['role_id']
+            queryset = queryset.filter(
+                Q(role_id=role_id) | Q(Exists(UserRole.objects.filter(user=OuterRef('pk'), role_id=role_id)))
+            )
+        
+        if segment.get('product_id') or segment.get('subscription_status'):
+            subscriptions = UserSubscription.objects.filter(user=OuterRef('pk'))
+            if segment.get('product_id'):
+                subscriptions = subscriptions.filter(product_id=segment['product_id'])
+            if segment.get('subscription_status'):
+                statuses = segment['subscription_status']
+                if isinstance(statuses, str):
+                    statuses = [statuses]
+                subscriptions = subscriptions.filter(status__in=statuses)
+            queryset = queryset.filter(Exists(subscriptions))
+        
+        return queryset
+    
+    @staticmethod
+    def insert_chunk(broadcast, audience, limit, now):
+        """
+        Create the notifications of the first `limit` users of an ordered audience
+        
+        Returns:
+            List of (notification_id, receiver_id) as strings, in receiver order
+        """
+        select_sql, select_params = audience.values('id')[:limit].query.sql_with_params()
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(column) for column in (
+            'id', 'created_at', 'updated_at', 'receiver_id', 'sender_id', 'title', 'message', 'is_read'
+        ))
+        sql = (
+            f"INSERT INTO {quote(Notification._meta.db_table)} ({columns}) "
+            f"SELECT gen_random_uuid(), %s, %s, audience.id, %s, %s, %s, false "
+            f"FROM ({select_sql}) AS audience "
+            # Text ids: cheaper to fetch than UUID objects and what cache keys and channels need
+            f"RETURNING id::text, receiver_id::text"
+        )
+        params = [now, now, broadcast.created_by_id, broadcast.title, broadcast.message, *select_params]
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return sorted(rows, key=lambda row: row[1])
+    
+    @staticmethod
+    def run(broadcast_id, chunk_size=None):
+        """
+        Fan a broadcast out in chunks, resuming from its cursor
+        """
+        chunk_size = chunk_size or settings.NOTIFICATION_BROADCAST_CHUNK_SIZE
+        broadcast = NotificationBroadcast.objects.select_related('created_by').get(id=broadcast_id)
+        
+        if broadcast.status == 'completed':
+            return broadcast
+        
+        audience = NotificationBroadcastService.build_audience(broadcast.segment).order_by('id')
+        
+        NotificationBroadcast.objects.filter(id=broadcast.id).update(
+            status='running',
+            started_at=broadcast.started_at or timezone.now(),
+            total=audience.count() if broadcast.last_user_id is None else broadcast.total,
+            error=None,
+            updated_at=timezone.now()
+        )
+        
+        sender = broadcast.created_by
+        last_id = broadcast.last_user_id
+        while True:
+            chunk = audience.filter(id__gt=last_id) if last_id else audience
+            now = timezone.now()
+            
+            with transaction.atomic():
+                rows = NotificationBroadcastService.insert_chunk(broadcast, chunk, chunk_size, now)
+                if not rows:
+                    break
+                last_id = rows[-1][1]
+                NotificationBroadcast.objects.filter(id=broadcast.id).update(
+                    processed=F('processed') + len(rows),
+                    last_user_id=last_id,
+                    updated_at=timezone.now()
+                )
+            
+            cache.delete_many([NotificationService.unread_cache_key(receiver_id) for _, receiver_id in rows])
+            
+            template = NotificationService.stream_message(Notification(
+                sender=sender, title=broadcast.title, message=broadcast.message, created_at=now
+            ))
+            publish_notifications([
+                (receiver_id, dict(
+                    template,
+                    id=notification_id,
+                    cursor=NotificationService.make_cursor(now, notification_id)
+                ))
+                for notification_id, receiver_id in rows
+            ])
+        
+        NotificationBroadcast.objects.filter(id=broadcast.id).update(
+            status='completed',
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        broadcast.refresh_from_db()
+        logger.info(f"Broadcast {broadcast.id} delivered to {broadcast.processed} users")
+        return broadcast
+
+
+class OutboxService:
+    """
+    Transactional outbox.
+    
+    enqueue_task() and enqueue_email() insert OutboxMessage rows in the caller's
+    transaction and, once it commits, kick the relay (debounced to one run per
+    OUTBOX_RELAY_DELAY). relay() drains committed messages in batches locked
+    with SKIP LOCKED: tasks are published over one broker connection per batch,
+    emails go straight to the batched mailer without a broker message each.
+    A message is marked dispatched in the transaction holding its lock, so it is
+    sent once unless the relay dies between publishing it and committing.
+    """
+    
+    SCHEDULE_KEY = 'outbox_relay_scheduled'
+    
+    @staticmethod
+    def task_message(task, args=(), kwargs=None, dedup_key=None):
+        """
+        Args:
+            task: Celery task; args and kwargs must be JSON-serializable
+            dedup_key: a message with a key already recorded is dropped
+        """
+        return OutboxMessage(
+            kind=OutboxMessage.TASK,
+            task_name=task.name,
+            payload={'args': list(args), 'kwargs': kwargs or {}},
+            dedup_key=dedup_key
+        )
+    
+    @staticmethod
+    def email_message(subject, template_name, context, recipient_list, dedup_key=None):
+        """Same arguments as send_email_notification_task"""
+        return OutboxMessage(
+            kind=OutboxMessage.EMAIL,
+            payload={
+                'subject': subject,
+                'template_name': template_name,
+                'context': context,
+                'recipient_list': recipient_list,
+            },
+            dedup_key=dedup_key
+        )
+    
+    @staticmethod
+    def enqueue_task(task, args=(), kwargs=None, dedup_key=None):
+        OutboxService.record([OutboxService.task_message(task, args, kwargs, dedup_key)])
+    
+    @staticmethod
+    def enqueue_email(subject, template_name, context, recipient_list, dedup_key=None):
+        OutboxService.record([OutboxService.email_message(subject, template_name, context, recipient_list, dedup_key)])
+    
+    @staticmethod
+    def record(messages):
+        """
+        Insert messages in the current transaction with one statement; those
+        whose dedup_key is already recorded are skipped
+        """
+        if not messages:
+            return
+        OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+        transaction.on_commit(OutboxService.schedule_relay)
+    
+    @staticmethod
+    def schedule_relay():
+        """Queue at most one relay run per OUTBOX_RELAY_DELAY window"""
+        delay = settings.OUTBOX_RELAY_DELAY
+        if cache.add(OutboxService.SCHEDULE_KEY, True, timeout=delay):
+            from ..tasks.tasks import relay_outbox
+            try:
+                relay_outbox.apply_async(countdown=delay)
+            except Exception as e:
+                # The messages are committed; beat's relay run picks them up
+                cache.delete(OutboxService.SCHEDULE_KEY)
+                logger.warning(f"Could not queue the outbox relay: {str(e)}")
+    
+    @staticmethod
+    def relay(batch_size=None):
+        """
+        Dispatch pending messages that are due, oldest first
+        
+        Returns:
+            dict with the number of messages dispatched, retried later and failed
+        """
+        batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+        started_at = timezone.now()
+        totals = {'dispatched': 0, 'retried': 0, 'failed': 0}
+        
+        while True:
+            with transaction.atomic():
+                # A failed message is pushed past started_at, so each run tries it once
+                messages = list(
+                    OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+                        status=OutboxMessage.PENDING,
+                        available_at__lte=started_at
+                    ).order_by('available_at', 'id')[:batch_size]
+                )
+                if not messages:
+                    break
+                
+                for key, count in OutboxService.dispatch_batch(messages).items():
+                    totals[key] += count
+        
+        return totals
+    
+    @staticmethod
+    def dispatch_batch(messages):
+        """
+        Send a locked batch and record the outcome, inside the caller's transaction.
+        A message that fails is retried with exponential backoff (OUTBOX_RETRY_BACKOFF)
+        and marked failed after OUTBOX_MAX_ATTEMPTS.
+        """
+        from celery import current_app
+        from ..tasks.tasks import render_notification_email
+        
+        now = timezone.now()
+        dispatched = []
+        errors = []
+        
+        with current_app.producer_or_acquire() as producer:
+            for message in messages:
+                try:
+                    if message.kind == OutboxMessage.EMAIL:
+                        mailer.enqueue(render_notification_email(**message.payload))
+                    else:
+                        current_app.tasks[message.task_name].apply_async(
+                            args=message.payload.get('args', []),
+                            kwargs=message.payload.get('kwargs', {}),
+                            producer=producer
+                        )
+                    dispatched.append(message.id)
+                except Exception as e:
+                    logger.exception(f"Outbox message {message.id} ({message.task_name or message.kind}) failed: {str(e)}")
+                    errors.append((message, e))
+        
+        if dispatched:
+            OutboxMessage.objects.filter(id__in=dispatched).update(
+                status=OutboxMessage.DISPATCHED,
+                attempts=F('attempts') + 1,
+                error=None,
+                dispatched_at=now,
+                updated_at=now
+            )
+        
+        failed = 0
+        for message, error in errors:
+            attempts = message.attempts + 1
+            gave_up = attempts >= settings.OUTBOX_MAX_ATTEMPTS
+            failed += gave_up
+            OutboxMessage.objects.filter(id=message.id).update(
+                status=OutboxMessage.FAILED if gave_up else OutboxMessage.PENDING,
+                attempts=attempts,
+                available_at=now + timedelta(seconds=settings.OUTBOX_RETRY_BACKOFF * 2 ** message.attempts),
+                error=str(error)[:1000],
+                updated_at=now
+            )
+        
+        return {'dispatched': len(dispatched), 'retried': len(errors) - failed, 'failed': failed}
+    
+    @staticmethod
+    def purge():
+        """
+        Returns:
+            Number of dispatched messages older than OUTBOX_RETENTION_DAYS deleted
+        """
+        cutoff = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+        deleted, _ = OutboxMessage.objects.filter(
+            status=OutboxMessage.DISPATCHED,
+            dispatched_at__lt=cutoff
+        ).delete()
+        return deleted
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from serviceApp.models import SubscriptionPlan
+
+
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def invalidate_trial_plan(sender, instance, **kwargs):
+    """
+    Any saved or deleted plan may be, or have stopped being, its product's
+    trial plan (is_trial, is_active, price or duration edited in admin)
+    """
+    from serviceApp.services.services import SubscriptionService
+    SubscriptionService.invalidate_trial_plan_cache(instance.product_id)
@@ -1,12 +1,13 @@
 from celery import shared_task
 from django.utils import timezone
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from datetime import timedelta
+from datetime import timedelta, datetime, time
+import os
 import logging
-from serviceApp.models import UserSubscription, Product, Invoice
+from multiproduct.mailer import mailer, build_email, queue_email
+from serviceApp.models import UserSubscription, Product, Invoice, SubscriptionEvent
 # We import services inside tasks to avoid circular imports if needed, 
 # but for simple tasks we can import them here if they don't import tasks.py back.
 # However, NotificationService is used in send_subscription_expiry_reminders.
@@ -20,6 +21,7 @@ def check_expired_subscriptions(self):
     Daily task to check and expire subscriptions
     Also handles auto-renewal attempts
     """
+    from serviceApp.services.services import SubscriptionService
     try:
         logger.info("Starting expired subscriptions check")
         SubscriptionService.check_and_expire_subscriptions()
@@ -42,7 +44,7 @@ def send_subscription_expiry_reminder(self, subscription_id, days_before):
         
         subject = f"Your {subscription.product.name} subscription expires in {days_before} days"
         message = f"""
-        Hi {subscription.user.get_full_name() or subscription.user.username},
+        Hi {subscription.user.get_full_name or subscription.user.username},
         
         Your subscription for {subscription.product.name} ({subscription.plan.name}) 
         will expire on {subscription.end_date.strftime('%B %d, %Y')}.
@@ -54,12 +56,10 @@ def send_subscription_expiry_reminder(self, subscription_id, days_before):
         The Team
         """
         
-        send_mail(
+        queue_email(
             subject,
             message,
-            settings.DEFAULT_FROM_EMAIL,
-            [subscription.user.email],
-            fail_silently=False,
+            [subscription.user.email]
         )
         
         logger.info(f"Sent expiry reminder for subscription {subscription_id}")
@@ -103,6 +103,7 @@ def process_failed_renewal(self, subscription_id):
     Handle failed auto-renewal attempts
     Send notification and retry payment
     """
+    from serviceApp.services.services import SubscriptionService
     try:
         subscription = UserSubscription.objects.select_related(
             'user', 'product', 'plan'
@@ -116,19 +117,17 @@ def process_failed_renewal(self, subscription_id):
             SubscriptionService.renew_subscription(subscription)
             
             # Send success email
-            send_mail(
+            queue_email(
                 f"Your {subscription.product.name} subscription has been renewed",
                 f"Your payment was successful and your subscription is now active.",
-                settings.DEFAULT_FROM_EMAIL,
-                [subscription.user.email],
-                fail_silently=False,
+                [subscription.user.email]
             )
             
             return {"status": "success", "subscription_id": subscription_id}
             
         except Exception as e:
             # Send failure notification
-            send_mail(
+            queue_email(
                 f"Failed to renew your {subscription.product.name} subscription",
                 f"""
                 We were unable to process your payment for subscription renewal.
@@ -137,9 +136,7 @@ def process_failed_renewal(self, subscription_id):
                 
                 Please update your payment method and renew manually.
                 """,
-                settings.DEFAULT_FROM_EMAIL,
-                [subscription.user.email],
-                fail_silently=False,
+                [subscription.user.email]
             )
             
             logger.error(f"Failed renewal attempt for subscription {subscription_id}: {str(e)}")
@@ -165,20 +162,22 @@ def generate_subscription_analytics():
     active_subs = UserSubscription.objects.filter(status='active').count()
     trial_subs = UserSubscription.objects.filter(status='trial').count()
     
-    # New subscriptions today
-    new_subs_today = UserSubscription.objects.filter(
-        created_at__date=today,
-        status='active'
-    ).count()
+    # New and churned subscriptions today, from the event log.
+    # The created_at range lets PostgreSQL prune to the current month's partition.
+    from django.db.models import Count, Sum, F, DecimalField
+    
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    events_today = dict(
+        SubscriptionEvent.objects.filter(
+            created_at__gte=day_start,
+            created_at__lt=day_start + timedelta(days=1)
+        ).values_list('event_type').annotate(n=Count('id')).order_by()
+    )
     
-    # Expired/Cancelled today
-    churned_today = UserSubscription.objects.filter(
-        updated_at__date=today,
-        status__in=['expired', 'cancelled']
-    ).count()
+    new_subs_today = events_today.get(SubscriptionEvent.PURCHASED, 0) + events_today.get(SubscriptionEvent.UPGRADED, 0)
+    churned_today = events_today.get(SubscriptionEvent.CANCELLED, 0) + events_today.get(SubscriptionEvent.EXPIRED, 0)
     
     # Calculate MRR (Monthly Recurring Revenue)
-    from django.db.models import Sum, F, DecimalField
     from django.db.models.functions import Coalesce
     
     monthly_revenue = UserSubscription.objects.filter(
@@ -219,7 +218,7 @@ def send_subscription_confirmation(self, subscription_id):
         
         subject = f"Welcome to {subscription.product.name}!"
         message = f"""
-        Hi {subscription.user.get_full_name() or subscription.user.username},
+        Hi {subscription.user.get_full_name or subscription.user.username},
         
         Thank you for subscribing to {subscription.product.name}!
         
@@ -236,12 +235,10 @@ def send_subscription_confirmation(self, subscription_id):
         The Team
         """
         
-        send_mail(
+        queue_email(
             subject,
             message,
-            settings.DEFAULT_FROM_EMAIL,
-            [subscription.user.email],
-            fail_silently=False,
+            [subscription.user.email]
         )
         
         logger.info(f"Sent confirmation email for subscription {subscription_id}")
@@ -267,7 +264,7 @@ def send_cancellation_confirmation(self, subscription_id):
         
         subject = f"Your {subscription.product.name} subscription has been cancelled"
         message = f"""
-        Hi {subscription.user.get_full_name() or subscription.user.username},
+        Hi {subscription.user.get_full_name or subscription.user.username},
         
         We're sorry to see you go. Your subscription to {subscription.product.name} has been cancelled.
         
@@ -281,12 +278,10 @@ def send_cancellation_confirmation(self, subscription_id):
         The Team
         """
         
-        send_mail(
+        queue_email(
             subject,
             message,
-            settings.DEFAULT_FROM_EMAIL,
-            [subscription.user.email],
-            fail_silently=False,
+            [subscription.user.email]
         )
         
         logger.info(f"Sent cancellation confirmation for subscription {subscription_id}")
@@ -345,6 +340,219 @@ def send_subscription_expiry_reminders():
     return f"Sent reminders for {expiring_subscriptions.count()} subscriptions"
 
 
+@shared_task
+def ensure_subscription_event_partitions():
+    """
+    Keep monthly partitions of the subscription event log created ahead of time
+    so inserts never land in the DEFAULT partition
+    """
+    from serviceApp.services.partitions import ensure_monthly_partitions
+    created = ensure_monthly_partitions(SubscriptionEvent._meta.db_table, months_ahead=3)
+    return {"status": "success", "created": created}
+
+
+@shared_task
+def maintain_notification_partitions():
+    """
+    Keep the notification table's month partitions created ahead of time and
+    drop months past retention (no DELETE, nothing to vacuum)
+    """
+    from serviceApp.services.services import NotificationService
+    created, dropped = NotificationService.maintain_partitions()
+    return {"status": "success", "created": created, "dropped": dropped}
+
+
+@shared_task
+def flush_notification_digests():
+    """
+    Send one combined email per user whose digest window has closed
+    """
+    from serviceApp.services.services import NotificationDigestService
+    result = NotificationDigestService.flush()
+    return {"status": "success", **result}
+
+
+@shared_task
+def run_subscription_bulk_job(job_id):
+    """
+    Execute a staff bulk subscription job (extend, cancel, change plan,
+    toggle auto-renew) as chunked UPDATEs. Not retried automatically:
+    a failed job keeps its keyset cursor and can be re-queued to resume.
+    """
+    from serviceApp.models import SubscriptionBulkJob
+    from serviceApp.services.services import SubscriptionBulkService
+    try:
+        job = SubscriptionBulkService.run_job(job_id)
+        logger.info(f"Bulk subscription job {job_id} completed: {job.processed}/{job.total}")
+        return {"status": "success", "job_id": str(job_id), "processed": job.processed}
+    except Exception as exc:
+        logger.error(f"Bulk subscription job {job_id} failed: {str(exc)}")
+        SubscriptionBulkJob.objects.filter(id=job_id).update(
+            status='failed',
+            error=str(exc),
+            updated_at=timezone.now()
+        )
+        return {"status": "error", "job_id": str(job_id), "message": str(exc)}
+
+
+@shared_task
+def run_reconciliation(run_id):
+    """
+    Execute a payment reconciliation run. Like bulk jobs it is not retried
+    automatically: a failed run keeps its cursor and can be re-queued to resume.
+    """
+    from serviceApp.models import ReconciliationRun
+    from serviceApp.services.services import ReconciliationService
+    try:
+        run = ReconciliationService.run(run_id)
+        logger.info(
+            f"Reconciliation run {run_id} completed: {run.transactions_checked} transactions, "
+            f"{run.invoices_checked} paid invoices, {run.discrepancy_count} discrepancies"
+        )
+        return {"status": "success", "run_id": str(run_id), "discrepancies": run.discrepancy_count}
+    except Exception as exc:
+        logger.error(f"Reconciliation run {run_id} failed: {str(exc)}")
+        ReconciliationRun.objects.filter(id=run_id).update(
+            status='failed',
+            error=str(exc),
+            updated_at=timezone.now()
+        )
+        return {"status": "error", "run_id": str(run_id), "message": str(exc)}
+
+
+@shared_task
+def run_notification_broadcast(broadcast_id):
+    """
+    Fan a system notification out to its audience. Like bulk jobs it is not
+    retried automatically: a failed broadcast keeps its cursor and can be
+    re-queued to resume without notifying anyone twice.
+    """
+    from serviceApp.models import NotificationBroadcast
+    from serviceApp.services.services import NotificationBroadcastService
+    try:
+        broadcast = NotificationBroadcastService.run(broadcast_id)
+        return {"status": "success", "broadcast_id": str(broadcast_id), "processed": broadcast.processed}
+    except Exception as exc:
+        logger.error(f"Notification broadcast {broadcast_id} failed: {str(exc)}")
+        NotificationBroadcast.objects.filter(id=broadcast_id).update(
+            status='failed',
+            error=str(exc),
+            updated_at=timezone.now()
+        )
+        return {"status": "error", "broadcast_id": str(broadcast_id), "message": str(exc)}
+
+
+@shared_task
+def reconcile_payments_nightly():
+    """Nightly reconciliation over the full ledger"""
+    from serviceApp.models import ReconciliationRun
+    run = ReconciliationRun.objects.create()
+    return run_reconciliation(str(run.id))
+
+
+@shared_task
+def send_overdue_invoice_reminders():
+    """
+    Daily: one grouped reminder per user for unpaid invoices that reached the
+    next step of INVOICE_REMINDER_SCHEDULE
+    """
+    from serviceApp.services.services import InvoiceReminderService
+    result = InvoiceReminderService.send_reminders()
+    logger.info(f"Sent invoice reminders to {result['users']} users covering {result['invoices']} invoices")
+    return {"status": "success", **result}
+
+
+@shared_task
+def refresh_revenue_rollups(full=False):
+    """
+    Fold invoice changes since the last run into the daily revenue rollups.
+    Pass full=True to rebuild every bucket from scratch.
+    """
+    from serviceApp.services.services import RevenueRollupService
+    buckets = RevenueRollupService.refresh(full=full)
+    if buckets is None:
+        logger.info("Revenue rollup refresh skipped: another run is in progress")
+        return {"status": "skipped"}
+    logger.info(f"Revenue rollups refreshed: {buckets} buckets recomputed")
+    return {"status": "success", "buckets": buckets}
+
+
+@shared_task
+def process_payment_webhooks(batch_size=None):
+    """
+    Drain the payment webhook inbox. Queued (debounced) by the webhook endpoint
+    and run every minute by beat as a safety net; concurrent runs share the
+    backlog through SKIP LOCKED.
+    """
+    from serviceApp.services.services import PaymentWebhookService
+    result = PaymentWebhookService.process_pending(batch_size=batch_size)
+    logger.info(f"Payment webhooks applied: {result}")
+    return {"status": "success", **result}
+
+
+@shared_task(queue='documents')
+def render_invoice_pdf_task(invoice_id, digest=None):
+    """
+    Render an invoice PDF into the content-addressed cache. Runs on the
+    'documents' queue so a burst of exports is bounded by that worker pool
+    and never ties up web workers. Unchanged invoices are not re-rendered.
+    """
+    from django.core.cache import cache
+    from serviceApp.services.invoice_pdf import (
+        invoice_document, content_digest, cached_pdf_path, render_invoice_pdf, store_pdf
+    )
+    current_digest = None
+    try:
+        invoice = Invoice.objects.select_related(
+            'user_subscription__user', 'user_subscription__product', 'user_subscription__plan'
+        ).get(id=invoice_id)
+        
+        document = invoice_document(invoice)
+        current_digest = content_digest(document)
+        path = cached_pdf_path(current_digest)
+        
+        if not os.path.exists(path):
+            path = store_pdf(current_digest, render_invoice_pdf(document))
+            logger.info(f"Rendered PDF for invoice {invoice_id}")
+        
+        return {"status": "success", "invoice_id": str(invoice_id), "digest": current_digest}
+    
+    except Invoice.DoesNotExist:
+        logger.error(f"Invoice {invoice_id} not found")
+        return {"status": "error", "message": "Invoice not found"}
+    finally:
+        cache.delete_many([f"invoice_pdf_lock_{key}" for key in {digest, current_digest} if key])
+
+
+@shared_task
+def flush_mail_queue():
+    """
+    Deliver queued emails in batches over this worker's persistent SMTP connection
+    """
+    sent, failed = mailer.flush()
+    if sent or failed:
+        logger.info(f"Mail queue flush: {sent} sent, {failed} failed")
+    return {"status": "success", "sent": sent, "failed": failed}
+
+
+def render_notification_email(subject, template_name, context, recipient_list):
+    """
+    Build the message of a templated notification email. Invoices are passed
+    as 'invoice_ids' (for serialization safety) and re-fetched here.
+    """
+    context = dict(context)
+    if 'invoice_ids' in context:
+        invoice_ids = context.pop('invoice_ids')
+        invoices = Invoice.objects.filter(id__in=invoice_ids).select_related(
+            'user_subscription__user', 'user_subscription__product', 'user_subscription__plan'
+        )
+        context['invoices'] = invoices
+    
+    html_message = render_to_string(template_name, context)
+    plain_message = strip_tags(html_message)
+    return build_email(subject, plain_message, recipient_list, html_content=html_message)
+
+
 @shared_task(bind=True, max_retries=3)
 def send_email_notification_task(self, subject, template_name, context, recipient_list):
     """
@@ -352,25 +560,10 @@ def send_email_notification_task(self, subject, template_name, context, recipien
     Handles serialization of complex objects like Invoices.
     """
     try:
-        # Re-fetch invoices if IDs were provided (for serialization safety)
-        if 'invoice_ids' in context:
-            invoice_ids = context.pop('invoice_ids')
-            invoices = Invoice.objects.filter(id__in=invoice_ids)
-            context['invoices'] = invoices
-
-        html_message = render_to_string(template_name, context)
-        plain_message = strip_tags(html_message)
-        
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=recipient_list
-        )
-        email.attach_alternative(html_message, "text/html")
-        email.send()
+        # Batched lane: delivered by the next mail queue flush
+        mailer.enqueue(render_notification_email(subject, template_name, context, recipient_list))
         
-        logger.info(f"Successfully sent email: {subject} to {recipient_list}")
+        logger.info(f"Successfully queued email: {subject} to {recipient_list}")
         return {"status": "success", "subject": subject}
         
     except Exception as exc:
@@ -378,6 +571,29 @@ def send_email_notification_task(self, subject, template_name, context, recipien
         raise self.retry(exc=exc, countdown=60)
 
 
+@shared_task
+def relay_outbox(batch_size=None):
+    """
+    Dispatch committed outbox messages: tasks to the broker, emails straight
+    to the mail queue. Queued (debounced) after each commit that records
+    messages and run every minute by beat as a safety net; concurrent runs
+    share the backlog through SKIP LOCKED.
+    """
+    from serviceApp.services.services import OutboxService
+    result = OutboxService.relay(batch_size=batch_size)
+    if any(result.values()):
+        logger.info(f"Outbox relayed: {result}")
+    return {"status": "success", **result}
+
+
+@shared_task
+def purge_outbox():
+    """Delete outbox messages dispatched more than OUTBOX_RETENTION_DAYS ago"""
+    from serviceApp.services.services import OutboxService
+    deleted = OutboxService.purge()
+    return {"status": "success", "deleted": deleted}
+
+
 # celery.py (Add this to your project's celery configuration)
 """
 from celery import Celery
@@ -1,3 +1,318 @@
-from django.test import TestCase
+import json
+import time
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authApp.models import User
+from serviceApp.models import Product, SubscriptionPlan, UserSubscription, SubscriptionEvent, OutboxMessage, PaymentWebhookEvent
+from serviceApp.services import realtime
+from serviceApp.services.realtime import format_sse
+from serviceApp.services.gateway import sign_webhook
+from serviceApp.services.notification_preferences import CHANNELS, CATEGORIES, bit, optouts_from_preferences, channels_from_optouts
+from serviceApp.services.services import NotificationService, SubscriptionStateMachine, SubscriptionConflictError, SubscriptionService, PaymentWebhookService
+from serviceApp.views import _notification_events
 
-# Create your tests here.
+
+def parse_sse(frame):
+    """(event, id, data) of one Server-Sent Events frame"""
+    fields = dict(line.split(': ', 1) for line in frame.strip().split('\n'))
+    return fields.get('event'), fields.get('id'), json.loads(fields['data'])
+
+
+@override_settings(
+    REALTIME_CHANNEL_LAYER='memory',
+    NOTIFICATION_STREAM_HEARTBEAT=1,
+    NOTIFICATION_STREAM_MAX_SECONDS=10,
+)
+class NotificationStreamTests(TestCase):
+
+    def setUp(self):
+        # A fresh in-memory layer per test, selected by the override above
+        realtime._layer = None
+        self.addCleanup(setattr, realtime, '_layer', None)
+        self.alice = User.objects.create(username='alice', email='alice@example.com')
+        self.bob = User.objects.create(username='bob', email='bob@example.com')
+
+    def notify(self, user, title):
+        # Published on commit, like in a request
+        with self.captureOnCommitCallbacks(execute=True):
+            return NotificationService.create_notification(user, title, 'Body')
+
+    async def next_frame(self, events):
+        while True:
+            frame = await asyncio.wait_for(events.__anext__(), timeout=5)
+            if not frame.startswith(':'):  # skip keep-alives
+                return frame
+
+    def test_format_sse(self):
+        self.assertEqual(
+            format_sse('notification', {'title': 'Hi'}, event_id='c1'),
+            'event: notification\nid: c1\ndata: {"title": "Hi"}\n\n'
+        )
+        self.assertEqual(format_sse('unread_count', {'unread_count': 2}), 'event: unread_count\ndata: {"unread_count": 2}\n\n')
+
+    async def test_stream_relays_only_the_users_notifications(self):
+        events = _notification_events(self.alice, language='en')
+        try:
+            self.assertEqual(await self.next_frame(events), 'retry: 1000\n\n')
+            self.assertEqual(parse_sse(await self.next_frame(events)), ('unread_count', None, {'unread_count': 0}))
+
+            await sync_to_async(self.notify)(self.bob, 'For Bob')
+            notification = await sync_to_async(self.notify)(self.alice, 'For Alice')
+
+            event, event_id, data = parse_sse(await self.next_frame(events))
+            self.assertEqual(event, 'notification')
+            self.assertEqual(data['id'], str(notification.id))
+            self.assertEqual(data['title'], 'For Alice')
+            self.assertEqual(event_id, NotificationService.encode_cursor(notification))
+            self.assertEqual(event_id, data['cursor'])
+        finally:
+            await events.aclose()
+
+    async def test_stream_replays_missed_notifications(self):
+        seen = await sync_to_async(self.notify)(self.alice, 'Seen')
+        missed = await sync_to_async(self.notify)(self.alice, 'Missed')
+
+        events = _notification_events(self.alice, last_event_id=NotificationService.encode_cursor(seen), language='en')
+        try:
+            await self.next_frame(events)  # retry
+            event, event_id, data = parse_sse(await self.next_frame(events))
+            self.assertEqual((event, data['title']), ('notification', 'Missed'))
+            self.assertEqual(event_id, NotificationService.encode_cursor(missed))
+            self.assertEqual(parse_sse(await self.next_frame(events))[0], 'unread_count')
+        finally:
+            await events.aclose()
+
+
+class SubscriptionStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='CRM', base_price=Decimal('10'), trial_duration=7)
+        self.plan = SubscriptionPlan.objects.create(
+            product=self.product, name='Monthly', plan_type='monthly', duration_days=30, price=Decimal('10')
+        )
+
+    def subscribe(self, status, **fields):
+        # One live subscription per user and product, so a new user each time
+        n = User.objects.count()
+        user = User.objects.create(username=f'user{n}', email=f'user{n}@example.com')
+        return UserSubscription.objects.create(
+            user=user, product=self.product, plan=self.plan, status=status,
+            end_date=timezone.now().date() + timedelta(days=30), **fields
+        )
+
+    def test_transition_bumps_version_and_records_event(self):
+        subscription = self.subscribe('trial')
+        SubscriptionStateMachine.transition(subscription, 'upgrade')
+
+        self.assertEqual((subscription.status, subscription.version), ('active', 1))
+        subscription.refresh_from_db()
+        self.assertEqual((subscription.status, subscription.version), ('active', 1))
+        event = SubscriptionEvent.objects.get(subscription_id=subscription.id)
+        self.assertEqual(
+            (event.event_type, event.from_status, event.to_status),
+            (SubscriptionEvent.UPGRADED, 'trial', 'active')
+        )
+
+    def test_transition_writes_extra_columns(self):
+        subscription = self.subscribe('active')
+        end_date = timezone.now().date() + timedelta(days=60)
+        SubscriptionStateMachine.transition(subscription, 'renew', end_date=end_date)
+
+        subscription.refresh_from_db()
+        self.assertEqual((subscription.status, subscription.end_date), ('active', end_date))
+
+    def test_disallowed_transitions_are_rejected(self):
+        for status, action in [('active', 'upgrade'), ('cancelled', 'renew'), ('expired', 'cancel'), ('cancelled', 'expire')]:
+            with self.subTest(status=status, action=action):
+                subscription = self.subscribe(status)
+                self.assertFalse(SubscriptionStateMachine.can_transition(subscription, action))
+                with self.assertRaises(ValueError):
+                    SubscriptionStateMachine.transition(subscription, action)
+                subscription.refresh_from_db()
+                self.assertEqual((subscription.status, subscription.version), (status, 0))
+        self.assertFalse(SubscriptionEvent.objects.exists())
+
+    def test_stale_version_conflicts(self):
+        subscription = self.subscribe('active')
+        stale = UserSubscription.objects.get(id=subscription.id)
+        SubscriptionStateMachine.transition(subscription, 'cancel')
+
+        with self.assertRaises(SubscriptionConflictError):
+            SubscriptionStateMachine.transition(stale, 'expire')
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.version), ('cancelled', 1))
+        self.assertEqual(SubscriptionEvent.objects.filter(subscription_id=subscription.id).count(), 1)
+
+    def test_expiry_sweep_expires_lapsed_subscriptions(self):
+        lapsed = self.subscribe('trial')
+        current = self.subscribe('active')
+        UserSubscription.objects.filter(id=lapsed.id).update(end_date=timezone.now().date() - timedelta(days=1))
+
+        SubscriptionService.check_and_expire_subscriptions()
+
+        lapsed.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual((lapsed.status, current.status), ('expired', 'active'))
+
+
+class IdempotentPurchaseTests(TestCase):
+    url = '/api/v1/services/subscriptions/purchase/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='dave', email='dave@example.com')
+        self.product = Product.objects.create(name='CRM', base_price=Decimal('10'), trial_duration=7)
+        self.plan = SubscriptionPlan.objects.create(
+            product=self.product, name='Monthly', plan_type='monthly', duration_days=30, price=Decimal('10')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def purchase(self, key, **extra):
+        payload = {'product_id': str(self.product.id), 'plan_id': str(self.plan.id), **extra}
+        return self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.purchase('key-1')
+        retry = self.purchase('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (first.status_code, first.json()))
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+        self.assertIsNone(first.headers.get('Idempotent-Replayed'))
+        self.assertEqual(UserSubscription.objects.filter(user=self.user).count(), 1)
+        # One confirmation email queued, not one per retry
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_key_reused_with_another_payload_is_rejected(self):
+        self.purchase('key-1')
+        response = self.purchase('key-1', auto_renew=True)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(UserSubscription.objects.get(user=self.user).auto_renew)
+
+    def test_duplicate_in_flight_gets_conflict(self):
+        with mock.patch('multiproduct.idempotency.cache.add', return_value=False):
+            response = self.purchase('key-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers.get('Retry-After'), '1')
+        self.assertFalse(UserSubscription.objects.exists())
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='whsec', PAYMENT_WEBHOOK_TOLERANCE=300)
+@mock.patch('serviceApp.tasks.tasks.process_payment_webhooks.apply_async')
+class PaymentWebhookTests(TestCase):
+    url = '/api/v1/services/webhooks/payments/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def deliver(self, event, secret='whsec', timestamp=None, body=None):
+        signed = json.dumps(event).encode()
+        return self.client.post(
+            self.url, data=signed if body is None else body, content_type='application/json',
+            HTTP_X_GATEWAY_SIGNATURE=sign_webhook(signed, secret, timestamp)
+        )
+
+    def test_signed_event_is_stored_and_scheduled(self, schedule):
+        response = self.deliver({'id': 'evt_1', 'type': 'charge.succeeded', 'data': {}})
+
+        self.assertEqual((response.status_code, response.json()['message']), (200, 'Event received'))
+        event = PaymentWebhookEvent.objects.get(event_id='evt_1')
+        self.assertEqual((event.event_type, event.status), ('charge.succeeded', PaymentWebhookEvent.PENDING))
+        schedule.assert_called_once()
+
+    def test_invalid_signatures_are_rejected(self, schedule):
+        event = {'id': 'evt_1', 'type': 'charge.succeeded', 'data': {}}
+        cases = {
+            'wrong secret': {'secret': 'other'},
+            'stale timestamp': {'timestamp': time.time() - 1000},
+            'tampered body': {'body': json.dumps({**event, 'type': 'charge.refunded'}).encode()},
+        }
+        for case, kwargs in cases.items():
+            with self.subTest(case):
+                response = self.deliver(event, **kwargs)
+                self.assertEqual((response.status_code, response.json()['error']), (400, 'Invalid signature'))
+
+        response = self.client.post(self.url, data=json.dumps(event), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+        schedule.assert_not_called()
+
+    def test_redelivery_is_acknowledged_and_dropped(self, schedule):
+        self.deliver({'id': 'evt_1', 'type': 'charge.succeeded', 'data': {'charge_id': 'ch_1'}})
+        response = self.deliver({'id': 'evt_1', 'type': 'charge.refunded', 'data': {}})
+
+        self.assertEqual((response.status_code, response.json()['message']), (200, 'Duplicate event'))
+        self.assertEqual(PaymentWebhookEvent.objects.get().event_type, 'charge.succeeded')
+        self.assertFalse(PaymentWebhookService.ingest({'id': 'evt_1', 'type': 'charge.succeeded', 'data': {}}))
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+
+    def test_pending_events_are_processed_once(self, schedule):
+        product = Product.objects.create(name='CRM', base_price=Decimal('10'), trial_duration=7)
+        plan = SubscriptionPlan.objects.create(
+            product=product, name='Monthly', plan_type='monthly', duration_days=30, price=Decimal('10')
+        )
+        user = User.objects.create(username='erin', email='erin@example.com')
+        subscription = UserSubscription.objects.create(
+            user=user, product=product, plan=plan, status='active', end_date=timezone.now().date() + timedelta(days=30)
+        )
+        self.deliver({'id': 'evt_1', 'type': 'subscription.cancelled', 'data': {'subscription_id': str(subscription.id)}})
+        self.deliver({'id': 'evt_2', 'type': 'unknown.type', 'data': {}})
+
+        self.assertEqual(PaymentWebhookService.process_pending(), {'processed': 1, 'ignored': 1, 'failed': 0})
+        self.assertEqual(PaymentWebhookService.process_pending(), {'processed': 0, 'ignored': 0, 'failed': 0})
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'cancelled')
+        self.assertEqual(
+            dict(PaymentWebhookEvent.objects.values_list('event_id', 'status')),
+            {'evt_1': PaymentWebhookEvent.PROCESSED, 'evt_2': PaymentWebhookEvent.IGNORED}
+        )
+
+
+class NotificationPreferenceBitsTests(SimpleTestCase):
+
+    def test_every_pair_has_its_own_bit(self):
+        bits = [bit(channel, category) for channel in CHANNELS for category in CATEGORIES]
+        self.assertEqual(bits, [1 << n for n in range(len(CHANNELS) * len(CATEGORIES))])
+
+    def test_unknown_channel_or_category_raises(self):
+        with self.assertRaises(ValueError):
+            bit('sms', 'expiry')
+        with self.assertRaises(ValueError):
+            bit('email', 'marketing')
+
+    def test_only_explicit_false_opts_out(self):
+        preferences = {'channels': {
+            'email': {'expiry': False, 'announcement': True, 'subscription': None},
+            'in_app': {'announcement': False},
+            'sms': {'expiry': False},
+        }}
+        self.assertEqual(
+            optouts_from_preferences(preferences),
+            bit('email', 'expiry') | bit('in_app', 'announcement')
+        )
+
+    def test_malformed_preferences_mean_everything_enabled(self):
+        for preferences in (None, [], {}, {'channels': None}, {'channels': {'email': 'off'}}):
+            with self.subTest(preferences=preferences):
+                self.assertEqual(optouts_from_preferences(preferences), 0)
+
+    def test_channels_round_trip_through_the_mask(self):
+        mask = bit('email', 'expiry') | bit('in_app', 'subscription')
+        channels = channels_from_optouts(mask)
+
+        self.assertFalse(channels['email']['expiry'])
+        self.assertFalse(channels['in_app']['subscription'])
+        self.assertTrue(channels['email']['subscription'])
+        self.assertEqual(optouts_from_preferences({'channels': channels}), mask)
+        self.assertTrue(all(all(c.values()) for c in channels_from_optouts(0).values()))
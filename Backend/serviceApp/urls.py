@@ -11,12 +11,27 @@ urlpatterns = [
     path('subscriptions/purchase/', PurchaseSubscriptionAPIView.as_view(), name='purchase-subscription'),
     path('subscriptions/<uuid:subscription_id>/cancel/', CancelSubscriptionAPIView.as_view(), name='cancel-subscription'),
     path('subscriptions/<uuid:subscription_id>/renew/', RenewSubscriptionAPIView.as_view(), name='renew-subscription'),
+    path('subscriptions/bulk/', SubscriptionBulkJobAPIView.as_view(), name='subscription-bulk-jobs'),
+    path('subscriptions/bulk/<uuid:job_id>/', SubscriptionBulkJobDetailAPIView.as_view(), name='subscription-bulk-job-detail'),
 
     path('invoice/create/', CreateInvoiceAPIView.as_view(), name='create-invoice'),
     path('payment/process/', ProcessPaymentAPIView.as_view(), name='process-payment'),
     path('invoices/', GetInvoicesAPIView.as_view(), name='get-invoices'),
+    path('invoices/export/', InvoiceExportAPIView.as_view(), name='invoice-export'),
+    path('transactions/export/', TransactionExportAPIView.as_view(), name='transaction-export'),
+    path('revenue/summary/', RevenueSummaryAPIView.as_view(), name='revenue-summary'),
+    path('reconciliation/runs/', ReconciliationRunAPIView.as_view(), name='reconciliation-runs'),
+    path('reconciliation/runs/<uuid:run_id>/', ReconciliationRunDetailAPIView.as_view(), name='reconciliation-run-detail'),
+    path('webhooks/payments/', PaymentWebhookAPIView.as_view(), name='payment-webhook'),
+    path('invoices/<uuid:invoice_id>/pdf/', InvoicePDFAPIView.as_view(), name='invoice-pdf'),
+    path('invoices/number/<str:invoice_number>/', InvoiceByNumberAPIView.as_view(), name='invoice-by-number'),
     path('notifications/', GetNotificationsAPIView.as_view(), name='get-notifications'),
-    path('notifications/<int:notification_id>/read/', MarkNotificationAsReadAPIView.as_view(), name='mark-notification-read'),
+    path('notifications/read/', MarkNotificationsReadAPIView.as_view(), name='mark-notifications-read'),
+    path('notifications/preferences/', NotificationPreferencesAPIView.as_view(), name='notification-preferences'),
+    path('notifications/stream/', NotificationStreamView.as_view(), name='notification-stream'),
+    path('notifications/broadcasts/', NotificationBroadcastAPIView.as_view(), name='notification-broadcasts'),
+    path('notifications/broadcasts/<uuid:broadcast_id>/', NotificationBroadcastDetailAPIView.as_view(), name='notification-broadcast-detail'),
+    path('notifications/<uuid:notification_id>/read/', MarkNotificationAsReadAPIView.as_view(), name='mark-notification-read'),
 ]
 
 
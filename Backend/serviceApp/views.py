@@ -1,15 +1,34 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, HttpResponseNotModified, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import status
+from django.db import transaction
 from django.db.models import Prefetch
+from django.core.cache import cache
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required,login_not_required
+from django.core.handlers.asgi import ASGIRequest
+from django.views import View
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+import json
+import uuid
+import asyncio
 import logging
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from serviceApp.services.services import SubscriptionService,InvoiceService,PaymentService,NotificationService
+from multiproduct.idempotency import idempotent
+from serviceApp.services.exports import (
+    stream_export, invoice_export_queryset, transaction_export_queryset, INVOICE_COLUMNS, TRANSACTION_COLUMNS
+)
+from serviceApp.permissions import CanViewInvoiceSummary, CanViewTransactionHistory, CanReconcilePayments, CanSendSystemNotification
+from serviceApp.services.services import SubscriptionService,InvoiceService,PaymentService,NotificationService,NotificationDigestService,SubscriptionConflictError,RevenueRollupService,PaymentWebhookService,ReconciliationService
+from serviceApp.services.gateway import verify_webhook_signature
+from serviceApp.services.realtime import get_channel_layer, notification_channel, format_sse
+from serviceApp.services.notification_preferences import channels_from_optouts
 
 
 from serviceApp.models import *
@@ -100,14 +119,21 @@ class UserSubscriptionListAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        subscriptions = UserSubscription.objects.filter(
-            user=request.user
-        ).select_related('product', 'plan').order_by('-created_at')
+        # L1: Redis Hit, invalidated on every state transition and bulk job chunk
+        cache_key = SubscriptionService.subscription_cache_key(request.user.id)
+        data = cache.get(cache_key)
+        
+        if data is None:
+            subscriptions = UserSubscription.objects.filter(
+                user=request.user
+            ).select_related('product', 'plan').order_by('-created_at')
+            
+            data = UserSubscriptionSerializer(subscriptions, many=True).data
+            cache.set(cache_key, data, timeout=300)
         
-        serializer = UserSubscriptionSerializer(subscriptions, many=True)
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': data
         }, status=status.HTTP_200_OK)
 
 
@@ -171,6 +197,7 @@ class PurchaseSubscriptionAPIView(APIView):
             'message': 'your purchase a subscription for product'
         }, status=status.HTTP_200_OK)
     
+    @idempotent
     def post(self, request):
         serializer = PurchaseSubscriptionSerializer(data=request.data)
         if not serializer.is_valid():
@@ -195,6 +222,12 @@ class PurchaseSubscriptionAPIView(APIView):
                 'message': 'Subscription purchased successfully',
                 'data': response_serializer.data
             }, status=status.HTTP_201_CREATED)
+
+        except SubscriptionConflictError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
             
         except ValueError as e:
             return Response({
@@ -230,6 +263,12 @@ class CancelSubscriptionAPIView(APIView):
                 'message': 'Subscription cancelled successfully',
                 'data': serializer.data
             }, status=status.HTTP_200_OK)
+
+        except SubscriptionConflictError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
             
         except ValueError as e:
             return Response({
@@ -244,6 +283,7 @@ class RenewSubscriptionAPIView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request, subscription_id):
         try:
             subscription = UserSubscription.objects.get(
@@ -265,6 +305,12 @@ class RenewSubscriptionAPIView(APIView):
                 'message': 'Subscription renewed successfully',
                 'data': serializer.data
             }, status=status.HTTP_200_OK)
+
+        except SubscriptionConflictError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
             
         except ValueError as e:
             return Response({
@@ -273,6 +319,64 @@ class RenewSubscriptionAPIView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class SubscriptionBulkJobAPIView(APIView):
+    """
+    Staff-only bulk operations over many subscriptions
+    (extend, cancel, change plan, toggle auto-renew).
+    Jobs run in the background; poll the detail endpoint for progress.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        jobs = SubscriptionBulkJob.objects.order_by('-created_at')[:50]
+        serializer = SubscriptionBulkJobSerializer(jobs, many=True)
+        return Response({
+            'success': True,
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+    
+    def post(self, request):
+        serializer = SubscriptionBulkJobSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        job = serializer.save(created_by=request.user)
+        
+        from serviceApp.tasks.tasks import run_subscription_bulk_job
+        transaction.on_commit(lambda: run_subscription_bulk_job.delay(str(job.id)))
+        
+        return Response({
+            'success': True,
+            'message': 'Bulk job queued',
+            'data': SubscriptionBulkJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class SubscriptionBulkJobDetailAPIView(APIView):
+    """
+    Status and progress of a bulk subscription job
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, job_id):
+        try:
+            job = SubscriptionBulkJob.objects.get(id=job_id)
+        except SubscriptionBulkJob.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Bulk job not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = SubscriptionBulkJobSerializer(job)
+        return Response({
+            'success': True,
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
 # #!TODO To put all api in one api
 
 # class SubscriptionAPIView(APIView):
@@ -434,6 +538,7 @@ class CreateInvoiceAPIView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
         subscription_id = request.data.get('subscription_id')
         amount = request.data.get('amount')
@@ -480,6 +585,7 @@ class ProcessPaymentAPIView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
         invoice_ids = request.data.get('invoice_ids', [])
         payment_method = request.data.get('payment_method', 'card')
@@ -491,26 +597,16 @@ class ProcessPaymentAPIView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            invoices = Invoice.objects.filter(
-                id__in=invoice_ids,
-                user_subscription__user=request.user,
-                is_paid=False
-            )
-            
-            if not invoices.exists():
-                return Response({
-                    'success': False,
-                    'error': 'No valid invoices found'
-                }, status=status.HTTP_404_NOT_FOUND)
-            
             # Process payment
             transaction = PaymentService.process_payment(
                 user=request.user,
-                invoices=list(invoices),
+                invoice_ids=invoice_ids,
                 payment_method=payment_method
             )
             
             if transaction:
+                transaction = PaymentService.get_transaction(transaction.id)
+                
                 # Send payment confirmation
                 NotificationService.send_payment_confirmation(request.user, transaction)
                 
@@ -526,6 +622,11 @@ class ProcessPaymentAPIView(APIView):
                     'error': 'Payment processing failed'
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
+        except Invoice.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'No valid invoices found'
+            }, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({
                 'success': False,
@@ -552,24 +653,319 @@ class GetInvoicesAPIView(APIView):
         }, status=status.HTTP_200_OK)
 
 
-class GetNotificationsAPIView(APIView):
+class InvoiceByNumberAPIView(APIView):
+    """
+    Look up an invoice by its number (support staff, or the invoice owner)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, invoice_number):
+        invoice = InvoiceService.get_invoice_by_number(invoice_number)
+        
+        if invoice is None or not (request.user.is_staff or invoice.user_subscription.user_id == request.user.id):
+            return Response({
+                'success': False,
+                'error': 'Invoice not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = InvoiceSerializer(invoice)
+        
+        return Response({
+            'success': True,
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
+class InvoicePDFAPIView(APIView):
     """
-    Get all notifications for authenticated user
+    Download an invoice as PDF. Rendering happens in the background: the first
+    request returns 202 and the file is served from cache once it is ready.
     """
     permission_classes = [IsAuthenticated]
     
+    def get(self, request, invoice_id):
+        invoice = Invoice.objects.select_related(
+            'user_subscription__user', 'user_subscription__product', 'user_subscription__plan'
+        ).filter(id=invoice_id).first()
+        
+        if invoice is None or not (
+            invoice.user_subscription.user_id == request.user.id
+            or request.user.has_perm('serviceApp.generate_invoice_pdf')
+        ):
+            return Response({
+                'success': False,
+                'error': 'Invoice not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        path, digest = InvoiceService.get_invoice_pdf(invoice)
+        etag = f'"{digest}"'
+        
+        if path is None:
+            return Response({
+                'success': True,
+                'message': 'Invoice PDF is being generated, retry shortly'
+            }, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+        
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return HttpResponseNotModified(headers={'ETag': etag})
+        
+        response = FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=f"{invoice.invoice_number or invoice.id}.pdf",
+            content_type='application/pdf'
+        )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        return response
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_response(queryset, columns, basename, options):
+    """Stream a queryset as a CSV / NDJSON attachment, gzip-compressed on request"""
+    file_format = options['file_format']
+    compression = options.get('compression')
+    
+    filename = f"{basename}-{timezone.now().strftime('%Y%m%d%H%M%S')}.{file_format}"
+    content_type = EXPORT_CONTENT_TYPES[file_format]
+    if compression == 'gzip':
+        filename += '.gz'
+        content_type = 'application/gzip'
+    
+    response = StreamingHttpResponse(
+        stream_export(
+            queryset,
+            columns,
+            file_format=file_format,
+            compression=compression,
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        ),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class InvoiceExportAPIView(APIView):
+    """
+    Staff export of invoices as streamed CSV / NDJSON
+    Filters: date_from, date_to (issued date), product_id, user_id, is_paid
+    """
+    permission_classes = [CanViewInvoiceSummary]
+    
     def get(self, request):
-        notifications = Notification.objects.filter(
-            receiver=request.user
-        ).order_by('-created_at')
+        serializer = ExportFilterSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = invoice_export_queryset(serializer.validated_data)
+        return export_response(queryset, INVOICE_COLUMNS, 'invoices', serializer.validated_data)
+
+
+class TransactionExportAPIView(APIView):
+    """
+    Staff export of transactions as streamed CSV / NDJSON
+    Filters: date_from, date_to (created date), product_id, user_id, status
+    """
+    permission_classes = [CanViewTransactionHistory]
+    
+    def get(self, request):
+        serializer = ExportFilterSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = transaction_export_queryset(serializer.validated_data)
+        return export_response(queryset, TRANSACTION_COLUMNS, 'transactions', serializer.validated_data)
+
+
+class RevenueSummaryAPIView(APIView):
+    """
+    Revenue dashboard: invoiced / paid / outstanding totals from the daily rollups
+    Filters: date_from, date_to, product_id, plan_id; group_by: day, month, product, plan
+    """
+    permission_classes = [CanViewInvoiceSummary]
+    
+    def get(self, request):
+        serializer = RevenueSummaryQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        filters = dict(serializer.validated_data)
+        group_by = filters.pop('group_by')
+        
+        return Response({
+            'success': True,
+            'data': RevenueRollupService.summary(filters, group_by=group_by)
+        }, status=status.HTTP_200_OK)
+
+
+class ReconciliationRunAPIView(APIView):
+    """
+    Payment reconciliation runs (reconcile_payments permission).
+    POST starts a run over the full ledger or a date range in the background;
+    a full-ledger run is also scheduled nightly.
+    """
+    permission_classes = [CanReconcilePayments]
+    
+    def get(self, request):
+        runs = ReconciliationRun.objects.order_by('-created_at')[:50]
+        serializer = ReconciliationRunSerializer(runs, many=True)
+        return Response({
+            'success': True,
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+    
+    def post(self, request):
+        serializer = ReconciliationRunSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        run = serializer.save(started_by=request.user)
+        
+        from serviceApp.tasks.tasks import run_reconciliation
+        transaction.on_commit(lambda: run_reconciliation.delay(str(run.id)))
         
-        unread_count = notifications.filter(is_read=False).count()
+        return Response({
+            'success': True,
+            'message': 'Reconciliation queued',
+            'data': ReconciliationRunSerializer(run).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class ReconciliationRunDetailAPIView(APIView):
+    """
+    Progress, per-kind summary and discrepancies of a reconciliation run
+    Query: kind (filter), after (cursor from next_after), limit (default 100, max 1000)
+    """
+    permission_classes = [CanReconcilePayments]
+    
+    def get(self, request, run_id):
+        try:
+            run = ReconciliationRun.objects.get(id=run_id)
+        except ReconciliationRun.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Reconciliation run not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 100)), 1000))
+            after = request.query_params.get('after')
+            after = uuid.UUID(after) if after else None
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'Invalid limit or after cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        discrepancies = run.discrepancies.select_related('transaction', 'invoice').order_by('id')
+        if request.query_params.get('kind'):
+            discrepancies = discrepancies.filter(kind=request.query_params['kind'])
+        if after:
+            discrepancies = discrepancies.filter(id__gt=after)
+        page = list(discrepancies[:limit])
         
+        return Response({
+            'success': True,
+            'data': {
+                'run': ReconciliationRunSerializer(run).data,
+                'summary': ReconciliationService.summary(run),
+                'discrepancies': PaymentDiscrepancySerializer(page, many=True).data,
+                'next_after': str(page[-1].id) if len(page) == limit else None
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class PaymentWebhookAPIView(APIView):
+    """
+    Payment gateway webhook receiver.
+    Verifies the HMAC signature over the raw body, appends the event to the
+    inbox in one statement and acknowledges; process_payment_webhooks applies
+    it. Redeliveries of an event id are acknowledged and dropped.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = []
+    
+    def post(self, request):
+        body = request.body
+        if not verify_webhook_signature(
+            body,
+            request.headers.get('X-Gateway-Signature'),
+            settings.PAYMENT_WEBHOOK_SECRET,
+            tolerance=settings.PAYMENT_WEBHOOK_TOLERANCE
+        ):
+            return Response({
+                'success': False,
+                'error': 'Invalid signature'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            event = json.loads(body)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+            return Response({
+                'success': False,
+                'error': 'Malformed event'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        inserted = PaymentWebhookService.ingest(event)
+        
+        return Response({
+            'success': True,
+            'message': 'Event received' if inserted else 'Duplicate event'
+        }, status=status.HTTP_200_OK)
+
+
+class GetNotificationsAPIView(APIView):
+    """
+    Notifications of the authenticated user, newest first
+    Query: cursor (next_cursor of the previous page), limit
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            limit = request.query_params.get('limit')
+            notifications, next_cursor = NotificationService.get_notifications_page(
+                request.user,
+                cursor=request.query_params.get('cursor'),
+                limit=max(1, int(limit)) if limit else None
+            )
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'Invalid cursor or limit'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        NotificationService.render(notifications, NotificationService.preferred_language(request.user, request))
         serializer = NotificationSerializer(notifications, many=True)
         
         return Response({
             'success': True,
-            'unread_count': unread_count,
+            'unread_count': NotificationService.get_unread_count(request.user.id),
+            'next_cursor': next_cursor,
+            # Cursor of the newest item shown; pass as "before" to mark everything seen read
+            'head_cursor': NotificationService.encode_cursor(notifications[0]) if notifications else None,
             'data': serializer.data
         }, status=status.HTTP_200_OK)
 
@@ -582,7 +978,7 @@ class MarkNotificationAsReadAPIView(APIView):
     
     def post(self, request, notification_id):
         try:
-            notification = Notification.objects.get(
+            notification = Notification.objects.select_related('receiver', 'sender').get(
                 id=notification_id,
                 receiver=request.user
             )
@@ -592,16 +988,241 @@ class MarkNotificationAsReadAPIView(APIView):
                 'error': 'Notification not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        notification.is_read = True
-        notification.save()
+        if not notification.is_read:
+            NotificationService.mark_as_read(request.user, notification.id)
+            notification.is_read = True
         
+        NotificationService.render([notification], NotificationService.preferred_language(request.user, request))
         serializer = NotificationSerializer(notification)
         return Response({
             'success': True,
             'message': 'Notification marked as read',
+            'unread_count': NotificationService.get_unread_count(request.user.id),
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
+class MarkNotificationsReadAPIView(APIView):
+    """
+    Bulk mark-read in one UPDATE
+    Body: {"ids": [...]} | {"before": "<cursor>"} (that notification and older) | {"all": true}
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        serializer = NotificationMarkReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            updated = NotificationService.mark_many_as_read(
+                request.user,
+                notification_ids=serializer.validated_data.get('ids'),
+                before=serializer.validated_data.get('before')
+            )
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'Invalid cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'message': f'{updated} notification(s) marked as read',
+            'updated': updated,
+            'unread_count': NotificationService.get_unread_count(request.user.id)
+        }, status=status.HTTP_200_OK)
+
+
+class NotificationPreferencesAPIView(APIView):
+    """
+    Notification preferences of the authenticated user.
+    email_digest: hold purchase, renewal and expiry emails and send them as one
+    digest per NOTIFICATION_DIGEST_WINDOW instead of one email each.
+    language: language notifications are shown and emailed in.
+    channels: {channel: {category: enabled}} for the in_app and email channels.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def preferences(self, request):
+        return {
+            'email_digest': NotificationDigestService.wants_digest(request.user),
+            'language': NotificationService.preferred_language(request.user, request),
+            'channels': channels_from_optouts(request.user.notification_optouts),
+        }
+    
+    def get(self, request):
+        return Response({
+            'success': True,
+            'data': self.preferences(request)
+        }, status=status.HTTP_200_OK)
+    
+    def patch(self, request):
+        serializer = NotificationPreferencesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        NotificationService.update_preferences(request.user, **serializer.validated_data)
+        return Response({
+            'success': True,
+            'message': 'Notification preferences updated',
+            'data': self.preferences(request)
+        }, status=status.HTTP_200_OK)
+
+
+class NotificationBroadcastAPIView(APIView):
+    """
+    System notifications to all active users or a segment
+    (role_id, product_id, subscription_status).
+    Delivery runs in the background; poll the detail endpoint for progress.
+    """
+    permission_classes = [CanSendSystemNotification]
+    
+    def get(self, request):
+        broadcasts = NotificationBroadcast.objects.order_by('-created_at')[:50]
+        serializer = NotificationBroadcastSerializer(broadcasts, many=True)
+        return Response({
+            'success': True,
             'data': serializer.data
         }, status=status.HTTP_200_OK)
+    
+    def post(self, request):
+        serializer = NotificationBroadcastSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        broadcast = serializer.save(created_by=request.user)
+        
+        from serviceApp.tasks.tasks import run_notification_broadcast
+        transaction.on_commit(lambda: run_notification_broadcast.delay(str(broadcast.id)))
+        
+        return Response({
+            'success': True,
+            'message': 'Broadcast queued',
+            'data': NotificationBroadcastSerializer(broadcast).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class NotificationBroadcastDetailAPIView(APIView):
+    """
+    Status and progress of a notification broadcast
+    """
+    permission_classes = [CanSendSystemNotification]
+    
+    def get(self, request, broadcast_id):
+        try:
+            broadcast = NotificationBroadcast.objects.get(id=broadcast_id)
+        except NotificationBroadcast.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Broadcast not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = NotificationBroadcastSerializer(broadcast)
+        return Response({
+            'success': True,
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
+class NotificationStreamView(View):
+    """
+    Server-Sent Events stream of the authenticated user's notifications.
+    Needs the ASGI server (uvicorn): each open stream is a coroutine, not a thread.
+    
+    Auth: Authorization: Bearer <access token>, or ?token=<access token> since
+    EventSource cannot set headers. A reconnecting EventSource sends
+    Last-Event-ID and is replayed the notifications it missed.
+    
+    Events: unread_count (on connect), notification, read
+    """
+    
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({
+                'success': False,
+                'error': 'Notification stream is only served by the ASGI server'
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        
+        user = await _stream_user(request)
+        if user is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Authentication credentials were not provided or are invalid'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        response = StreamingHttpResponse(
+            _notification_events(
+                user,
+                request.headers.get('Last-Event-ID'),
+                NotificationService.preferred_language(user, request)
+            ),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: flush every event
+        return response
+
 
+async def _stream_user(request):
+    jwt_auth = JWTAuthentication()
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = jwt_auth.get_header(request)
+        raw_token = jwt_auth.get_raw_token(header) if header else None
+    
+    if raw_token:
+        try:
+            validated_token = jwt_auth.get_validated_token(raw_token)
+            return await sync_to_async(jwt_auth.get_user)(validated_token)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def _notification_events(user, last_event_id=None, language=None):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.NOTIFICATION_STREAM_MAX_SECONDS
+    
+    try:
+        # Subscribe before reading state, so nothing created meanwhile is lost
+        async with get_channel_layer().subscribe(notification_channel(user.id)) as subscription:
+            yield f"retry: {settings.NOTIFICATION_STREAM_HEARTBEAT * 1000}\n\n"
+            
+            replayed = set()
+            if last_event_id:
+                try:
+                    missed = await sync_to_async(NotificationService.get_notifications_since)(user, last_event_id)
+                except ValueError:
+                    missed = []
+                for notification in missed:
+                    message = NotificationService.stream_message(notification, language or settings.LANGUAGE_CODE)
+                    replayed.add(message['id'])
+                    yield format_sse('notification', message, event_id=message['cursor'])
+            
+            unread_count = await sync_to_async(NotificationService.get_unread_count)(user.id)
+            yield format_sse('unread_count', {'unread_count': unread_count})
+            
+            while loop.time() < deadline:
+                message = await subscription.get(timeout=settings.NOTIFICATION_STREAM_HEARTBEAT)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                elif message.get('id') not in replayed:
+                    yield format_sse(message.get('type', 'notification'), message, event_id=message.get('cursor'))
+    except Exception as e:
+        # The client reconnects after "retry" and catches up through Last-Event-ID
+        logger.warning(f"Notification stream for user {user.id} closed: {e}")
 
 # tasks.py (For Celery - Send expiry reminders periodically)
 